@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Benchmark of the receiver tip list built with a single joined query and the
+# denormalized counters against the previous implementation performing lazy
+# loads and counts per tip; the database used is the populated one of the
+# unit tests with its tips cloned up to the requested number.
+#
+# usage: python benchmarks/bench_receivertip_list.py [tips] [iterations]
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from storm import tracer
+from storm.database import create_database
+from storm.store import Store
+
+from globaleaks import DATABASE_VERSION
+from globaleaks.handlers.receiver import get_receivertip_list
+from globaleaks.handlers.submission import db_get_archived_preview_schema
+from globaleaks.models import ReceiverTip
+from globaleaks.settings import GLSettings
+from globaleaks.utils.structures import Rosetta
+from globaleaks.utils.utility import datetime_to_ISO8601
+
+
+def legacy_get_receivertip_list(store, receiver_id, language):
+    rtip_summary_list = []
+
+    for rtip in store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id):
+        mo = Rosetta(rtip.internaltip.context.localized_keys)
+        mo.acquire_storm_object(rtip.internaltip.context)
+
+        rtip_summary_list.append({
+            'id': rtip.id,
+            'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+            'last_access': datetime_to_ISO8601(rtip.last_access),
+            'update_date': datetime_to_ISO8601(rtip.internaltip.update_date),
+            'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
+            'timetolive': rtip.internaltip.context.tip_timetolive,
+            'progressive': rtip.internaltip.progressive,
+            'new': rtip.access_counter == 0 or rtip.last_access < rtip.internaltip.update_date,
+            'context_name': mo.dump_localized_key('name', language),
+            'access_counter': rtip.access_counter,
+            'file_counter': rtip.internaltip.internalfiles.count(),
+            'comment_counter': rtip.internaltip.comments.count(),
+            'message_counter': rtip.messages.count(),
+            'tor2web': rtip.internaltip.tor2web,
+            'questionnaire_hash': rtip.internaltip.questionnaire_hash,
+            'preview_schema': db_get_archived_preview_schema(store, rtip.internaltip.questionnaire_hash, language),
+            'preview': rtip.internaltip.preview,
+            'total_score': rtip.internaltip.total_score,
+            'label': rtip.label
+        })
+
+    return rtip_summary_list
+
+
+def joined_get_receivertip_list(store, receiver_id, language):
+    return get_receivertip_list.method(store, receiver_id, language)[0]
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        self.count += 1
+
+
+def clone_tips(db_file, receiver_id, tips):
+    """
+    Clone the tips of the receiver with their files, comments and messages
+    suffixing the ids of the copies
+    """
+    conn = sqlite3.connect(db_file)
+
+    tables = [
+        ('internaltip', 'id IN (SELECT internaltip_id FROM receivertip WHERE receiver_id = ?)'),
+        ('receivertip', 'receiver_id = ?'),
+        ('internalfile', 'internaltip_id IN (SELECT internaltip_id FROM receivertip WHERE receiver_id = ?)'),
+        ('comment', 'internaltip_id IN (SELECT internaltip_id FROM receivertip WHERE receiver_id = ?)'),
+        ('message', 'receivertip_id IN (SELECT id FROM receivertip WHERE receiver_id = ?)')
+    ]
+
+    # the columns that must be unique or must refer to the cloned rows
+    keys = ['id', 'internaltip_id', 'receivertip_id', 'file_path']
+
+    queries = []
+    for table, condition in tables:
+        ids = [row[0] for row in conn.execute('SELECT id FROM %s WHERE %s' % (table, condition), (receiver_id,))]
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(%s)' % table)]
+        values = [c + ' || ?' if c in keys else c for c in columns]
+
+        query = 'INSERT INTO %s (%s) SELECT %s FROM %s WHERE id IN (%s)' % \
+                (table, ', '.join(columns), ', '.join(values), table, ', '.join('?' * len(ids)))
+
+        queries.append((query, len([c for c in columns if c in keys]), ids))
+
+    rtips = len(queries[1][2])
+
+    for i in range(1, tips // rtips):
+        suffix = u'-%d' % i
+        for query, suffixes, ids in queries:
+            if ids:
+                conn.execute(query, (suffix,) * suffixes + tuple(ids))
+
+    conn.commit()
+    conn.close()
+
+
+def main():
+    GLSettings.eval_paths()
+    GLSettings.memory_copy.default_language = u'en'
+
+    tips = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    db_name = 'glbackend-%d.db' % DATABASE_VERSION
+    tmpdir = tempfile.mkdtemp()
+    db_file = os.path.join(tmpdir, db_name)
+
+    try:
+        shutil.copy(os.path.join(os.path.dirname(__file__), '..', 'globaleaks', 'tests', 'db', 'populated', db_name), db_file)
+
+        conn = sqlite3.connect(db_file)
+        receiver_id = conn.execute('SELECT receiver_id FROM receivertip GROUP BY receiver_id '
+                                   'ORDER BY COUNT(*) DESC LIMIT 1').fetchone()[0]
+        conn.close()
+
+        clone_tips(db_file, receiver_id, tips)
+
+        store = Store(create_database('sqlite:' + db_file))
+
+        legacy_list = legacy_get_receivertip_list(store, receiver_id, 'en')
+        joined_list = joined_get_receivertip_list(store, receiver_id, 'en')
+        assert sorted(legacy_list, key=lambda x: x['id']) == sorted(joined_list, key=lambda x: x['id'])
+
+        results = []
+        for function in [legacy_get_receivertip_list, joined_get_receivertip_list]:
+            def run():
+                # the store cache is emptied as at the start of each transaction
+                store.reset()
+                function(store, receiver_id, 'en')
+
+            counter = QueryCounter()
+            tracer.install_tracer(counter)
+            run()
+            tracer.remove_tracer_type(QueryCounter)
+
+            elapsed = min(timeit.repeat(run, number=iterations, repeat=3))
+
+            results.append((counter.count, elapsed / iterations))
+
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('tips:    %d' % len(joined_list))
+    print('legacy:  %8.2f ms/list, %6d queries' % (results[0][1] * 1e3, results[0][0]))
+    print('joined:  %8.2f ms/list, %6d queries' % (results[1][1] * 1e3, results[1][0]))
+    print('speedup: %8.2fx' % (results[0][1] / results[1][1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Benchmark of the compiled templating against the previous implementation
+# based on repeated string replacements; the templates used are the default
+# ones shipped with the appdata in all the available languages.
+#
+# usage: python benchmarks/bench_templating.py [iterations]
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks.db.appdata import load_appdata
+from globaleaks.settings import GLSettings
+from globaleaks.utils.templating import Templating, supported_template_types, template_cache
+
+
+def legacy_format_template(raw_template, data):
+    keyword_converter = supported_template_types[data['type']](data)
+    iterations = 3
+    stop = False
+    while stop is False and iterations > 0:
+        iterations -= 1
+        count = 0
+
+        for kw in keyword_converter.keyword_list:
+            if raw_template.count(kw):
+                variable_content = getattr(keyword_converter, kw[1:-1])()
+                raw_template = raw_template.replace(kw, variable_content)
+
+                count += 1
+
+        raw_template = raw_template.replace('\n%Blank%\n', '\n')
+        raw_template = raw_template.replace('\n%Blank%\n', '')
+
+        if count == 0:
+            stop = True
+            break
+
+    return raw_template
+
+
+def get_data(templates, language):
+    message = {
+        'type': u'whistleblower',
+        'author': u'Whistleblower',
+        'content': u'Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n' * 5,
+        'creation_date': u'2016-06-01T10:00:00Z'
+    }
+
+    return {
+        'node': {
+            'name': u'GlobaLeaks',
+            'hidden_service': u'http://gl.onion',
+            'public_site': u'https://gl.example.org',
+            'widget_comments_title': u'Comments',
+            'widget_messages_title': u'Messages'
+        },
+        'notification': dict((key, value.get(language, u'')) for key, value in templates.iteritems()),
+        'context': {'name': u'Context'},
+        'receiver': {'name': u'Receiver'},
+        'tip': {
+            'id': u'c5d3a2e4-5c8b-4b4e-9f0a-2ab3c7d8e9f0',
+            'sequence_number': u'20160601-1',
+            'label': u'Label',
+            'creation_date': u'2016-06-01T10:00:00Z',
+            'expiration_date': u'2016-09-01T10:00:00Z',
+            'questionnaire': [],
+            'answers': {}
+        },
+        'comments': [message] * 3,
+        'messages': [message] * 3,
+        'comment': message,
+        'message': message,
+        'file': {
+            'name': u'file.pdf',
+            'size': 123456,
+            'creation_date': u'2016-06-01T10:00:00Z'
+        }
+    }
+
+
+def get_samples():
+    templates = load_appdata()['templates']
+
+    samples = []
+    for template_type in [u'tip', u'comment', u'message', u'file', u'tip_expiration', u'export_template']:
+        key = template_type if template_type == u'export_template' else template_type + u'_mail_template'
+
+        for language in sorted(templates[key]):
+            data = get_data(templates, language)
+            data['type'] = template_type
+            samples.append((templates[key][language], data))
+
+    return samples
+
+
+def main():
+    GLSettings.eval_paths()
+    GLSettings.memory_copy.accept_tor2web_access['receiver'] = True
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    samples = []
+    for raw_template, data in get_samples():
+        try:
+            expected = legacy_format_template(raw_template, data)
+        except UnicodeError:
+            # the export of the messages fails with non ascii templates
+            continue
+
+        assert expected == Templating().format_template(raw_template, data)
+        samples.append((raw_template, data))
+
+    def run_legacy():
+        for raw_template, data in samples:
+            legacy_format_template(raw_template, data)
+
+    def run_compiled():
+        for raw_template, data in samples:
+            Templating().format_template(raw_template, data)
+
+    legacy = min(timeit.repeat(run_legacy, number=iterations, repeat=3))
+    compiled = min(timeit.repeat(run_compiled, number=iterations, repeat=3))
+
+    renders = len(samples) * iterations
+
+    print('templates: %d, renders: %d' % (len(samples), renders))
+    print('legacy:   %8.2f us/render' % (legacy / renders * 1e6))
+    print('compiled: %8.2f us/render' % (compiled / renders * 1e6))
+    print('speedup:  %8.2fx' % (legacy / compiled))
+    print('cache:    %s' % template_cache.get_stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+#
+# Benchmark of the request validators compiled from the message templates
+# against the previous implementation interpreting the templates on every
+# request; the messages used are a submission carrying a large set of answers
+# and a context update of the admin interface; the invalid messages are only
+# used to check that the two implementations raise the same errors.
+#
+# usage: python benchmarks/bench_validators.py [iterations]
+
+import collections
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from globaleaks.rest import errors, requests
+from globaleaks.rest.validators import get_validator
+from globaleaks.utils.utility import log
+
+
+def legacy_validate_python_type(value, python_type):
+    if value is None:
+        return True
+
+    if python_type == requests.SkipSpecificValidation:
+        return True
+
+    if python_type == int:
+        try:
+            int(value)
+            return True
+        except Exception:
+            return False
+
+    if python_type == bool:
+        if value == u'true' or value == u'false':
+            return True
+
+    return isinstance(value, python_type)
+
+
+def legacy_validate_regexp(value, type):
+    try:
+        value = unicode(value)
+    except Exception:
+        return False
+
+    return bool(re.match(type, value))
+
+
+def legacy_validate_type(value, type):
+    if callable(type):
+        retval = legacy_validate_python_type(value, type)
+        if not retval:
+            log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
+        return retval
+    elif isinstance(type, collections.Mapping):
+        retval = legacy_validate_jmessage(value, type)
+        if not retval:
+            log.err("-- Invalid JSON/dict [%s] expected %s" % (value, type))
+        return retval
+    elif isinstance(type, str):
+        retval = legacy_validate_regexp(value, type)
+        if not retval:
+            log.err("-- Failed Match in regexp [%s] against %s" % (value, type))
+        return retval
+    elif isinstance(type, collections.Iterable):
+        if len(value) == 0:
+            return True
+        else:
+            retval = all(legacy_validate_type(x, type[0]) for x in value)
+            if not retval:
+                log.err("-- List validation failed [%s] of %s" % (value, type))
+            return retval
+    else:
+        raise AssertionError
+
+
+def legacy_validate_jmessage(jmessage, message_template):
+    if isinstance(message_template, dict):
+        success_check = 0
+        keys_to_strip = []
+        for key, value in jmessage.iteritems():
+            if key not in message_template:
+                keys_to_strip.append(key)
+                continue
+
+            if not legacy_validate_type(value, message_template[key]):
+                log.err("Received key %s: type validation fail " % key)
+                raise errors.InvalidInputFormat("Key (%s) type validation failure" % key)
+            success_check += 1
+
+        for key in keys_to_strip:
+            del jmessage[key]
+
+        for key, value in message_template.iteritems():
+            if key not in jmessage.keys():
+                raise errors.InvalidInputFormat("Missing key %s" % key)
+
+            if not legacy_validate_type(jmessage[key], value):
+                log.err("Expected key: %s type validation failure" % key)
+                raise errors.InvalidInputFormat("Key (%s) double validation failure" % key)
+            success_check += 1
+
+        if success_check == len(message_template.keys()) * 2:
+            return True
+        else:
+            raise errors.InvalidInputFormat("Success counter double check failure")
+
+    elif isinstance(message_template, list):
+        ret = all(legacy_validate_type(x, message_template[0]) for x in jmessage)
+        if not ret:
+            raise errors.InvalidInputFormat("Not every element in %s is %s" %
+                                            (jmessage, message_template[0]))
+        return True
+
+    else:
+        raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+
+
+def compiled_validate_jmessage(jmessage, message_template):
+    return get_validator(message_template)(jmessage)
+
+
+uuid = u'2ac56d7e-6b4a-4e3b-a8c6-c3f1a0f6b1e2'
+
+samples = [
+    (requests.SubmissionDesc, {
+        'context_id': uuid,
+        'receivers': [uuid] * 10,
+        'identity_provided': False,
+        'answers': dict((u'field-%d' % i, [{u'value': u'answer %d' % i}]) for i in range(100)),
+        'total_score': 0,
+        'creation_date': u'1970-01-01T00:00:00Z'
+    }),
+    (requests.AdminContextDesc, {
+        'id': uuid,
+        'name': u'Context',
+        'description': u'Description',
+        'maximum_selectable_receivers': 0,
+        'tip_timetolive': 15,
+        'receivers': [uuid] * 10,
+        'show_context': True,
+        'select_all_receivers': u'true',
+        'show_recipients_details': False,
+        'allow_recipients_selection': False,
+        'show_small_receiver_cards': False,
+        'enable_comments': True,
+        'enable_messages': False,
+        'enable_two_way_comments': True,
+        'enable_two_way_messages': True,
+        'enable_attachments': True,
+        'enable_rc_to_wb_files': False,
+        'presentation_order': 0,
+        'recipients_clarification': u'',
+        'status_page_message': u'',
+        'show_receivers_in_alphabetical_order': False,
+        'questionnaire_id': u'default'
+    })
+]
+
+invalid_samples = [
+    (requests.AdminContextDesc, {'id': u'invalid'}),
+    (requests.SubmissionDesc, {'context_id': uuid}),
+    (requests.SubmissionDesc, {'context_id': uuid, 'receivers': [u'invalid']})
+]
+
+
+def run_validation(function, template, message):
+    # the messages are copied because the validation strips the unknown keys
+    message = dict(message)
+
+    try:
+        function(message, template)
+    except errors.InvalidInputFormat as e:
+        return e.arguments
+
+    return message
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    for template, message in samples + invalid_samples:
+        assert run_validation(legacy_validate_jmessage, template, message) == \
+               run_validation(compiled_validate_jmessage, template, message)
+
+    results = []
+    for function in [legacy_validate_jmessage, compiled_validate_jmessage]:
+        def run():
+            for template, message in samples:
+                run_validation(function, template, message)
+
+        results.append(min(timeit.repeat(run, number=iterations, repeat=3)) / (iterations * len(samples)))
+
+    print('legacy:   %8.2f us/validation' % (results[0] * 1e6))
+    print('compiled: %8.2f us/validation' % (results[1] * 1e6))
+    print('speedup:  %8.2fx' % (results[0] / results[1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: UTF-8
+from storm.expr import Count
+
+from globaleaks.db.migrations.update import MigrationBase
+from globaleaks.models import *
+
+
+class InternalTip_v_35(ModelWithID):
+    __storm_table__ = 'internaltip'
+    creation_date = DateTime(default_factory=datetime_now)
+    update_date = DateTime(default_factory=datetime_now)
+    context_id = Unicode()
+    questionnaire_hash = Unicode()
+    preview = JSON()
+    progressive = Int(default=0)
+    tor2web = Bool(default=False)
+    total_score = Int(default=0)
+    expiration_date = DateTime()
+    identity_provided = Bool(default=False)
+    identity_provided_date = DateTime(default_factory=datetime_null)
+    enable_two_way_comments = Bool(default=True)
+    enable_two_way_messages = Bool(default=True)
+    enable_attachments = Bool(default=True)
+    enable_whistleblower_identity = Bool(default=False)
+    wb_last_access = DateTime(default_factory=datetime_now)
+    wb_access_counter = Int(default=0)
+
+
+class ReceiverTip_v_35(ModelWithID):
+    __storm_table__ = 'receivertip'
+    internaltip_id = Unicode()
+    receiver_id = Unicode()
+    last_access = DateTime(default_factory=datetime_null)
+    access_counter = Int(default=0)
+    label = Unicode(default=u'')
+    can_access_whistleblower_identity = Bool(default=False)
+    new = Int(default=True)
+    enable_notifications = Bool(default=True)
+
+
+class MigrationScript(MigrationBase):
+    def count_by(self, model_name, key):
+        model = self.model_from[model_name]
+        column = getattr(model, key)
+        return dict(self.store_old.find((column, Count()), column != None).group_by(column))
+
+    def migrate_InternalTip(self):
+        file_counters = self.count_by('InternalFile', 'internaltip_id')
+        comment_counters = self.count_by('Comment', 'internaltip_id')
+
+        old_objs = self.store_old.find(self.model_from['InternalTip'])
+        for old_obj in old_objs:
+            new_obj = self.model_to['InternalTip']()
+            for _, v in new_obj._storm_columns.iteritems():
+                if v.name == 'file_counter':
+                    new_obj.file_counter = file_counters.get(old_obj.id, 0)
+                    continue
+
+                elif v.name == 'comment_counter':
+                    new_obj.comment_counter = comment_counters.get(old_obj.id, 0)
+                    continue
+
+                elif v.name == 'revision':
+                    continue
+
+                setattr(new_obj, v.name, getattr(old_obj, v.name))
+
+            self.store_new.add(new_obj)
+
+    def migrate_ReceiverTip(self):
+        message_counters = self.count_by('Message', 'receivertip_id')
+
+        old_objs = self.store_old.find(self.model_from['ReceiverTip'])
+        for old_obj in old_objs:
+            new_obj = self.model_to['ReceiverTip']()
+            for _, v in new_obj._storm_columns.iteritems():
+                if v.name == 'message_counter':
+                    new_obj.message_counter = message_counters.get(old_obj.id, 0)
+                    continue
+
+                elif v.name == 'update_date':
+                    new_obj.update_date = datetime_now()
+                    continue
+
+                elif v.name == 'revision':
+                    continue
+
+                setattr(new_obj, v.name, getattr(old_obj, v.name))
+
+            self.store_new.add(new_obj)
@@ -170,6 +170,9 @@ CREATE TABLE internaltip (
     identity_provided_date TEXT NOT NULL,
     wb_access_counter INTEGER NOT NULL,
     wb_last_access TEXT NOT NULL,
+    file_counter INTEGER NOT NULL,
+    comment_counter INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
     FOREIGN KEY (context_id) REFERENCES context(id) ON DELETE CASCADE,
     PRIMARY KEY (id)
 );
@@ -223,6 +226,9 @@ CREATE TABLE receivertip (
     internaltip_id TEXT NOT NULL,
     last_access TEXT,
     access_counter INTEGER NOT NULL,
+    update_date TEXT NOT NULL,
+    message_counter INTEGER NOT NULL,
+    revision INTEGER NOT NULL,
     receiver_id TEXT NOT NULL,
     label TEXT NOT NULL,
     can_access_whistleblower_identity INTEGER NOT NULL,
@@ -391,6 +397,15 @@ CREATE TABLE archivedschema (
     PRIMARY KEY (hash, type)
 );
 
+CREATE TABLE tombstone (
+    id TEXT NOT NULL,
+    creation_date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    owner_id TEXT NOT NULL,
+    PRIMARY KEY (id)
+);
+
 CREATE TABLE securefiledelete (
     id TEXT NOT NULL,
     filepath TEXT NOT NULL,
@@ -434,3 +449,12 @@ CREATE INDEX config_group_index ON config(var_group);
 CREATE INDEX config_item_index ON config(var_group, var_name);
 CREATE INDEX config_l10n_group_index ON config_l10n(var_group);
 CREATE INDEX config_l10n_item_index ON config_l10n(lang, var_group, var_name);
+CREATE INDEX receivertip__receiver_id_index ON receivertip(receiver_id, internaltip_id);
+CREATE INDEX receivertip__receiver_id_label_index ON receivertip(receiver_id, label);
+CREATE INDEX receivertip__internaltip_id_index ON receivertip(internaltip_id);
+CREATE INDEX internaltip__context_id_index ON internaltip(context_id);
+CREATE INDEX internaltip__creation_date_index ON internaltip(creation_date);
+CREATE INDEX internaltip__update_date_index ON internaltip(update_date);
+CREATE INDEX internaltip__expiration_date_index ON internaltip(expiration_date);
+CREATE INDEX internaltip__total_score_index ON internaltip(total_score);
+CREATE INDEX tombstone__owner_id_index ON tombstone(owner_id, creation_date);
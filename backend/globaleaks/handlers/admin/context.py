@@ -11,7 +11,7 @@ from globaleaks.orm import transact
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.admin.questionnaire import db_get_default_questionnaire_id
-from globaleaks.handlers.public import serialize_step
+from globaleaks.handlers.public import serialize_step, QuestionnaireLoader
 from globaleaks.rest import errors, requests
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
@@ -101,7 +101,9 @@ def db_get_context_steps(store, context_id, language):
         log.err("Requested invalid context")
         raise errors.ContextIdNotFound
 
-    return [serialize_step(store, s, language) for s in context.questionnaire.steps]
+    loader = QuestionnaireLoader(store)
+
+    return [serialize_step(store, s, language, loader) for s in loader.steps[context.questionnaire_id]]
 
 
 @transact
@@ -133,6 +135,10 @@ def db_update_context(store, context, request, language):
 
     db_associate_context_receivers(store, context, request['receivers'])
 
+    # the settings of the context are part of the views of its tips
+    store.find(models.InternalTip,
+               models.InternalTip.context_id == context.id).set(revision=models.InternalTip.revision + 1)
+
     return context
 
 
@@ -265,7 +271,7 @@ class ContextsCollection(BaseHandler):
 
         response = yield create_context(request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('contexts')
 
         self.set_status(201) # Created
         self.write(response)
@@ -305,7 +311,7 @@ class ContextInstance(BaseHandler):
                                         requests.AdminContextDesc)
 
         response = yield update_context(context_id, request, self.request.language)
-        GLApiCache.invalidate()
+        GLApiCache.update('contexts')
 
         self.set_status(202) # Updated
         self.write(response)
@@ -322,4 +328,4 @@ class ContextInstance(BaseHandler):
         Errors: InvalidInputFormat, ContextIdNotFound
         """
         yield delete_context(context_id)
-        GLApiCache.invalidate()
+        GLApiCache.update('contexts')
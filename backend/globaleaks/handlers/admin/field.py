@@ -13,7 +13,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.orm import transact
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_field
+from globaleaks.handlers.public import serialize_field, QuestionnaireLoader
 from globaleaks.rest import errors, requests
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.utils.structures import fill_localized_keys
@@ -309,14 +309,19 @@ def get_fieldtemplate_list(store, language, request_type=None):
     """
     language = language if request_type != 'export' else None
 
+    loader = QuestionnaireLoader(store)
+
     ret = []
     for f in store.find(models.Field, And(models.Field.instance == u'template',
                                           models.Field.fieldgroup_id == None)):
-        ret.append(serialize_field(store, f, language))
+        ret.append(serialize_field(store, f, language, loader))
 
     return ret
 
 
+GLApiCache.register('fieldtemplates', get_fieldtemplate_list, ['fields'])
+
+
 class FieldTemplatesCollection(BaseHandler):
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
@@ -328,10 +333,13 @@ class FieldTemplatesCollection(BaseHandler):
         :return: the list of field templates registered on the node.
         :rtype: list
         """
-        response = yield GLApiCache.get('fieldtemplates', self.request.language,
+        # the export is not localized and thus cached separately
+        language = self.request.language if self.request.request_type != 'export' else None
+
+        response = yield GLApiCache.get('fieldtemplates', language,
                                         get_fieldtemplate_list, self.request.language, self.request.request_type)
 
-        self.write(response)
+        self.write_cached(response)
 
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
@@ -389,7 +397,7 @@ class FieldTemplateInstance(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('fields')
 
         self.set_status(202) # Updated
         self.write(response)
@@ -406,7 +414,7 @@ class FieldTemplateInstance(BaseHandler):
         """
         yield delete_field(field_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('fields')
 
 
 class FieldCollection(BaseHandler):
@@ -433,7 +441,7 @@ class FieldCollection(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('fields')
 
         self.set_status(201)
         self.write(response)
@@ -462,8 +470,6 @@ class FieldInstance(BaseHandler):
                                    self.request.language,
                                    self.request.request_type)
 
-        GLApiCache.invalidate()
-
         self.write(response)
 
     @BaseHandler.transport_security_check('admin')
@@ -487,7 +493,7 @@ class FieldInstance(BaseHandler):
                                       self.request.language,
                                       self.request.request_type)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('fields')
 
         self.set_status(202) # Updated
         self.write(response)
@@ -505,4 +511,4 @@ class FieldInstance(BaseHandler):
         """
         yield delete_field(field_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('fields')
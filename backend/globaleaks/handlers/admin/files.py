@@ -71,7 +71,7 @@ class FileInstance(BaseHandler):
         finally:
             uploaded_file['body'].close()
 
-        GLApiCache.invalidate()
+        GLApiCache.update('node')
 
         self.set_status(201)
 
@@ -81,4 +81,4 @@ class FileInstance(BaseHandler):
     def delete(self, key):
         yield del_file(key)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('node')
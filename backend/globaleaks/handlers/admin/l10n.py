@@ -60,7 +60,7 @@ class AdminL10NHandler(BaseHandler):
 
         yield update_custom_texts(lang, request)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('l10n')
 
         self.set_status(202)  # Updated
 
@@ -70,4 +70,4 @@ class AdminL10NHandler(BaseHandler):
     def delete(self, lang):
         yield delete_custom_texts(lang)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('l10n')
@@ -18,6 +18,11 @@ model_map = {
   'contexts': models.Context
 }
 
+dependency_map = {
+  'users': 'receivers',
+  'contexts': 'contexts'
+}
+
 
 def db_get_model_img(store, model, obj_id):
     picture = store.find(model, model.id == obj_id).one().picture
@@ -61,7 +66,7 @@ class ModelImgInstance(BaseHandler):
         finally:
             uploaded_file['body'].close()
 
-        GLApiCache.invalidate()
+        GLApiCache.update(dependency_map[obj_key])
 
         self.set_status(201)
 
@@ -71,4 +76,4 @@ class ModelImgInstance(BaseHandler):
     def delete(self, obj_key, obj_id):
         yield del_model_img(model_map[obj_key], obj_id)
 
-        GLApiCache.invalidate()
+        GLApiCache.update(dependency_map[obj_key])
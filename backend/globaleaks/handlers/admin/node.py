@@ -143,7 +143,7 @@ class NodeInstance(BaseHandler):
                                         requests.AdminNodeDesc)
 
         node_description = yield update_node(request, self.request.language)
-        GLApiCache.invalidate()
+        GLApiCache.update('node')
 
         self.set_status(202) # Updated
         self.write(node_description)
@@ -4,6 +4,7 @@
 #   ********
 # Implementation of the code executed when an HTTP client reach /overview/* URI
 
+from cyclone.web import asynchronous
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
@@ -72,6 +73,7 @@ class Tips(BaseHandler):
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
     @inlineCallbacks
+    @asynchronous
     def get(self):
         """
         Parameters: None
@@ -80,7 +82,7 @@ class Tips(BaseHandler):
         """
         tips_complete_list = yield collect_tip_overview(self.request.language)
 
-        self.write(tips_complete_list)
+        self.write_collection(tips_complete_list)
 
 
 class Files(BaseHandler):
@@ -94,6 +96,7 @@ class Files(BaseHandler):
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
     @inlineCallbacks
+    @asynchronous
     def get(self):
         """
         Parameters: None
@@ -102,4 +105,4 @@ class Files(BaseHandler):
         """
         file_complete_list = yield collect_files_overview()
 
-        self.write(file_complete_list)
+        self.write_collection(file_complete_list)
@@ -10,7 +10,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks import models
 from globaleaks.handlers.admin.step import db_create_step
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.public import serialize_step, serialize_questionnaire
+from globaleaks.handlers.public import serialize_step, serialize_questionnaire, QuestionnaireLoader
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
 from globaleaks.rest.apicache import GLApiCache
@@ -27,10 +27,15 @@ def get_questionnaire_list(store, language):
     :param language: the language in which to localize data.
     :return: a dictionary representing the serialization of the questionnaires.
     """
-    return [serialize_questionnaire(store, questionnaire, language)
+    loader = QuestionnaireLoader(store)
+
+    return [serialize_questionnaire(store, questionnaire, language, loader)
         for questionnaire in store.find(models.Questionnaire)]
 
 
+GLApiCache.register('questionnaires', get_questionnaire_list, ['questionnaires', 'fields'])
+
+
 @transact
 def get_questionnaire(store, questionnaire_id, language):
     """
@@ -61,7 +66,9 @@ def db_get_questionnaire_steps(store, questionnaire_id, language):
         log.err("Requested invalid questionnaire")
         raise errors.QuestionnaireIdNotFound
 
-    return [serialize_step(store, s, language) for s in questionnaire.steps]
+    loader = QuestionnaireLoader(store)
+
+    return [serialize_step(store, s, language, loader) for s in loader.steps[questionnaire.id]]
 
 
 @transact
@@ -181,7 +188,7 @@ class QuestionnairesCollection(BaseHandler):
         response = yield GLApiCache.get('questionnaires', self.request.language,
                                         get_questionnaire_list, self.request.language)
 
-        self.write(response)
+        self.write_cached(response)
 
     @BaseHandler.transport_security_check('admin')
     @BaseHandler.authenticated('admin')
@@ -200,7 +207,7 @@ class QuestionnairesCollection(BaseHandler):
 
         response = yield create_questionnaire(request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('questionnaires')
 
         self.set_status(201)
         self.write(response)
@@ -241,7 +248,7 @@ class QuestionnaireInstance(BaseHandler):
 
         response = yield update_questionnaire(questionnaire_id, request, self.request.language)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('questionnaires')
 
         self.set_status(202)
         self.write(response)
@@ -258,4 +265,4 @@ class QuestionnaireInstance(BaseHandler):
         Errors: InvalidInputFormat, QuestionnaireIdNotFound
         """
         yield delete_questionnaire(questionnaire_id)
-        GLApiCache.invalidate()
+        GLApiCache.update('questionnaires')
@@ -15,6 +15,7 @@ from globaleaks.utils.utility import log
 from globaleaks.rest import errors
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.security import directory_traversal_check
+from globaleaks.utils.assetstore import get_asset_store
 
 def get_description_by_stat(statstruct, name):
     return {
@@ -64,6 +65,8 @@ class StaticFileInstance(BaseHandler):
         finally:
             uploaded_file['body'].close()
 
+        get_asset_store(GLSettings.static_path).update(path)
+
         self.set_status(201)
 
     @BaseHandler.transport_security_check('admin')
@@ -80,6 +83,8 @@ class StaticFileInstance(BaseHandler):
 
         os.remove(path)
 
+        get_asset_store(GLSettings.static_path).update(path)
+
 
 class StaticFileList(BaseHandler):
     @BaseHandler.transport_security_check('admin')
@@ -7,10 +7,11 @@
 # exposed API.
 
 import operator
+from cyclone.web import asynchronous
 from storm.expr import Desc, And
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.orm import transact
+from globaleaks.orm import transact, store_pool
 from globaleaks.event import EventTrackQueue, events_monitored
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.models import Stats, Anomalies
@@ -224,6 +225,7 @@ class RecentEventsCollection(BaseHandler):
 
     @BaseHandler.transport_security_check("admin")
     @BaseHandler.authenticated("admin")
+    @asynchronous
     def get(self, kind):
         templist = []
 
@@ -235,6 +237,20 @@ class RecentEventsCollection(BaseHandler):
         templist.sort(key=operator.itemgetter('id'))
 
         if kind == 'details':
-            self.write(templist)
+            self.write_collection(templist)
         else:  # kind == 'summary':
             self.write(self.get_summary(templist))
+            self.finish()
+
+
+class MetricsCollection(BaseHandler):
+    """
+    This handler returns the metrics of the internal execution pools
+    """
+    @BaseHandler.transport_security_check("admin")
+    @BaseHandler.authenticated("admin")
+    def get(self):
+        self.write({
+            'crypto_pool': GLSettings.crypto_pool.get_stats(),
+            'store_pool': store_pool.get_stats()
+        })
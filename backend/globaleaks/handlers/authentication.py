@@ -5,11 +5,11 @@
 #
 # Files collection handlers and utils
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 from storm.expr import And
 
 from globaleaks import security
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.models import User
 from globaleaks.settings import GLSettings
 from globaleaks.models import WhistleblowerTip
@@ -48,13 +48,12 @@ def random_login_delay():
 
 
 @transact
-def login_whistleblower(store, receipt, using_tor2web):
+def db_login_whistleblower_by_receipt_hash(store, receipt_hash, using_tor2web):
     """
-    login_whistleblower returns the WhistleblowerTip.id
+    Short transaction executed after the receipt has been hashed
     """
-    hashed_receipt = security.hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
     wbtip = store.find(WhistleblowerTip,
-                       WhistleblowerTip.receipt_hash == unicode(hashed_receipt)).one()
+                       WhistleblowerTip.receipt_hash == unicode(receipt_hash)).one()
 
     if not wbtip:
         log.debug("Whistleblower login: Invalid receipt")
@@ -72,28 +71,83 @@ def login_whistleblower(store, receipt, using_tor2web):
     return wbtip.id
 
 
-@transact
-def login(store, username, password, using_tor2web):
+@inlineCallbacks
+def login_whistleblower(receipt, using_tor2web):
     """
-    login returns a tuple (user_id, state, pcn)
+    login_whistleblower returns the WhistleblowerTip.id
+
+    The receipt is hashed on the crypto thread pool outside of the
+    database transaction.
+    """
+    hashed_receipt = yield security.crypto_task(security.hash_password,
+                                                receipt,
+                                                GLSettings.memory_copy.private.receipt_salt)
+
+    wbtip_id = yield db_login_whistleblower_by_receipt_hash(hashed_receipt, using_tor2web)
+
+    returnValue(wbtip_id)
+
+
+@transact_ro
+def get_user_credentials(store, username):
+    """
+    get_user_credentials returns the informations needed to verify the
+    password of an enabled user or None if the user does not exist
     """
     user = store.find(User, And(User.username == username,
                                 User.state != u'disabled')).one()
 
-    if not user or not security.check_password(password,  user.salt, user.password):
+    if not user:
+        return None
+
+    return {
+        'id': user.id,
+        'salt': user.salt,
+        'password': user.password,
+        'state': user.state,
+        'role': user.role,
+        'password_change_needed': user.password_change_needed
+    }
+
+
+@transact
+def update_user_last_login(store, user_id):
+    user = User.get(store, user_id)
+    if user is not None:
+        user.last_login = datetime_now()
+
+
+@inlineCallbacks
+def login(username, password, using_tor2web):
+    """
+    login returns a tuple (user_id, state, pcn)
+
+    The password check runs on the crypto thread pool between a read only
+    lookup of the user and a short transaction updating the last login.
+    """
+    user = yield get_user_credentials(username)
+
+    valid = False
+    if user is not None:
+        valid = yield security.crypto_task(security.check_password,
+                                           password, user['salt'], user['password'])
+
+    if not valid:
         log.debug("Login: Invalid credentials")
         GLSettings.failed_login_attempts += 1
         raise errors.InvalidAuthentication
 
-    if using_tor2web and not GLSettings.memory_copy.accept_tor2web_access[user.role]:
-        log.err("Denied login request on Tor2web for role '%s'" % user.role)
+    if using_tor2web and not GLSettings.memory_copy.accept_tor2web_access[user['role']]:
+        log.err("Denied login request on Tor2web for role '%s'" % user['role'])
         raise errors.TorNetworkRequired
     else:
-        log.debug("Accepted login request on Tor2web for role '%s'" % user.role)
+        log.debug("Accepted login request on Tor2web for role '%s'" % user['role'])
+
+    log.debug("Login: Success (%s)" % user['role'])
+
+    yield update_user_last_login(user['id'])
 
-    log.debug("Login: Success (%s)" % user.role)
-    user.last_login = datetime_now()
-    return user.id, user.state, user.role, user.password_change_needed
+    returnValue((user['id'], user['state'], user['role'], user['password_change_needed']))
 
 
 class AuthenticationHandler(BaseHandler):
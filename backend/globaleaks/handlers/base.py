@@ -5,7 +5,10 @@ our needs.
 """
 
 import base64
+import calendar
 import collections
+import email.utils
+import hashlib
 import json
 import mimetypes
 import os
@@ -14,27 +17,32 @@ import shutil
 import sys
 import time
 from StringIO import StringIO
-from twisted.internet import fdesc, reactor
+from twisted.internet import fdesc, reactor, threads
 from twisted.internet.defer import inlineCallbacks
 from twisted.python.failure import Failure
 
 from cyclone import httputil, web, template
-from cyclone.escape import native_str
+from cyclone.escape import json_encode, native_str
 from cyclone.httpserver import HTTPConnection, HTTPRequest, _BadRequestException
 from cyclone.web import RequestHandler, HTTPError, HTTPAuthenticationRequired, RedirectHandler
 from globaleaks.event import track_handler
-from globaleaks.rest import errors, requests
+from globaleaks.rest import errors
+from globaleaks.rest.validators import compile_python_type, compile_regexp, compile_type, get_validator
 from globaleaks.security import GLSecureTemporaryFile, directory_traversal_check, generateRandomKey
 from globaleaks.settings import GLSettings
+from globaleaks.utils.assetstore import get_asset_store
 from globaleaks.utils.mailutils import mail_exception_handler, send_exception_email
 from globaleaks.utils.tempdict import TempDict
+from globaleaks.utils.uploads import UploadSession, UploadSessionList
 from globaleaks.utils.utility import log, datetime_now, deferred_sleep
 
 HANDLER_EXEC_TIME_THRESHOLD = 30
 
-GLUploads = {}
 GLSessions = TempDict(timeout=GLSettings.authentication_lifetime)
 
+# single range of bytes requested by the resumed downloads
+range_regexp = re.compile(r'^bytes=(\d*)-(\d*)$')
+
 # https://github.com/globaleaks/GlobaLeaks/issues/1601
 mimetypes.add_type('image/svg+xml', '.svg')
 mimetypes.add_type('application/vnd.ms-fontobject', '.eot')
@@ -89,40 +97,167 @@ def write_upload_encrypted_to_disk(uploaded_file, destination):
 
 
 
-class StaticFileProducer(object):
-    """Streaming producter for files
-
-    @ivar handler: The L{IRequest} to write the contents of the file to.
-    @ivar fileObject: The file the contents of which to write to the request.
+class ReadAheadProducer(object):
     """
-    bufferSize = GLSettings.file_chunk_size
+    Pull producer writing to the request the chunks returned by read().
+
+    The blocking reads are executed on a worker thread reading ahead up
+    to GLSettings.file_readahead_chunks chunks so that the reactor never
+    waits for the disk; the chunks are written only when requested by
+    the transport in order to preserve the backpressure.
 
-    def __init__(self, handler, fileObject):
+    @ivar handler: The L{IRequest} to write the data to.
+    """
+    def __init__(self, handler):
         self.handler = handler
-        self.fileObject = fileObject
+        self.buffer = collections.deque()
+        self.reading = False
+        self.waiting = False
+        self.eof = False
+
+    def read(self):
+        """
+        @return: the next chunk of data or an empty string at the end
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
 
     def start(self):
         self.handler.request.connection.transport.registerProducer(self, False)
+        self.read_ahead()
+
+    def read_ahead(self):
+        if self.reading or self.eof or len(self.buffer) >= GLSettings.file_readahead_chunks:
+            return
+
+        self.reading = True
+
+        d = threads.deferToThread(self.read)
+        d.addCallbacks(self.read_done, self.read_failed)
+
+    def read_done(self, data):
+        self.reading = False
+
+        if self.handler is None:
+            self.close()
+            return
+
+        if data:
+            self.buffer.append(data)
+            self.read_ahead()
+        else:
+            self.eof = True
+
+        if self.waiting:
+            self.waiting = False
+            self.resumeProducing()
+
+    def read_failed(self, failure):
+        self.reading = False
+
+        log.err("Unable to read the data to be streamed: %s" % failure.getErrorMessage())
+
+        if self.handler is None:
+            self.close()
+            return
+
+        # the connection is aborted given that finishing the response
+        # would make the client accept the truncated content as complete
+        transport = self.handler.request.connection.transport
+        transport.unregisterProducer()
+        transport.loseConnection()
+        self.stopProducing()
 
     def resumeProducing(self):
         try:
             if not self.handler:
                 return
-            data = self.fileObject.read(self.bufferSize)
-            if data:
-                self.handler.write(data)
+
+            if self.buffer:
+                self.handler.write(self.buffer.popleft())
                 self.handler.flush()
-            else:
+                self.read_ahead()
+            elif self.eof:
                 self.handler.request.connection.transport.unregisterProducer()
                 self.handler.finish()
                 self.stopProducing()
+            else:
+                self.waiting = True
         except:
             self.handler.finish()
             raise
 
     def stopProducing(self):
-        self.fileObject.close()
         self.handler = None
+        self.buffer.clear()
+
+        # a read in progress closes the source once completed
+        if not self.reading:
+            self.close()
+
+
+class StaticFileProducer(ReadAheadProducer):
+    """Streaming producter for files
+
+    @ivar fileObject: The file the contents of which to write to the request.
+    @ivar length: The number of bytes to be written or None for the entire file.
+    """
+    bufferSize = GLSettings.file_chunk_size
+
+    def __init__(self, handler, fileObject, length=None):
+        ReadAheadProducer.__init__(self, handler)
+        self.fileObject = fileObject
+        self.length = length
+
+    def read(self):
+        if self.length is None:
+            return self.fileObject.read(self.bufferSize)
+
+        data = self.fileObject.read(min(self.bufferSize, self.length))
+        self.length -= len(data)
+        return data
+
+    def close(self):
+        self.fileObject.close()
+
+
+class JSONStreamProducer(ReadAheadProducer):
+    """Streaming producer encoding a collection as a JSON list
+
+    The items are encoded by the worker thread of the producer and released
+    once encoded so that neither the collection nor its encoding are kept
+    in memory until the end of the response.
+
+    @ivar items: The items to be encoded; they must not be bound to a store.
+    """
+    def __init__(self, handler, items):
+        ReadAheadProducer.__init__(self, handler)
+        self.items = collections.deque(items)
+        self.separator = '['
+        self.closed = False
+
+    def read(self):
+        chunk = []
+        chunk_size = 0
+
+        while self.items:
+            data = self.separator + json_encode(self.items.popleft())
+            self.separator = ','
+            chunk_size += len(data)
+            chunk.append(data)
+            if chunk_size >= GLSettings.file_chunk_size:
+                return ''.join(chunk)
+
+        if not self.closed:
+            self.closed = True
+            chunk.append('[]' if self.separator == '[' else ']')
+
+        return ''.join(chunk)
+
+    def close(self):
+        self.items.clear()
 
 
 class GLSession(object):
@@ -402,69 +537,18 @@ class BaseHandler(RequestHandler):
         """
         Return True if the python class instantiates the specified python_type.
         """
-        if value is None:
-            return True
-
-        if python_type == requests.SkipSpecificValidation:
-            return True
-
-        if python_type == int:
-            try:
-                int(value)
-                return True
-            except Exception:
-                return False
-
-        if python_type == bool:
-            if value == u'true' or value == u'false':
-                return True
-
-        return isinstance(value, python_type)
+        return compile_python_type(python_type)(value)
 
     @staticmethod
     def validate_regexp(value, type):
         """
         Return True if the python class matches the given regexp.
         """
-        try:
-            value = unicode(value)
-        except Exception:
-            return False
-
-        return bool(re.match(type, value))
+        return compile_regexp(type)(value)
 
     @staticmethod
     def validate_type(value, type):
-        # if it's callable, than assumes is a primitive class
-        if callable(type):
-            retval = BaseHandler.validate_python_type(value, type)
-            if not retval:
-                log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
-            return retval
-        # value as "{foo:bar}"
-        elif isinstance(type, collections.Mapping):
-            retval = BaseHandler.validate_jmessage(value, type)
-            if not retval:
-                log.err("-- Invalid JSON/dict [%s] expected %s" % (value, type))
-            return retval
-        # regexp
-        elif isinstance(type, str):
-            retval = BaseHandler.validate_regexp(value, type)
-            if not retval:
-                log.err("-- Failed Match in regexp [%s] against %s" % (value, type))
-            return retval
-        # value as "[ type ]"
-        elif isinstance(type, collections.Iterable):
-            # empty list is ok
-            if len(value) == 0:
-                return True
-            else:
-                retval = all(BaseHandler.validate_type(x, type[0]) for x in value)
-                if not retval:
-                    log.err("-- List validation failed [%s] of %s" % (value, type))
-                return retval
-        else:
-            raise AssertionError
+        return compile_type(type)(value)
 
     @staticmethod
     def validate_jmessage(jmessage, message_template):
@@ -472,66 +556,17 @@ class BaseHandler(RequestHandler):
         Takes a string that represents a JSON messages and checks to see if it
         conforms to the message type it is supposed to be.
 
-        This message must be either a dict or a list. This function may be called
-        recursively to validate sub-parameters that are also go GLType.
+        This message must be either a dict or a list; the keys not present in
+        the template are stripped from the message.
+
+        The validation is performed by the validator compiled from the
+        template (see rest/validators.py).
 
         message: the message string that should be validated
 
         message_type: the GLType class it should match.
         """
-        if isinstance(message_template, dict):
-            success_check = 0
-            keys_to_strip = []
-            for key, value in jmessage.iteritems():
-                if key not in message_template:
-                    # strip whatever is not validated
-                    #
-                    # reminder: it's not possible to raise an exception for the
-                    # in case more values are presenct because it's normal that the
-                    # client will send automatically more data.
-                    #
-                    # e.g. the client will always send 'creation_date' attributs of
-                    #      objects and attributes like this are present generally only
-                    #      from the second request on.
-                    #
-                    keys_to_strip.append(key)
-                    continue
-
-                if not BaseHandler.validate_type(value, message_template[key]):
-                    log.err("Received key %s: type validation fail " % key)
-                    raise errors.InvalidInputFormat("Key (%s) type validation failure" % key)
-                success_check += 1
-
-            for key in keys_to_strip:
-                del jmessage[key]
-
-            for key, value in message_template.iteritems():
-                if key not in jmessage.keys():
-                    log.debug("Key %s expected but missing!" % key)
-                    log.debug("Received schema %s - Expected %s" %
-                              (jmessage.keys(), message_template.keys()))
-                    raise errors.InvalidInputFormat("Missing key %s" % key)
-
-                if not BaseHandler.validate_type(jmessage[key], value):
-                    log.err("Expected key: %s type validation failure" % key)
-                    raise errors.InvalidInputFormat("Key (%s) double validation failure" % key)
-                success_check += 1
-
-            if success_check == len(message_template.keys()) * 2:
-                return True
-            else:
-                log.err("Success counter double check failure: %d" % success_check)
-                raise errors.InvalidInputFormat("Success counter double check failure")
-
-        elif isinstance(message_template, list):
-            ret = all(BaseHandler.validate_type(x, message_template[0]) for x in jmessage)
-            if not ret:
-                raise errors.InvalidInputFormat("Not every element in %s is %s" %
-                                                (jmessage, message_template[0]))
-            return True
-
-        else:
-            raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+        return get_validator(message_template)(jmessage)
 
     @staticmethod
     def validate_message(message, message_template):
@@ -603,6 +638,75 @@ class BaseHandler(RequestHandler):
         else:
             RequestHandler.write_error(self, status_code, **kw)
 
+    def write_collection(self, items):
+        """
+        Write a list of items finishing the response; the lists longer
+        than GLSettings.json_stream_threshold are encoded while being
+        streamed with chunked transfer encoding.
+
+        To be used by the handlers decorated with @asynchronous.
+        """
+        if len(items) <= GLSettings.json_stream_threshold:
+            self.write(items)
+            self.finish()
+            return
+
+        self.set_header('Content-Type', 'application/json')
+
+        JSONStreamProducer(self, items).start()
+
+    def write_cached(self, entry):
+        """
+        Write a response pre-encoded by the GLApiCache; the requests
+        matching its ETag are answered with 304 Not Modified.
+
+        The gzip variant is a different representation of the resource
+        and is thus identified by its own ETag.
+        """
+        use_gzip = 'gzip' in self.request.headers.get('Accept-Encoding', '')
+        etag = entry.gzip_etag if use_gzip else entry.etag
+
+        self.set_header('Content-Type', 'application/json')
+        self.set_header('Etag', etag)
+        self.set_header('Vary', 'Accept-Encoding')
+
+        if etag in self.request.headers.get('If-None-Match', ''):
+            self.set_status(304)
+            return
+
+        if use_gzip:
+            self.set_header('Content-Encoding', 'gzip')
+            self.write(entry.gzip_body)
+        else:
+            self.write(entry.body)
+
+    def get_etag(self, *version):
+        """
+        @return: the ETag identifying the version of the requested resource
+                 in the language of the request
+        """
+        version = ':'.join([unicode(v) for v in version] + [self.request.language])
+        return '"%s"' % hashlib.sha256(version.encode('utf-8')).hexdigest()
+
+    def check_etag(self, *version):
+        """
+        Set the ETag identifying the version of the requested resource in
+        the language of the request; the requests matching it are answered
+        with 304 Not Modified.
+
+        @return: True if the response has not to be written
+        """
+        etag = self.get_etag(*version)
+
+        self.set_header('Etag', etag)
+
+        inm = self.request.headers.get('If-None-Match')
+        if inm is not None and (etag in inm or inm.strip() == '*'):
+            self.set_status(304)
+            return True
+
+        return False
+
     def write_file(self, filepath):
         if not os.path.exists(filepath):
           raise HTTPError(404)
@@ -617,11 +721,105 @@ class BaseHandler(RequestHandler):
         if not os.path.exists(filepath):
           raise HTTPError(404)
 
+        stat = os.stat(filepath)
+        etag = '"%s"' % hashlib.sha256('%s:%d:%d' % (filepath, stat.st_size, stat.st_mtime)).hexdigest()
+
         self.set_header('X-Download-Options', 'noopen')
         self.set_header('Content-Type', 'application/octet-stream')
         self.set_header('Content-Disposition', 'attachment; filename=\"%s\"' % filename)
 
-        StaticFileProducer(self, open(filepath, "rb")).start()
+        byte_range = self.set_range_headers(stat.st_size, etag)
+        if byte_range is None:
+            return
+
+        start, end = byte_range
+
+        fileObject = open(filepath, "rb")
+        fileObject.seek(start)
+
+        StaticFileProducer(self, fileObject, end - start + 1).start()
+
+    def get_byte_range(self, size, etag):
+        """
+        Parse the Range header (RFC 7233) supporting a single range of bytes;
+        the requests for multiple ranges or with an outdated If-Range are
+        served the entire content.
+
+        @return: the (start, end) of the range requested, None for the entire
+                 content or False if the range is not satisfiable
+        """
+        header = self.request.headers.get('Range')
+        if header is None:
+            return None
+
+        if_range = self.request.headers.get('If-Range')
+        if if_range is not None and if_range != etag:
+            return None
+
+        match = range_regexp.match(header.replace(' ', ''))
+        if match is None:
+            return None
+
+        start, end = match.groups()
+
+        if start == '':
+            if end == '':
+                return None
+
+            # suffix range requesting the last bytes; an empty
+            # content has no byte to satisfy it
+            if int(end) == 0 or size == 0:
+                return False
+
+            return max(size - int(end), 0), size - 1
+
+        start = int(start)
+        if end != '' and int(end) < start:
+            return None
+
+        if start >= size:
+            return False
+
+        end = size - 1 if end == '' else min(int(end), size - 1)
+
+        return start, end
+
+    def set_range_headers(self, size, etag):
+        """
+        Set the headers of the response to a download that may be resumed;
+        the requests for unsatisfiable ranges are answered with 416.
+
+        @return: the (start, end) of the bytes to be written or None if the
+                 request has been already answered
+        """
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Etag', etag)
+
+        byte_range = self.get_byte_range(size, etag)
+
+        if byte_range is False:
+            self.set_status(416)
+            self.set_header('Content-Range', 'bytes */%d' % size)
+            self.finish()
+            return None
+
+        if byte_range is None:
+            byte_range = (0, size - 1)
+        else:
+            self.set_status(206)
+            self.set_header('Content-Range', 'bytes %d-%d/%d' % (byte_range[0], byte_range[1], size))
+
+        self.set_header('Content-Length', byte_range[1] - byte_range[0] + 1)
+
+        return byte_range
+
+    def is_resumed_download(self):
+        """
+        @return: True if the request continues a download already started
+        """
+        match = range_regexp.match(self.request.headers.get('Range', '').replace(' ', ''))
+
+        return match is not None and match.group(1) != '0'
 
     @inlineCallbacks
     def uniform_answers_delay(self):
@@ -651,54 +849,107 @@ class BaseHandler(RequestHandler):
     def check_tor2web(self):
         return False if self.request.headers.get('X-Tor2Web', None) is None else True
 
+    def get_upload_session_id(self):
+        """
+        @return: the id of the upload session of the request; the uploads
+                 are kept separated by resource and by user
+        """
+        flow_identifier = self.request.arguments.get('flowIdentifier', [''])[0]
+        user_id = self.current_user.user_id if self.current_user is not None else ''
+
+        return '%s:%s:%s' % (self.request.path, user_id, flow_identifier)
+
+    def get_flow_argument(self, name, default):
+        try:
+            return int(self.request.arguments[name][0]) if name in self.request.arguments else default
+        except ValueError:
+            raise errors.InvalidInputFormat(name)
+
     def get_file_upload(self):
+        """
+        Write the chunk of the upload to its upload session; the chunks may be
+        received in any order and the upload is completed by the last one.
+
+        @return: the descriptor of the uploaded file or None if the upload
+                 is not yet completed
+        """
         try:
             if len(self.request.files) != 1:
                 raise errors.InvalidInputFormat("cannot accept more than a file upload at once")
 
-            chunk_size = len(self.request.files['file'][0]['body'])
-            total_file_size = int(self.request.arguments['flowTotalSize'][0]) if 'flowTotalSize' in self.request.arguments else chunk_size
-            flow_identifier = self.request.arguments['flowIdentifier'][0] if 'flowIdentifier' in self.request.arguments else generateRandomKey(10)
+            chunk = self.request.files['file'][0]['body']
+            total_file_size = self.get_flow_argument('flowTotalSize', len(chunk))
+            total_chunks = self.get_flow_argument('flowTotalChunks', 1)
+            chunk_number = self.get_flow_argument('flowChunkNumber', 1)
+            chunk_size = self.get_flow_argument('flowChunkSize', len(chunk))
 
-            if ((chunk_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize or
+            if ((len(chunk) / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize or
                 (total_file_size / (1024 * 1024)) > GLSettings.memory_copy.maximum_filesize):
                 log.err("File upload request rejected: file too big")
                 raise errors.FileTooBig(GLSettings.memory_copy.maximum_filesize)
 
-            if flow_identifier not in GLUploads:
-                f = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
-                GLUploads[flow_identifier] = f
+            if 'flowIdentifier' in self.request.arguments:
+                session_id = self.get_upload_session_id()
             else:
-                f = GLUploads[flow_identifier]
+                session_id = generateRandomKey(10)
+
+            session = UploadSessionList.get(session_id)
+            if session is None:
+                session = UploadSession(total_file_size, total_chunks, chunk_size)
+                UploadSessionList.set(session_id, session)
+            elif (session.total_size, session.total_chunks, session.chunk_size) != \
+                 (total_file_size, total_chunks, chunk_size):
+                raise errors.InvalidInputFormat("Chunk of a different upload")
 
-            f.write(self.request.files['file'][0]['body'])
+            session.write_chunk(chunk_number, chunk)
 
-            if 'flowChunkNumber' in self.request.arguments and 'flowTotalChunks' in self.request.arguments:
-                if self.request.arguments['flowChunkNumber'][0] != self.request.arguments['flowTotalChunks'][0]:
-                    return None
+            if not session.is_complete():
+                return None
 
+            UploadSessionList.delete(session_id)
 
             uploaded_file = {
                 'name': self.request.files['file'][0]['filename'],
                 'type': self.request.files['file'][0]['content_type'],
                 'size': total_file_size,
-                'path': f.filepath,
-                'body': f,
+                'path': session.file.filepath,
+                'body': session.file,
                 'description': self.request.arguments.get('description', [''])[0]
             }
 
-            self.request._start_time = f.creation_date
+            self.request._start_time = session.file.creation_date
             track_handler(self)
 
             return uploaded_file
 
-        except errors.FileTooBig:
+        except (errors.FileTooBig, errors.InvalidInputFormat):
             raise  # propagate the exception
 
         except Exception as exc:
             log.err("Error while handling file upload %s" % exc)
             return None
 
+    def write_file_upload_status(self):
+        """
+        Answer the clients resuming an upload; the requests for a chunk
+        (flow.js testChunks) are answered 200 if the chunk has been received
+        and 204 otherwise, while the others get the missing chunks.
+        """
+        session = UploadSessionList.get(self.get_upload_session_id())
+
+        if 'flowChunkNumber' in self.request.arguments:
+            chunk_number = self.get_flow_argument('flowChunkNumber', 0)
+            self.set_status(200 if session is not None and session.has_chunk(chunk_number) else 204)
+            return
+
+        if session is None:
+            raise errors.FileIdNotFound
+
+        self.write({
+            'total_chunks': session.total_chunks,
+            'missing_chunks': session.get_missing_chunks()
+        })
+
     def _handle_request_exception(self, e):
         ret = RequestHandler._handle_request_exception(self, e)
 
@@ -791,7 +1042,58 @@ class BaseStaticFileHandler(BaseHandler):
 
         directory_traversal_check(self.root, abspath)
 
-        self.write_file(abspath)
+        asset = get_asset_store(self.root).get(abspath)
+        if asset is None:
+            self.write_file(abspath)
+        else:
+            self.write_asset(asset)
+            self.finish()
+
+    def write_asset(self, asset):
+        """
+        Write a file kept in memory by the asset store answering the
+        conditional requests with 304 Not Modified
+        """
+        use_gzip = asset.gzip_body is not None and 'gzip' in self.request.headers.get('Accept-Encoding', '')
+        etag = asset.gzip_etag if use_gzip else asset.etag
+
+        if asset.mime_type:
+            self.set_header('Content-Type', asset.mime_type)
+
+        self.set_header('Etag', etag)
+        self.set_header('Last-Modified', asset.last_modified)
+        self.set_header('Vary', 'Accept-Encoding')
+
+        self.clear_header('Pragma')
+        self.clear_header('Expires')
+
+        if asset.immutable:
+            self.set_header('Cache-control', 'public, max-age=%d, immutable' % GLSettings.asset_max_age)
+        else:
+            self.set_header('Cache-control', 'no-cache')
+
+        if self.check_not_modified(asset, etag):
+            self.set_status(304)
+            return
+
+        if use_gzip:
+            self.set_header('Content-Encoding', 'gzip')
+            self.write(asset.gzip_body)
+        else:
+            self.write(asset.body)
+
+    def check_not_modified(self, asset, etag):
+        inm = self.request.headers.get('If-None-Match')
+        if inm is not None:
+            return etag in inm or inm.strip() == '*'
+
+        ims = self.request.headers.get('If-Modified-Since')
+        if ims is not None:
+            date_tuple = email.utils.parsedate_tz(ims)
+            if date_tuple is not None:
+                return email.utils.mktime_tz(date_tuple) >= calendar.timegm(asset.last_modified.utctimetuple())
+
+        return False
 
 
 class BaseRedirectHandler(BaseHandler, RedirectHandler):
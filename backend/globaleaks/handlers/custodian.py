@@ -60,6 +60,7 @@ def update_identityaccessrequest(store, user_id, identityaccessrequest_id, reque
         if iar.reply == 'authorized':
             iar.receivertip.can_access_whistleblower_identity = True
         iar.reply_motivation = request['reply_motivation']
+        iar.receivertip.revision += 1
 
     return serialize_identityaccessrequest(iar, language)
 
@@ -5,6 +5,8 @@
 #
 # Tip export utils
 import copy
+import hashlib
+import os
 
 from storm.expr import In
 
@@ -18,18 +20,18 @@ from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.receiver import admin_serialize_receiver
-from globaleaks.handlers.base import BaseHandler
+from globaleaks.handlers.base import BaseHandler, ReadAheadProducer
 from globaleaks.handlers.rtip import db_access_rtip, serialize_rtip, \
     db_get_itip_comment_list, db_get_itip_message_list
 from globaleaks.orm import transact
 from globaleaks.settings import GLSettings
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import deferred_sleep, msdos_encode
-from globaleaks.utils.zipstream import ZipStream
+from globaleaks.utils.zipstream import ZipStream, ZIP_STORED
 
 
 @transact
-def get_tip_export(store, user_id, rtip_id, language):
+def get_tip_export(store, user_id, rtip_id, language, resumed=False):
     rtip = db_access_rtip(store, user_id, rtip_id)
 
     receiver = rtip.receiver
@@ -45,7 +47,9 @@ def get_tip_export(store, user_id, rtip_id, language):
         'receiver': admin_serialize_receiver(receiver, language),
         'comments': rtip_dict['comments'],
         'messages': rtip_dict['messages'],
-        'files': []
+        'files': [],
+        # the archive is generated deterministically in order to resume its download
+        'date_time': rtip.internaltip.update_date.timetuple()[0:6]
     }
 
     export_template = Templating().format_template(export_dict['notification']['export_template'], export_dict).encode('utf-8')
@@ -54,10 +58,17 @@ def get_tip_export(store, user_id, rtip_id, language):
 
     export_dict['files'].append({'buf': export_template, 'name': "data.txt"})
 
+    # the downloads are part of the views of the tip
+    if not resumed:
+        rtip.internaltip.revision += 1
+
     for rf in store.find(models.ReceiverFile, models.ReceiverFile.receivertip_id == rtip_id):
-        rf.downloads += 1
+        if not resumed:
+            rf.downloads += 1
+
         file_dict = models.serializers.serialize_rfile(rf)
         file_dict['name'] = 'files/' + file_dict['name']
+        file_dict['compression'] = ZIP_STORED
         export_dict['files'].append(copy.deepcopy(file_dict))
 
     rtips_ids = [rt.id for rt in rtip.internaltip.receivertips]
@@ -66,48 +77,44 @@ def get_tip_export(store, user_id, rtip_id, language):
     for wf in wfs:
         file_dict = models.serializers.serialize_wbfile(wf)
         file_dict['name'] = 'files_from_recipients/' + file_dict['name']
+        file_dict['compression'] = ZIP_STORED
         export_dict['files'].append(copy.deepcopy(file_dict))
 
     return export_dict
 
 
-class ZipStreamProducer(object):
+def get_export_etag(tip_export):
+    """
+    @return: the ETag identifying the bytes of the archive of the export
+    """
+    h = hashlib.sha256(repr(tip_export['date_time']))
+
+    for f in tip_export['files']:
+        h.update(f['name'].encode('utf-8'))
+        if 'buf' in f:
+            h.update(f['buf'])
+        else:
+            h.update('%s:%d' % (f['path'], os.path.getsize(f['path']) if os.path.exists(f['path']) else -1))
+
+    return '"%s"' % h.hexdigest()
+
+
+class ZipStreamProducer(ReadAheadProducer):
     """ Streaming producter for ZipStream
 
-    @ivar handler: The L{IRequest} to write the contents of the file to.
-    @ivar fileObject: The file the contents of which to write to the request.
-    """
-    bufferSize = GLSettings.file_chunk_size
+    The files are read and compressed by the worker thread of the producer.
 
+    @ivar zipstreamObject: The iterator over the ZipStream to write to the request.
+    """
     def __init__(self, handler, zipstreamObject):
         """
         Initialize the instance.
         """
-        self.handler = handler
+        ReadAheadProducer.__init__(self, handler)
         self.zipstreamObject = zipstreamObject
 
-    def start(self):
-        self.handler.request.connection.transport.registerProducer(self, False)
-
-    def resumeProducing(self):
-        try:
-            if not self.handler:
-                return
-
-            data = self.zip_chunk()
-            if data:
-                self.handler.write(data)
-                self.handler.flush()
-            else:
-                self.handler.request.connection.transport.unregisterProducer()
-                self.handler.finish()
-                self.stopProducing()
-        except:
-            self.handler.finish()
-            raise
-
-    def stopProducing(self):
-        self.handler = None
+    def read(self):
+        return self.zip_chunk()
 
     def zip_chunk(self):
         chunk = []
@@ -131,12 +138,19 @@ class ExportHandler(BaseHandler):
     @inlineCallbacks
     @asynchronous
     def get(self, rtip_id):
-        tip_export = yield get_tip_export(self.current_user.user_id, rtip_id, self.request.language)
+        tip_export = yield get_tip_export(self.current_user.user_id, rtip_id, self.request.language,
+                                          self.is_resumed_download())
 
         self.set_header('X-Download-Options', 'noopen')
         self.set_header('Content-Type', 'application/octet-stream')
         self.set_header('Content-Disposition', 'attachment; filename=\"%s.zip\"' % tip_export['tip']['sequence_number'])
 
-        self.zip_stream = iter(ZipStream(tip_export['files']))
+        zip_stream = ZipStream(tip_export['files'], date_time=tip_export['date_time'])
+
+        byte_range = self.set_range_headers(zip_stream.size(), get_export_etag(tip_export))
+        if byte_range is None:
+            return
+
+        self.zip_stream = iter(zip_stream.iter_range(*byte_range))
 
         ZipStreamProducer(self, self.zip_stream).start()
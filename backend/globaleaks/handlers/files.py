@@ -41,6 +41,8 @@ def register_ifile_on_db(store, uploaded_file, internaltip_id):
     new_file.file_path = uploaded_file['path']
 
     store.add(new_file)
+    internaltip.file_counter += 1
+    internaltip.revision += 1
 
     return serializers.serialize_ifile(new_file)
 
@@ -64,6 +66,16 @@ class FileAdd(BaseHandler):
     handler_exec_time_threshold = 3600
     filehandler = True
 
+    @BaseHandler.transport_security_check('whistleblower')
+    @BaseHandler.authenticated('whistleblower')
+    def get(self):
+        """
+        Parameters: flowIdentifier, flowChunkNumber
+        Response: the missing chunks of the upload
+        Errors: FileIdNotFound
+        """
+        self.write_file_upload_status()
+
     @BaseHandler.transport_security_check('whistleblower')
     @BaseHandler.authenticated('whistleblower')
     @inlineCallbacks
@@ -114,6 +126,18 @@ class FileInstance(BaseHandler):
     handler_exec_time_threshold = 3600
     filehandler = True
 
+    @BaseHandler.transport_security_check('whistleblower')
+    @BaseHandler.unauthenticated
+    def get(self, token_id):
+        """
+        Parameters: flowIdentifier, flowChunkNumber
+        Response: the missing chunks of the upload
+        Errors: TokenFailure, FileIdNotFound
+        """
+        TokenList.get(token_id)
+
+        self.write_file_upload_status()
+
     @BaseHandler.transport_security_check('whistleblower')
     @BaseHandler.unauthenticated
     @inlineCallbacks
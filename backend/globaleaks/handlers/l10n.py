@@ -10,7 +10,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.orm import transact
+from globaleaks.orm import transact_ro
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.security import directory_traversal_check
@@ -20,7 +20,7 @@ def langfile_path(lang):
     return os.path.abspath(os.path.join(GLSettings.client_path, 'l10n', '%s.json' % lang))
 
 
-@transact
+@transact_ro
 def get_l10n(store, lang):
     path = langfile_path(lang)
     directory_traversal_check(GLSettings.client_path, path)
@@ -36,6 +36,9 @@ def get_l10n(store, lang):
     return texts
 
 
+GLApiCache.register('l10n', get_l10n, ['l10n'])
+
+
 class L10NHandler(BaseHandler):
     """
     This class is used to return the custom translation files;
@@ -45,9 +48,7 @@ class L10NHandler(BaseHandler):
     @BaseHandler.unauthenticated
     @inlineCallbacks
     def get(self, lang):
-        self.set_header('Content-Type', 'application/json')
-
         l10n = yield GLApiCache.get('l10n', self.request.language,
                                     get_l10n, self.request.language)
 
-        self.write(l10n)
+        self.write_cached(l10n)
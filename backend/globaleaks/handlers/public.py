@@ -5,6 +5,8 @@
 # Implementation of classes handling the HTTP request to /node, public
 # exposed API.
 
+from collections import defaultdict
+
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks import models, LANGUAGES_SUPPORTED
@@ -13,7 +15,7 @@ from globaleaks.handlers.base import BaseHandler
 from globaleaks.models import l10n
 from globaleaks.models.config import NodeFactory
 from globaleaks.models.l10n import NodeL10NFactory
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.sets import disjoint_union
@@ -56,14 +58,66 @@ def serialize_node(store, language):
     return db_serialize_node(store, language)
 
 
-def serialize_context(store, context, language):
+class QuestionnaireLoader(object):
+    """
+    Loader of the questionnaires, steps, fields, field attributes, options
+    and triggers fetched with a fixed number of queries and indexed in
+    memory so that the trees can be serialized without per field queries.
+
+    The tables are loaded in full as the fields of all the questionnaires
+    are needed anyway to resolve the templates.
+    """
+    def __init__(self, store):
+        self.questionnaires = {}
+        self.fields = {}
+        self.steps = defaultdict(list)
+        self.step_children = defaultdict(list)
+        self.field_children = defaultdict(list)
+        self.attrs = defaultdict(list)
+        self.options = defaultdict(list)
+        self.step_triggers = defaultdict(list)
+        self.field_triggers = defaultdict(list)
+
+        for questionnaire in store.find(models.Questionnaire):
+            self.questionnaires[questionnaire.id] = questionnaire
+
+        for step in store.find(models.Step):
+            self.steps[step.questionnaire_id].append(step)
+
+        for field in store.find(models.Field):
+            self.fields[field.id] = field
+
+            if field.step_id is not None:
+                self.step_children[field.step_id].append(field)
+
+            if field.fieldgroup_id is not None:
+                self.field_children[field.fieldgroup_id].append(field)
+
+        for attr in store.find(models.FieldAttr):
+            self.attrs[attr.field_id].append(attr)
+
+        for option in store.find(models.FieldOption):
+            self.options[option.field_id].append(option)
+
+            if option.trigger_step is not None:
+                self.step_triggers[option.trigger_step].append(option)
+
+            if option.trigger_field is not None:
+                self.field_triggers[option.trigger_field].append(option)
+
+
+def serialize_context(store, context, language, loader=None):
     """
     Serialize context description
 
     @param context: a valid Storm object
+    @param loader: the QuestionnaireLoader to be shared by the serializations
     @return: a dict describing the contexts available for submission,
         (e.g. checks if almost one receiver is associated)
     """
+    if loader is None:
+        loader = QuestionnaireLoader(store)
+
     ret_dict = {
         'id': context.id,
         'presentation_order': context.presentation_order,
@@ -81,7 +135,7 @@ def serialize_context(store, context, language):
         'enable_attachments': context.enable_attachments,
         'enable_rc_to_wb_files': context.enable_rc_to_wb_files,
         'show_receivers_in_alphabetical_order': context.show_receivers_in_alphabetical_order,
-        'questionnaire': serialize_questionnaire(store, context.questionnaire, language),
+        'questionnaire': serialize_questionnaire(store, loader.questionnaires[context.questionnaire_id], language, loader),
         'receivers': [r.id for r in context.receivers],
         'picture': context.picture.data if context.picture is not None else ''
     }
@@ -89,14 +143,18 @@ def serialize_context(store, context, language):
     return get_localized_values(ret_dict, context, context.localized_keys, language)
 
 
-def serialize_questionnaire(store, questionnaire, language):
+def serialize_questionnaire(store, questionnaire, language, loader=None):
     """
     Serialize the specified questionnaire
 
     :param store: the store on which perform queries.
     :param language: the language in which to localize data.
+    :param loader: the QuestionnaireLoader to be shared by the serializations.
     :return: a dictionary representing the serialization of the questionnaire.
     """
+    if loader is None:
+        loader = QuestionnaireLoader(store)
+
     ret_dict = {
         'id': questionnaire.id,
         'key': questionnaire.key,
@@ -104,7 +162,7 @@ def serialize_questionnaire(store, questionnaire, language):
         'name': questionnaire.name,
         'show_steps_navigation_bar': questionnaire.show_steps_navigation_bar,
         'steps_navigation_requires_completion': questionnaire.steps_navigation_requires_completion,
-        'steps': [serialize_step(store, s, language) for s in questionnaire.steps]
+        'steps': [serialize_step(store, s, language, loader) for s in loader.steps[questionnaire.id]]
     }
 
     return get_localized_values(ret_dict, questionnaire, questionnaire.localized_keys, language)
@@ -152,31 +210,35 @@ def serialize_field_attr(attr, language):
     return ret_dict
 
 
-def serialize_field(store, field, language):
+def serialize_field(store, field, language, loader=None):
     """
     Serialize a field, localizing its content depending on the language.
 
     :param field: the field object to be serialized
     :param language: the language in which to localize data
+    :param loader: the QuestionnaireLoader to be shared by the serializations
     :return: a serialization of the object
     """
     # naif likes if we add reference links
     # this code is inspired by:
     #  - https://www.youtube.com/watch?v=KtNsUgKgj9g
 
-    if field.template:
-        f_to_serialize = field.template
+    if loader is None:
+        loader = QuestionnaireLoader(store)
+
+    if field.template_id:
+        f_to_serialize = loader.fields[field.template_id]
     else:
         f_to_serialize = field
 
     attrs = {}
-    for attr in store.find(models.FieldAttr, models.FieldAttr.field_id == f_to_serialize.id):
+    for attr in loader.attrs[f_to_serialize.id]:
         attrs[attr.name] = serialize_field_attr(attr, language)
 
     triggered_by_options = [{
         'field': trigger.field_id,
         'option': trigger.id
-    } for trigger in field.triggered_by_options]
+    } for trigger in loader.field_triggers[field.id]]
 
     ret_dict = {
         'id': field.id,
@@ -197,25 +259,29 @@ def serialize_field(store, field, language):
         'width': field.width,
         'triggered_by_score': field.triggered_by_score,
         'triggered_by_options': triggered_by_options,
-        'options': [serialize_field_option(o, language) for o in f_to_serialize.options],
-        'children': [serialize_field(store, f, language) for f in f_to_serialize.children]
+        'options': [serialize_field_option(o, language) for o in loader.options[f_to_serialize.id]],
+        'children': [serialize_field(store, f, language, loader) for f in loader.field_children[f_to_serialize.id]]
     }
 
     return get_localized_values(ret_dict, f_to_serialize, field.localized_keys, language)
 
 
-def serialize_step(store, step, language):
+def serialize_step(store, step, language, loader=None):
     """
     Serialize a step, localizing its content depending on the language.
 
     :param step: the step to be serialized.
     :param language: the language in which to localize data
+    :param loader: the QuestionnaireLoader to be shared by the serializations
     :return: a serialization of the object
     """
+    if loader is None:
+        loader = QuestionnaireLoader(store)
+
     triggered_by_options = [{
         'field': trigger.field_id,
         'option': trigger.id
-    } for trigger in step.triggered_by_options]
+    } for trigger in loader.step_triggers[step.id]]
 
     ret_dict = {
         'id': step.id,
@@ -223,7 +289,7 @@ def serialize_step(store, step, language):
         'presentation_order': step.presentation_order,
         'triggered_by_score': step.triggered_by_score,
         'triggered_by_options': triggered_by_options,
-        'children': [serialize_field(store, f, language) for f in step.children]
+        'children': [serialize_field(store, f, language, loader) for f in loader.step_children[step.id]]
     }
 
     return get_localized_values(ret_dict, step, step.localized_keys, language)
@@ -257,9 +323,11 @@ def serialize_receiver(receiver, language):
 def db_get_public_context_list(store, language):
     context_list = []
 
+    loader = QuestionnaireLoader(store)
+
     for context in store.find(models.Context):
         if context.receivers.count():
-            context_list.append(serialize_context(store, context, language))
+            context_list.append(serialize_context(store, context, language, loader))
 
     return context_list
 
@@ -275,7 +343,7 @@ def db_get_public_receiver_list(store, language):
     return receiver_list
 
 
-@transact
+@transact_ro
 def get_public_resources(store, language):
     return {
         'node': db_serialize_node(store, language),
@@ -284,6 +352,9 @@ def get_public_resources(store, language):
     }
 
 
+GLApiCache.register('public', get_public_resources, ['node', 'contexts', 'receivers', 'questionnaires', 'fields'])
+
+
 class PublicResource(BaseHandler):
     @BaseHandler.transport_security_check("unauth")
     @BaseHandler.unauthenticated
@@ -294,4 +365,5 @@ class PublicResource(BaseHandler):
         """
         ret = yield GLApiCache.get('public', self.request.language,
                                    get_public_resources, self.request.language)
-        self.write(ret)
+
+        self.write_cached(ret)
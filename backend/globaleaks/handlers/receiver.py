@@ -5,21 +5,24 @@
 # Implement the classes handling the requests performed to /receiver/* URI PATH
 # Used by receivers to update personal preferences and access to personal data
 
+from cyclone.web import asynchronous
 from twisted.internet.defer import inlineCallbacks
-from storm.expr import And, In
+from storm.expr import And, Desc, In, Not, Or
 
-from globaleaks.orm import transact
-from globaleaks.handlers.user import db_user_update_user
+from globaleaks.orm import transact, transact_ro
+from globaleaks.handlers.user import db_user_update_user, prepare_password_change
 from globaleaks.handlers.base import BaseHandler
-from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_rtip
+from globaleaks.handlers.rtip import db_postpone_expiration_date, db_delete_rtip, \
+    db_get_deleted_items, parse_update_token
 from globaleaks.handlers.submission import db_get_archived_preview_schema
 from globaleaks.handlers.user import user_serialize_user
-from globaleaks.models import Receiver, ReceiverTip
+from globaleaks.models import Context, InternalTip, Receiver, ReceiverTip
 from globaleaks.rest import requests, errors
 from globaleaks.rest.apicache import GLApiCache
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import Rosetta, get_localized_values
-from globaleaks.utils.utility import log, datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_now, datetime_null, datetime_to_ISO8601, \
+    datetime_to_update_token, ISO8601_to_datetime
 
 # https://www.youtube.com/watch?v=BMxaLEGCVdg
 def receiver_serialize_receiver(receiver, language):
@@ -47,8 +50,8 @@ def get_receiver_settings(store, receiver_id, language):
 
 
 @transact
-def update_receiver_settings(store, receiver_id, request, language):
-    user = db_user_update_user(store, receiver_id, request, language)
+def update_receiver_settings(store, receiver_id, request, language, password_change=None):
+    user = db_user_update_user(store, receiver_id, request, language, password_change)
     if not user:
         raise errors.UserIdNotFound
 
@@ -61,39 +64,214 @@ def update_receiver_settings(store, receiver_id, request, language):
     return receiver_serialize_receiver(receiver, language)
 
 
-@transact
-def get_receivertip_list(store, receiver_id, language):
+# sort keys supported by the tip list and the corresponding columns
+tip_sort_keys = {
+    'creation_date': InternalTip.creation_date,
+    'update_date': InternalTip.update_date,
+    'expiration_date': InternalTip.expiration_date,
+    'score': InternalTip.total_score,
+    'label': ReceiverTip.label
+}
+
+
+def parse_tips_query(arguments):
+    """
+    Parse the query arguments of /receiver/tips:
+        limit: the maximum number of tips returned
+        cursor: the id of the last tip of the previous page
+        sort: one of tip_sort_keys eventually prefixed by - for descending order
+        context: the id of a context (can be repeated)
+        new: true|false
+        label: a text contained in the label
+        from, to: range of the creation date (ISO8601)
+        since: the update token of a previous request (see parse_update_token)
+    """
+    def decode(name, value):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            raise errors.InvalidInputFormat(name)
+
+    def get(name):
+        return decode(name, arguments[name][-1]) if name in arguments else None
+
+    query = {
+        'limit': None,
+        'cursor': get('cursor'),
+        'sort': u'creation_date',
+        'reverse': False,
+        'contexts': [decode('context', x) for x in arguments.get('context', [])],
+        'new': None,
+        'label': get('label'),
+        'from': None,
+        'to': None,
+        'since': parse_update_token(arguments)
+    }
+
+    if 'limit' in arguments:
+        try:
+            query['limit'] = int(get('limit'))
+        except ValueError:
+            raise errors.InvalidInputFormat('limit')
+
+        if not 0 < query['limit'] <= GLSettings.receiver_tips_page_size_limit:
+            raise errors.InvalidInputFormat('limit')
+
+    if 'sort' in arguments:
+        sort = get('sort')
+        query['reverse'] = sort.startswith(u'-')
+        query['sort'] = sort.lstrip(u'-')
+
+        if query['sort'] not in tip_sort_keys:
+            raise errors.InvalidInputFormat('sort')
+
+    if 'new' in arguments:
+        if get('new') not in [u'true', u'false']:
+            raise errors.InvalidInputFormat('new')
+
+        query['new'] = get('new') == u'true'
+
+    for key in ['from', 'to']:
+        if key in arguments:
+            try:
+                query[key] = ISO8601_to_datetime(get(key))
+            except ValueError:
+                raise errors.InvalidInputFormat(key)
+
+    return query
+
+
+def db_find_receivertips(store, receiver_id, query):
+    """
+    @return: the ReceiverTip, InternalTip, Context tuples of the receiver
+             selected by the query in the requested order
+    """
+    conditions = [ReceiverTip.receiver_id == receiver_id,
+                  InternalTip.id == ReceiverTip.internaltip_id,
+                  Context.id == InternalTip.context_id]
+
+    if query['contexts']:
+        conditions.append(In(InternalTip.context_id, query['contexts']))
+
+    if query['new'] is not None:
+        new = Or(ReceiverTip.access_counter == 0, ReceiverTip.last_access < InternalTip.update_date)
+        conditions.append(new if query['new'] else Not(new))
+
+    if query['label']:
+        conditions.append(ReceiverTip.label.contains_string(query['label']))
+
+    if query['from'] is not None:
+        conditions.append(InternalTip.creation_date >= query['from'])
+
+    if query['to'] is not None:
+        conditions.append(InternalTip.creation_date <= query['to'])
+
+    if query['since'] is not None:
+        conditions.append(Or(InternalTip.update_date > query['since'],
+                             ReceiverTip.update_date > query['since']))
+
+    column = tip_sort_keys[query['sort']]
+
+    if query['cursor'] is not None:
+        # keyset pagination: the page starts after the tip of the cursor
+        # and the ids make the order total in case of equal sort keys
+        value = store.find(column,
+                           ReceiverTip.id == query['cursor'],
+                           ReceiverTip.receiver_id == receiver_id,
+                           InternalTip.id == ReceiverTip.internaltip_id).one()
+
+        if value is None:
+            raise errors.InvalidInputFormat('cursor')
+
+        if query['reverse']:
+            conditions.append(Or(column < value, And(column == value, ReceiverTip.id < query['cursor'])))
+        else:
+            conditions.append(Or(column > value, And(column == value, ReceiverTip.id > query['cursor'])))
+
+    tips = store.find((ReceiverTip, InternalTip, Context), *conditions)
+
+    if query['reverse']:
+        tips = tips.order_by(Desc(column), Desc(ReceiverTip.id))
+    else:
+        tips = tips.order_by(column, ReceiverTip.id)
+
+    return tips
+
+
+def db_serialize_receivertips(store, tips, language):
     rtip_summary_list = []
 
-    for rtip in store.find(ReceiverTip, ReceiverTip.receiver_id == receiver_id):
-        mo = Rosetta(rtip.internaltip.context.localized_keys)
-        mo.acquire_storm_object(rtip.internaltip.context)
+    # the contexts and the questionnaire previews are shared among many tips
+    # and so they are localized once per request
+    context_names = {}
+    preview_schemas = {}
+
+    for rtip, itip, context in tips:
+        if context.id not in context_names:
+            mo = Rosetta(context.localized_keys)
+            mo.acquire_storm_object(context)
+            context_names[context.id] = mo.dump_localized_key('name', language)
+
+        if itip.questionnaire_hash not in preview_schemas:
+            preview_schemas[itip.questionnaire_hash] = db_get_archived_preview_schema(store, itip.questionnaire_hash, language)
 
         rtip_summary_list.append({
             'id': rtip.id,
-            'creation_date': datetime_to_ISO8601(rtip.internaltip.creation_date),
+            'creation_date': datetime_to_ISO8601(itip.creation_date),
             'last_access': datetime_to_ISO8601(rtip.last_access),
-            'update_date': datetime_to_ISO8601(rtip.internaltip.update_date),
-            'expiration_date': datetime_to_ISO8601(rtip.internaltip.expiration_date),
-            'timetolive': rtip.internaltip.context.tip_timetolive,
-            'progressive': rtip.internaltip.progressive,
-            'new': rtip.access_counter == 0 or rtip.last_access < rtip.internaltip.update_date,
-            'context_name': mo.dump_localized_key('name', language),
+            'update_date': datetime_to_ISO8601(itip.update_date),
+            'expiration_date': datetime_to_ISO8601(itip.expiration_date),
+            'timetolive': context.tip_timetolive,
+            'progressive': itip.progressive,
+            'new': rtip.access_counter == 0 or rtip.last_access < itip.update_date,
+            'context_name': context_names[context.id],
             'access_counter': rtip.access_counter,
-            'file_counter': rtip.internaltip.internalfiles.count(),
-            'comment_counter': rtip.internaltip.comments.count(),
-            'message_counter': rtip.messages.count(),
-            'tor2web': rtip.internaltip.tor2web,
-            'questionnaire_hash': rtip.internaltip.questionnaire_hash,
-            'preview_schema': db_get_archived_preview_schema(store, rtip.internaltip.questionnaire_hash, language),
-            'preview': rtip.internaltip.preview,
-            'total_score': rtip.internaltip.total_score,
+            'file_counter': itip.file_counter,
+            'comment_counter': itip.comment_counter,
+            'message_counter': rtip.message_counter,
+            'tor2web': itip.tor2web,
+            'questionnaire_hash': itip.questionnaire_hash,
+            'preview_schema': preview_schemas[itip.questionnaire_hash],
+            'preview': itip.preview,
+            'total_score': itip.total_score,
             'label': rtip.label
         })
 
     return rtip_summary_list
 
 
+@transact_ro
+def get_receivertip_list(store, receiver_id, language, query=None):
+    """
+    @return: the list of the tips of the receiver selected by the query,
+             or the changes since the update token of the query, and the
+             cursor of the next page, if any
+    """
+    if query is None:
+        query = parse_tips_query({})
+
+    tips = db_find_receivertips(store, receiver_id, query)
+
+    cursor = None
+    if query['limit'] is not None:
+        # one more tip is loaded in order to know if a next page exists
+        tips = list(tips.config(limit=query['limit'] + 1))
+        if len(tips) > query['limit']:
+            tips = tips[:query['limit']]
+            cursor = tips[-1][0].id
+
+    tips = db_serialize_receivertips(store, tips, language)
+
+    if query['since'] is not None:
+        tips = {
+            'tips': tips,
+            'deleted': db_get_deleted_items(store, u'receivertip', receiver_id, query['since']),
+            'reset': query['since'] == datetime_null()
+        }
+
+    return tips, cursor
+
+
 @transact
 def perform_tips_operation(store, receiver_id, operation, rtips_ids):
     receiver = store.find(Receiver, Receiver.id == receiver_id).one()
@@ -156,11 +334,14 @@ class ReceiverInstance(BaseHandler):
         """
         request = self.validate_message(self.request.body, requests.ReceiverReceiverDesc)
 
+        password_change = yield prepare_password_change(self.current_user.user_id, request)
+
         receiver_status = yield update_receiver_settings(self.current_user.user_id,
                                                          request,
-                                                         self.request.language)
+                                                         self.request.language,
+                                                         password_change)
 
-        GLApiCache.invalidate()
+        GLApiCache.update('receivers')
 
         self.write(receiver_status)
 
@@ -173,15 +354,25 @@ class TipsCollection(BaseHandler):
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
+    @asynchronous
     def get(self):
         """
+        Parameters: limit, cursor, sort, context, new, label, from, to, since
         Response: receiverTipList
-        Errors: InvalidAuthentication
+        Errors: InvalidAuthentication, InvalidInputFormat
         """
-        answer = yield get_receivertip_list(self.current_user.user_id,
-                                            self.request.language)
+        token = datetime_to_update_token(datetime_now())
+        query = parse_tips_query(self.request.arguments)
+
+        answer, cursor = yield get_receivertip_list(self.current_user.user_id,
+                                                    self.request.language,
+                                                    query)
+
+        if cursor is not None:
+            self.set_header('X-Next-Cursor', cursor)
 
-        self.write(answer)
+        self.set_header('X-Update-Token', token)
+        self.write_collection(answer)
 
 
 class TipsOperations(BaseHandler):
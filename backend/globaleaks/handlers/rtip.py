@@ -8,29 +8,30 @@
 
 import os
 import string
+from datetime import timedelta
 
 from cyclone.web import asynchronous
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet import threads
 
-from storm.expr import In
+from storm.expr import And, Desc, In, Or
 
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler, \
     directory_traversal_check, write_upload_plaintext_to_disk
 from globaleaks.handlers.custodian import serialize_identityaccessrequest
-from globaleaks.handlers.submission import serialize_usertip
+from globaleaks.handlers.submission import serialize_usertip, db_serialize_questionnaire_answers
 from globaleaks.models import serializers, \
     ArchivedSchema, \
     Comment, Message, \
-    InternalTip, \
+    InternalFile, InternalTip, \
     ReceiverFile, ReceiverTip, \
     WhistleblowerFile, \
-    SecureFileDelete, IdentityAccessRequest
+    SecureFileDelete, IdentityAccessRequest, Tombstone
 from globaleaks.rest import errors, requests
 from globaleaks.settings import GLSettings
-from globaleaks.utils.utility import log, utc_future_date, datetime_now, \
-    datetime_to_ISO8601, datetime_to_pretty_str
+from globaleaks.utils.utility import log, utc_future_date, datetime_now, datetime_null, \
+    datetime_to_ISO8601, datetime_to_pretty_str, datetime_to_update_token, update_token_to_datetime
 
 
 def receiver_serialize_rfile(receiverfile):
@@ -107,21 +108,136 @@ def serialize_message(msg):
     }
 
 
-def serialize_rtip(store, rtip, language):
+def parse_update_token(arguments):
+    """
+    Parse the argument since=<update_token> requesting a delta update of a tip
+
+    @return: None if a full update is requested, the date after which the
+             changes are returned otherwise; the date is datetime_null() when
+             the token is older than GLSettings.delta_update_window as the
+             deletions happened before are no more known
+    """
+    if 'since' not in arguments:
+        return None
+
+    try:
+        since = update_token_to_datetime(arguments['since'][-1])
+    except ValueError:
+        raise errors.InvalidInputFormat('since')
+
+    if since < datetime_now() - timedelta(seconds=GLSettings.delta_update_window):
+        return datetime_null()
+
+    return since - timedelta(seconds=GLSettings.delta_update_margin)
+
+
+def db_create_tombstone(store, type, item_id, owner_id):
+    tombstone = Tombstone()
+    tombstone.type = type
+    tombstone.item_id = item_id
+    tombstone.owner_id = owner_id
+
+    store.add(tombstone)
+
+
+def db_get_deleted_items(store, type, owner_id, since):
+    tombstones = store.find(Tombstone, Tombstone.type == type,
+                                       Tombstone.owner_id == owner_id,
+                                       Tombstone.creation_date > since)
+
+    return [tombstone.item_id for tombstone in tombstones]
+
+
+def parse_page_query(arguments):
+    """
+    Parse the query arguments of the paginated lists of a tip:
+        limit: the maximum number of items returned
+        cursor: the id of the last item of the previous page
+    """
+    query = {
+        'limit': GLSettings.tip_items_page_size_limit,
+        'cursor': None
+    }
+
+    if 'cursor' in arguments:
+        try:
+            query['cursor'] = arguments['cursor'][-1].decode('utf-8')
+        except UnicodeDecodeError:
+            raise errors.InvalidInputFormat('cursor')
+
+    if 'limit' in arguments:
+        try:
+            query['limit'] = int(arguments['limit'][-1])
+        except ValueError:
+            raise errors.InvalidInputFormat('limit')
+
+        if not 0 < query['limit'] <= GLSettings.tip_items_page_size_limit:
+            raise errors.InvalidInputFormat('limit')
+
+    return query
+
+
+def db_get_page(resultset, date_column, id_column, query):
+    """
+    @return: the page of the items of the resultset selected by the query,
+             newest first, and the cursor of the next page, if any
+    """
+    if query['cursor'] is not None:
+        # keyset pagination: the page starts after the item of the cursor
+        # and the ids make the order total in case of equal dates
+        dates = list(resultset.find(id_column == query['cursor']).values(date_column))
+        if not dates:
+            raise errors.InvalidInputFormat('cursor')
+
+        resultset = resultset.find(Or(date_column < dates[0],
+                                      And(date_column == dates[0], id_column < query['cursor'])))
+
+    items = list(resultset.order_by(Desc(date_column), Desc(id_column)).config(limit=query['limit'] + 1))
+
+    cursor = None
+    if len(items) > query['limit']:
+        items = items[:query['limit']]
+        cursor = items[-1].id
+
+    return items, cursor
+
+
+def serialize_rtip(store, rtip, language, since=None, embed=True):
+    """
+    @param since: the date returned by parse_update_token; when specified
+                  only the items created or changed after it are serialized
+    @param embed: False to omit the comments, the messages and the files
+                  that can be requested by page to the sub resources
+    """
     user_id = rtip.receiver.id
 
-    ret = serialize_usertip(store, rtip, language)
+    ret = serialize_usertip(store, rtip, language, since is None or since == datetime_null())
 
     ret['id'] = rtip.id
     ret['receiver_id'] = user_id
     ret['label'] = rtip.label
-    ret['comments'] = db_get_itip_comment_list(store, rtip.internaltip)
-    ret['messages'] = db_get_itip_message_list(rtip)
-    ret['rfiles'] = db_receiver_get_rfile_list(store, rtip.id)
-    ret['wbfiles'] = db_receiver_get_wbfile_list(store, rtip.internaltip_id)
-    ret['iars'] = db_get_identityaccessrequest_list(store, rtip.id, language)
+
+    if embed:
+        ret['comments'] = db_get_itip_comment_list(store, rtip.internaltip, since)
+        ret['messages'] = db_get_itip_message_list(rtip, since)
+        ret['rfiles'] = db_receiver_get_rfile_list(store, rtip.id)
+
+    ret['wbfiles'] = db_receiver_get_wbfile_list(store, rtip.internaltip_id, since)
+    ret['iars'] = db_get_identityaccessrequest_list(store, rtip.id, language, since)
     ret['enable_notifications'] = bool(rtip.enable_notifications)
 
+    if since is not None:
+        # the answers change when the identity is provided or when the
+        # access to it gets granted
+        if rtip.internaltip.update_date > since or ret['iars']:
+            ret['answers'] = db_serialize_questionnaire_answers(store, rtip)
+
+        ret['deleted'] = {
+            'wbfiles': db_get_deleted_items(store, u'whistleblowerfile', rtip.internaltip_id, since)
+        }
+
+        ret['reset'] = since == datetime_null()
+
     return ret
 
 
@@ -160,11 +276,14 @@ def db_receiver_get_rfile_list(store, rtip_id):
     return [receiver_serialize_rfile(receiverfile) for receiverfile in receiver_files]
 
 
-def db_receiver_get_wbfile_list(store, itip_id):
+def db_receiver_get_wbfile_list(store, itip_id, since=None):
     rtips = store.find(ReceiverTip, ReceiverTip.internaltip_id == itip_id)
     rtips_ids = [rt.id for rt in rtips]
     wbfiles = store.find(WhistleblowerFile, In(WhistleblowerFile.receivertip_id, rtips_ids))
 
+    if since is not None:
+        wbfiles = wbfiles.find(WhistleblowerFile.creation_date > since)
+
     return [receiver_serialize_wbfile(wbfile) for wbfile in wbfiles]
 
 
@@ -178,6 +297,7 @@ def register_wbfile_on_db(store, uploaded_file, receivertip_id):
         raise errors.TipIdNotFound
 
     receivertip.update_date = datetime_now()
+    receivertip.internaltip.revision += 1
 
     new_file = WhistleblowerFile()
 
@@ -201,15 +321,36 @@ def receiver_get_rfile_list(store, rtip_id):
     return db_receiver_get_rfile_list(store, rtip_id)
 
 
-def db_get_rtip(store, user_id, rtip_id, language):
+@transact_ro
+def get_rfile_page(store, user_id, rtip_id, query):
+    rtip = db_access_rtip(store, user_id, rtip_id)
+
+    rfiles = store.find(ReceiverFile, ReceiverFile.receivertip_id == rtip.id,
+                                      InternalFile.id == ReceiverFile.internalfile_id)
+
+    rfiles, cursor = db_get_page(rfiles, InternalFile.creation_date, ReceiverFile.id, query)
+
+    return [receiver_serialize_rfile(rfile) for rfile in rfiles], cursor
+
+
+def db_track_rtip_access(store, user_id, rtip_id):
     rtip = db_access_rtip(store, user_id, rtip_id)
 
     rtip.access_counter += 1
-    rtip.last_access = datetime_now()
+    rtip.last_access = rtip.update_date = datetime_now()
+
+    # the accesses are part of the views of the tip
+    rtip.internaltip.revision += 1
 
     log.debug("Tip %s access granted to user %s (%d)" %
               (rtip.internaltip_id, rtip.receiver.user.name, rtip.access_counter))
 
+    return rtip
+
+
+def db_get_rtip(store, user_id, rtip_id, language):
+    rtip = db_track_rtip_access(store, user_id, rtip_id)
+
     return serialize_rtip(store, rtip, language)
 
 
@@ -230,12 +371,17 @@ def db_delete_itip_files(store, itip):
 
         db_mark_file_for_secure_deletion(store, ifile.file_path)
 
+        marked = set()
+
         for rfile in store.find(ReceiverFile, ReceiverFile.internalfile_id == ifile.id):
             # The following code must be bypassed if rfile.file_path == ifile.filepath,
             # this mean that is referenced the plaintext file instead having E2E.
-            if rfile.file_path == ifile.file_path:
+            # The same applies to files encrypted once for multiple receivers.
+            if rfile.file_path == ifile.file_path or rfile.file_path in marked:
                 continue
 
+            marked.add(rfile.file_path)
+
             log.debug("Marking receiverfile %s for secure deletion" % rfile.file_path)
 
             db_mark_file_for_secure_deletion(store, rfile.file_path)
@@ -246,10 +392,16 @@ def db_delete_itip_files(store, itip):
         db_mark_file_for_secure_deletion(store, wbfile.file_path)
 
 
+def db_create_rtip_tombstones(store, itip):
+    for rtip in itip.receivertips:
+        db_create_tombstone(store, u'receivertip', rtip.id, rtip.receiver_id)
+
+
 def db_delete_itip(store, itip):
     log.debug("Removing InternalTip %s" % itip.id)
 
     db_delete_itip_files(store, itip)
+    db_create_rtip_tombstones(store, itip)
 
     store.remove(itip)
 
@@ -260,6 +412,7 @@ def db_delete_itip(store, itip):
 def db_delete_itips(store, itips):
     for itip in itips:
         db_delete_itip_files(store, itip)
+        db_create_rtip_tombstones(store, itip)
 
     itips.remove()
 
@@ -273,6 +426,12 @@ def db_postpone_expiration_date(rtip):
         rtip.internaltip.expiration_date = \
             utc_future_date(days=rtip.internaltip.context.tip_timetolive)
 
+        rtip.internaltip.revision += 1
+
+        # the expiration date is part of the tip list of every receiver
+        for receivertip in rtip.internaltip.receivertips:
+            receivertip.update_date = datetime_now()
+
 
 @transact
 def delete_rtip(store, user_id, rtip_id):
@@ -320,12 +479,15 @@ def set_internaltip_variable(store, user_id, rtip_id, key, value):
         raise errors.ForbiddenOperation
 
     setattr(rtip.internaltip, key, value)
+    rtip.internaltip.revision += 1
 
 
 @transact
 def set_receivertip_variable(store, user_id, rtip_id, key, value):
     rtip = db_access_rtip(store, user_id, rtip_id)
     setattr(rtip, key, value)
+    rtip.update_date = datetime_now()
+    rtip.revision += 1
 
 
 @transact
@@ -333,8 +495,49 @@ def get_rtip(store, user_id, rtip_id, language):
     return db_get_rtip(store, user_id, rtip_id, language)
 
 
-def db_get_itip_comment_list(store, internaltip):
-    return [serialize_comment(comment) for comment in internaltip.comments]
+@transact_ro
+def get_rtip_revision(store, user_id, rtip_id):
+    """
+    @return: the revisions identifying the version of the tip view
+    """
+    rtip = db_access_rtip(store, user_id, rtip_id)
+
+    return rtip.internaltip.revision, rtip.revision
+
+
+@transact
+def track_rtip_access(store, user_id, rtip_id):
+    """
+    @return: the revisions identifying the version of the tip view
+    """
+    rtip = db_track_rtip_access(store, user_id, rtip_id)
+
+    return rtip.internaltip.revision, rtip.revision
+
+
+@transact_ro
+def read_rtip(store, user_id, rtip_id, language, since=None, embed=True):
+    rtip = db_access_rtip(store, user_id, rtip_id)
+
+    return serialize_rtip(store, rtip, language, since, embed)
+
+
+def db_get_itip_comment_list(store, internaltip, since=None):
+    comments = internaltip.comments
+
+    if since is not None:
+        comments = comments.find(Comment.creation_date > since)
+
+    return [serialize_comment(comment) for comment in comments]
+
+
+@transact_ro
+def get_comment_page(store, user_id, rtip_id, query):
+    rtip = db_access_rtip(store, user_id, rtip_id)
+
+    comments, cursor = db_get_page(rtip.internaltip.comments.find(), Comment.creation_date, Comment.id, query)
+
+    return [serialize_comment(comment) for comment in comments], cursor
 
 
 @transact
@@ -346,6 +549,8 @@ def create_identityaccessrequest(store, user_id, rtip_id, request, language):
     iar.receivertip_id = rtip.id
     store.add(iar)
 
+    rtip.revision += 1
+
     return serialize_identityaccessrequest(iar, language)
 
 
@@ -361,12 +566,28 @@ def create_comment(store, user_id, rtip_id, request):
     comment.author = rtip.receiver.id
 
     rtip.internaltip.comments.add(comment)
+    rtip.internaltip.comment_counter += 1
+    rtip.internaltip.revision += 1
 
     return serialize_comment(comment)
 
 
-def db_get_itip_message_list(rtip):
-    return [serialize_message(message) for message in rtip.messages]
+def db_get_itip_message_list(rtip, since=None):
+    messages = rtip.messages
+
+    if since is not None:
+        messages = messages.find(Message.creation_date > since)
+
+    return [serialize_message(message) for message in messages]
+
+
+@transact_ro
+def get_message_page(store, user_id, rtip_id, query):
+    rtip = db_access_rtip(store, user_id, rtip_id)
+
+    messages, cursor = db_get_page(rtip.messages.find(), Message.creation_date, Message.id, query)
+
+    return [serialize_message(message) for message in messages], cursor
 
 
 @transact
@@ -380,6 +601,9 @@ def create_message(store, user_id, rtip_id, request):
     msg.type = u'receiver'
 
     store.add(msg)
+    rtip.message_counter += 1
+    rtip.internaltip.revision += 1
+    rtip.revision += 1
 
     return serialize_message(msg)
 
@@ -388,18 +612,25 @@ def create_message(store, user_id, rtip_id, request):
 def set_wbfile_description(store, user_id, file_id, description):
     wbfile = db_access_wbfile(store, user_id, file_id)
     wbfile.description = description
+    wbfile.receivertip.internaltip.revision += 1
 
 
 @transact
 def delete_wbfile(store, user_id, file_id):
     wbfile = db_access_wbfile(store, user_id, file_id)
     db_mark_file_for_secure_deletion(store, wbfile.file_path)
+    db_create_tombstone(store, u'whistleblowerfile', wbfile.id, wbfile.receivertip.internaltip_id)
+    wbfile.receivertip.internaltip.revision += 1
     store.remove(wbfile)
 
 
-def db_get_identityaccessrequest_list(store, rtip_id, language):
+def db_get_identityaccessrequest_list(store, rtip_id, language, since=None):
     iars = store.find(IdentityAccessRequest, IdentityAccessRequest.receivertip_id == rtip_id)
 
+    if since is not None:
+        iars = iars.find(Or(IdentityAccessRequest.request_date > since,
+                            IdentityAccessRequest.reply_date > since))
+
     return [serialize_identityaccessrequest(iar, language) for iar in iars]
 
 
@@ -412,9 +643,12 @@ class RTipInstance(BaseHandler):
     @inlineCallbacks
     def get(self, tip_id):
         """
-        Parameters: None
+        Parameters: since, embed
         Response: actorsTipDesc
-        Errors: InvalidAuthentication
+        Errors: InvalidAuthentication, InvalidInputFormat
+
+        embed=false omits the comments, the messages and the files that can
+        be requested by page to the sub resources of the tip.
 
         tip_id can be a valid tip_id (Receiver case) or a random one (because is
         ignored, only authenticated user with whistleblower token can access to
@@ -422,8 +656,38 @@ class RTipInstance(BaseHandler):
 
         This method is decorated as @BaseHandler.unauthenticated because in the handler
         the various cases are managed differently.
+
+        The full views are answered with 304 Not Modified when the
+        If-None-Match header matches the revisions of the tip; these
+        requests are not tracked as accesses given that an access
+        changes the view of the tip.
         """
-        answer = yield get_rtip(self.current_user.user_id, tip_id, self.request.language)
+        token = datetime_to_update_token(datetime_now())
+        since = parse_update_token(self.request.arguments)
+
+        embed = self.request.arguments.get('embed', ['true'])[-1]
+        if embed not in ['true', 'false']:
+            raise errors.InvalidInputFormat('embed')
+
+        embed = embed == 'true'
+
+        self.set_header('X-Update-Token', token)
+
+        if since is None:
+            revision = yield get_rtip_revision(self.current_user.user_id, tip_id)
+            if self.check_etag(tip_id, embed, *revision):
+                return
+
+        # the access is tracked by a short write transaction so that the
+        # serialization can be performed by a concurrent read only one;
+        # the revisions are read before the serialization so that a change
+        # committed in between makes the next request fetch the tip again
+        revision = yield track_rtip_access(self.current_user.user_id, tip_id)
+
+        if since is None:
+            self.set_header('Etag', self.get_etag(tip_id, embed, *revision))
+
+        answer = yield read_rtip(self.current_user.user_id, tip_id, self.request.language, since, embed)
 
         self.write(answer)
 
@@ -470,8 +734,26 @@ class RTipInstance(BaseHandler):
 
 class RTipCommentCollection(BaseHandler):
     """
-    Interface use to write rtip comments
+    Interface use to read and write rtip comments
     """
+    @BaseHandler.transport_security_check('receiver')
+    @BaseHandler.authenticated('receiver')
+    @inlineCallbacks
+    def get(self, tip_id):
+        """
+        Parameters: limit, cursor
+        Response: CommentList (newest first)
+        Errors: InvalidAuthentication, InvalidInputFormat, TipIdNotFound
+        """
+        query = parse_page_query(self.request.arguments)
+
+        comments, cursor = yield get_comment_page(self.current_user.user_id, tip_id, query)
+
+        if cursor is not None:
+            self.set_header('X-Next-Cursor', cursor)
+
+        self.write(comments)
+
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
@@ -491,8 +773,26 @@ class RTipCommentCollection(BaseHandler):
 
 class ReceiverMsgCollection(BaseHandler):
     """
-    Interface use to write rtip messages
+    Interface use to read and write rtip messages
     """
+    @BaseHandler.transport_security_check('receiver')
+    @BaseHandler.authenticated('receiver')
+    @inlineCallbacks
+    def get(self, tip_id):
+        """
+        Parameters: limit, cursor
+        Response: MessageList (newest first)
+        Errors: InvalidAuthentication, InvalidInputFormat, TipIdNotFound
+        """
+        query = parse_page_query(self.request.arguments)
+
+        messages, cursor = yield get_message_page(self.current_user.user_id, tip_id, query)
+
+        if cursor is not None:
+            self.set_header('X-Next-Cursor', cursor)
+
+        self.write(messages)
+
     @BaseHandler.transport_security_check('receiver')
     @BaseHandler.authenticated('receiver')
     @inlineCallbacks
@@ -510,6 +810,29 @@ class ReceiverMsgCollection(BaseHandler):
         self.write(message)
 
 
+class RTipReceiverFileCollection(BaseHandler):
+    """
+    Interface use to list the files of a rtip
+    """
+    @BaseHandler.transport_security_check('receiver')
+    @BaseHandler.authenticated('receiver')
+    @inlineCallbacks
+    def get(self, tip_id):
+        """
+        Parameters: limit, cursor
+        Response: ReceiverFileList (newest first)
+        Errors: InvalidAuthentication, InvalidInputFormat, TipIdNotFound
+        """
+        query = parse_page_query(self.request.arguments)
+
+        rfiles, cursor = yield get_rfile_page(self.current_user.user_id, tip_id, query)
+
+        if cursor is not None:
+            self.set_header('X-Next-Cursor', cursor)
+
+        self.write(rfiles)
+
+
 class WhistleblowerFileHandler(BaseHandler):
     """
     Receiver interface to upload a file intended for the whistleblower
@@ -641,7 +964,7 @@ class ReceiverFileDownload(BaseHandler):
     This handler exposes rfiles for download.
     """
     @transact
-    def download_rfile(self, store, user_id, file_id):
+    def download_rfile(self, store, user_id, file_id, resumed=False):
         rfile = store.find(ReceiverFile,
                            ReceiverFile.id == file_id,
                            ReceiverFile.receivertip_id == ReceiverTip.id,
@@ -653,7 +976,10 @@ class ReceiverFileDownload(BaseHandler):
         log.debug("Download of file %s by receiver %s (%d)" %
                   (rfile.internalfile_id, rfile.receivertip.receiver_id, rfile.downloads))
 
-        rfile.downloads += 1
+        # the requests resuming an interrupted download are not counted
+        if not resumed:
+            rfile.downloads += 1
+            rfile.receivertip.internaltip.revision += 1
 
         return serializers.serialize_rfile(rfile)
 
@@ -662,7 +988,7 @@ class ReceiverFileDownload(BaseHandler):
     @inlineCallbacks
     @asynchronous
     def get(self, rfile_id):
-        rfile = yield self.download_rfile(self.current_user.user_id, rfile_id)
+        rfile = yield self.download_rfile(self.current_user.user_id, rfile_id, self.is_resumed_download())
 
         filelocation = os.path.join(GLSettings.submission_path, rfile['path'])
 
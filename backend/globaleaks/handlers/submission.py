@@ -16,8 +16,9 @@ from globaleaks.handlers.admin.context import db_get_context_steps
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.orm import transact
 from globaleaks.rest import errors, requests
-from globaleaks.security import hash_password, sha256, generateRandomReceipt
+from globaleaks.security import crypto_task, hash_password, sha256, generateRandomReceipt
 from globaleaks.settings import GLSettings
+from globaleaks.utils.lrucache import LRUCache
 from globaleaks.utils.structures import Rosetta, get_localized_values
 from globaleaks.utils.token import TokenList
 from globaleaks.utils.utility import log, utc_future_date, \
@@ -68,16 +69,33 @@ def _db_get_archived_field_recursively(field, language):
     return get_localized_values(field, field, models.Field.localized_keys, language)
 
 
+archived_schema_cache = LRUCache(GLSettings.archived_schema_cache_size)
+
+
 def _db_get_archived_questionnaire_schema(store, hash, type, language):
+    """
+    Return the archived schema localized in the specified language.
+
+    The archived schemas never change once created, so the localized ones
+    are cached by (hash, type, language) and shared among the callers that
+    must treat them as read only; the node default language is part of the
+    key too as the values missing in the requested language fall back to it.
+    """
+    key = (hash, type, language, GLSettings.memory_copy.default_language)
+
+    questionnaire = archived_schema_cache.get(key)
+    if questionnaire is not None:
+        return questionnaire
+
     aqs = store.find(models.ArchivedSchema,
                      models.ArchivedSchema.hash == hash,
                      models.ArchivedSchema.type == type).one()
 
     if not aqs:
         log.err("Unable to find questionnaire schema with hash %s" % hash)
-        questionnaire = []
-    else:
-        questionnaire = copy.deepcopy(aqs.schema)
+        return []
+
+    questionnaire = copy.deepcopy(aqs.schema)
 
     if type == 'questionnaire':
         for step in questionnaire:
@@ -90,6 +108,8 @@ def _db_get_archived_questionnaire_schema(store, hash, type, language):
         for field in questionnaire:
             _db_get_archived_field_recursively(field, language)
 
+    archived_schema_cache.set(key, questionnaire)
+
     return questionnaire
 
 
@@ -205,12 +225,16 @@ def db_get_itip_receiver_list(store, itip, language):
     } for rtip in itip.receivertips]
 
 
-def serialize_itip(store, internaltip, language):
+def serialize_itip(store, internaltip, language, full=True):
+    """
+    @param full: False to omit the questionnaire that never changes and can
+                 be omitted by the delta updates
+    """
     context = internaltip.context
     mo = Rosetta(context.localized_keys)
     mo.acquire_storm_object(context)
 
-    return {
+    ret = {
         'id': internaltip.id,
         'creation_date': datetime_to_ISO8601(internaltip.creation_date),
         'update_date': datetime_to_ISO8601(internaltip.update_date),
@@ -219,7 +243,6 @@ def serialize_itip(store, internaltip, language):
         'sequence_number': get_submission_sequence_number(internaltip),
         'context_id': internaltip.context_id,
         'context_name': mo.dump_localized_key('name', language),
-        'questionnaire': db_get_archived_questionnaire_schema(store, internaltip.questionnaire_hash, language),
         'receivers': db_get_itip_receiver_list(store, internaltip, language),
         'tor2web': internaltip.tor2web,
         'timetolive': context.tip_timetolive,
@@ -237,16 +260,23 @@ def serialize_itip(store, internaltip, language):
         'wb_access_revoked': internaltip.is_wb_access_revoked()
     }
 
+    if full:
+        ret['questionnaire'] = db_get_archived_questionnaire_schema(store, internaltip.questionnaire_hash, language)
+
+    return ret
+
 
-def serialize_usertip(store, usertip, language):
+def serialize_usertip(store, usertip, language, full=True):
     internaltip = usertip.internaltip
 
-    ret = serialize_itip(store, internaltip, language)
+    ret = serialize_itip(store, internaltip, language, full)
     ret['id'] = usertip.id
     ret['internaltip_id'] = internaltip.id
-    ret['answers'] = db_serialize_questionnaire_answers(store, usertip)
     ret['total_score'] = usertip.internaltip.total_score
 
+    if full:
+        ret['answers'] = db_serialize_questionnaire_answers(store, usertip)
+
     return ret
 
 
@@ -264,27 +294,36 @@ def db_create_receivertip(store, receiver, internaltip):
 
     return receivertip.id
 
-def db_create_whistleblowertip(store, internaltip):
+def db_create_whistleblowertip(store, internaltip, receipt_hash):
     """
-    The plaintext receipt is returned only now, and then is
-    stored hashed in the WBtip table
+    The receipt is stored hashed in the WBtip table; the hash is
+    computed outside of the transaction (see generate_receipt)
     """
-    receipt = unicode(generateRandomReceipt())
-
     wbtip = models.WhistleblowerTip()
     wbtip.id = internaltip.id
-    wbtip.receipt_hash = hash_password(receipt, GLSettings.memory_copy.private.receipt_salt)
+    wbtip.receipt_hash = receipt_hash
     store.add(wbtip)
 
-    return receipt, wbtip
+    return wbtip
 
 
-@transact
-def create_whistleblowertip(*args):
-    return db_create_whistleblowertip(*args)[0] # here is exported only the receipt
+@defer.inlineCallbacks
+def generate_receipt():
+    """
+    Generate a new receipt and compute its hash on the crypto thread pool
 
+    @return: a tuple (receipt, receipt_hash)
+    """
+    receipt = unicode(generateRandomReceipt())
 
-def db_create_submission(store, request, uploaded_files, t2w, language):
+    receipt_hash = yield crypto_task(hash_password,
+                                     receipt,
+                                     GLSettings.memory_copy.private.receipt_salt)
+
+    defer.returnValue((receipt, receipt_hash))
+
+
+def db_create_submission(store, request, uploaded_files, t2w, language, receipt_hash):
     answers = request['answers']
 
     context = store.find(models.Context, models.Context.id == request['context_id']).one()
@@ -348,13 +387,14 @@ def db_create_submission(store, request, uploaded_files, t2w, language):
             new_file.submission = filedesc['submission']
             new_file.file_path = filedesc['path']
             store.add(new_file)
+            submission.file_counter += 1
             log.debug("=> file associated %s|%s (%d bytes)" % (
                 new_file.name, new_file.content_type, new_file.size))
     except Exception as excep:
         log.err("Submission create: unable to create db entry for files: %s" % excep)
         raise excep
 
-    receipt, wbtip = db_create_whistleblowertip(store, submission)
+    wbtip = db_create_whistleblowertip(store, submission, receipt_hash)
 
     if submission.context.maximum_selectable_receivers > 0 and \
                     len(request['receivers']) > submission.context.maximum_selectable_receivers:
@@ -375,16 +415,27 @@ def db_create_submission(store, request, uploaded_files, t2w, language):
 
     log.debug("The finalized submission had created %d models.ReceiverTip(s)" % len(rtips))
 
-    submission_dict = serialize_usertip(store, wbtip, language)
+    return serialize_usertip(store, wbtip, language)
 
-    submission_dict.update({'receipt': receipt})
 
-    return submission_dict
+@transact
+def save_submission(store, request, uploaded_files, t2w, language, receipt_hash):
+    return db_create_submission(store, request, uploaded_files, t2w, language, receipt_hash)
 
 
-@transact
-def create_submission(store, request, uploaded_files, t2w, language):
-    return db_create_submission(store, request, uploaded_files, t2w, language)
+@defer.inlineCallbacks
+def create_submission(request, uploaded_files, t2w, language):
+    """
+    The plaintext receipt is returned only now; its hash is computed
+    before opening the transaction storing the submission
+    """
+    receipt, receipt_hash = yield generate_receipt()
+
+    submission_dict = yield save_submission(request, uploaded_files, t2w, language, receipt_hash)
+
+    submission_dict.update({'receipt': receipt})
+
+    defer.returnValue(submission_dict)
 
 
 class SubmissionInstance(BaseHandler):
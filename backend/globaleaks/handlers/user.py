@@ -4,13 +4,13 @@
 #
 # Implement the classes handling the requests performed to /user/* URI PATH
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler
 from globaleaks.rest import requests, errors
-from globaleaks.security import change_password, parse_pgp_key
+from globaleaks.security import change_password, crypto_task, parse_pgp_key, GLKeyring
 from globaleaks.settings import GLSettings
 from globaleaks.utils.structures import get_localized_values
 from globaleaks.utils.utility import log, datetime_to_ISO8601, datetime_now, datetime_null
@@ -31,6 +31,11 @@ def parse_pgp_options(user, request):
     if not remove_key and pgp_key_public != '':
         k = parse_pgp_key(pgp_key_public)
 
+    # drop the previous key from the keyring used by delivery and notification;
+    # the key is only marked as stale and deleted once the keyring is not in use
+    if user.pgp_key_fingerprint and (k is None or k['fingerprint'] != user.pgp_key_fingerprint):
+        GLKeyring.invalidate(user.pgp_key_fingerprint)
+
     if k is not None:
         user.pgp_key_public = k['public']
         user.pgp_key_fingerprint = k['fingerprint']
@@ -86,13 +91,50 @@ def get_user_settings(store, user_id, language):
     return user_serialize_user(user, language)
 
 
-def db_user_update_user(store, user_id, request, language):
+@transact_ro
+def get_user_password(store, user_id):
+    user = models.User.get(store, user_id)
+
+    if not user:
+        raise errors.UserIdNotFound
+
+    return user.password, user.salt
+
+
+@inlineCallbacks
+def prepare_password_change(user_id, request):
+    """
+    Verifies the old password and hashes the new one on the crypto thread
+    pool outside of any database transaction.
+
+    :return: None if no password change is requested, otherwise a tuple
+             (old_password_hash, new_password_hash) to be passed to
+             db_user_update_user
+    """
+    new_password = request['password']
+    old_password = request['old_password']
+
+    if not (len(new_password) and len(old_password)):
+        returnValue(None)
+
+    old_password_hash, salt = yield get_user_password(user_id)
+
+    new_password_hash = yield crypto_task(change_password,
+                                          old_password_hash,
+                                          old_password,
+                                          new_password,
+                                          salt)
+
+    returnValue((old_password_hash, new_password_hash))
+
+
+def db_user_update_user(store, user_id, request, language, password_change=None):
     """
     Updates the specified user.
     This version of the function is specific for users that with comparison with
     admins can change only few things:
       - preferred language
-      - the password (with old password check)
+      - the password (with old password check, see prepare_password_change)
       - pgp key
     raises: globaleaks.errors.ReceiverIdNotFound` if the receiver does not exist.
     """
@@ -103,14 +145,14 @@ def db_user_update_user(store, user_id, request, language):
 
     user.language = request.get('language', GLSettings.memory_copy.default_language)
 
-    new_password = request['password']
-    old_password = request['old_password']
+    if password_change is not None:
+        old_password_hash, new_password_hash = password_change
 
-    if len(new_password) and len(old_password):
-        user.password = change_password(user.password,
-                                        old_password,
-                                        new_password,
-                                        user.salt)
+        # the password has been changed after the verification of the old one
+        if user.password != old_password_hash:
+            raise errors.InvalidOldPassword
+
+        user.password = new_password_hash
 
         if user.password_change_needed:
             user.password_change_needed = False
@@ -124,8 +166,8 @@ def db_user_update_user(store, user_id, request, language):
 
 
 @transact
-def update_user_settings(store, user_id, request, language):
-    user = db_user_update_user(store, user_id, request, language)
+def update_user_settings(store, user_id, request, language, password_change=None):
+    user = db_user_update_user(store, user_id, request, language, password_change)
 
     return user_serialize_user(user, language)
 
@@ -163,7 +205,10 @@ class UserInstance(BaseHandler):
         """
         request = self.validate_message(self.request.body, requests.UserUserDesc)
 
+        password_change = yield prepare_password_change(self.current_user.user_id, request)
+
         user_status = yield update_user_settings(self.current_user.user_id,
-                                                 request, self.request.language)
+                                                 request, self.request.language,
+                                                 password_change)
 
         self.write(user_status)
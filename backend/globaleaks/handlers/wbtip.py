@@ -12,17 +12,19 @@ from cyclone.web import asynchronous
 from twisted.internet import threads
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.orm import transact
+from globaleaks.orm import transact, transact_ro
 from globaleaks.handlers.base import BaseHandler, directory_traversal_check
-from globaleaks.handlers.rtip import serialize_comment, serialize_message, db_get_itip_comment_list, WhistleblowerFileInstanceHandler
+from globaleaks.handlers.rtip import serialize_comment, serialize_message, db_get_itip_comment_list, \
+    db_get_deleted_items, parse_update_token, WhistleblowerFileInstanceHandler
 from globaleaks.handlers.submission import serialize_usertip, \
-    db_save_questionnaire_answers, db_get_archived_questionnaire_schema
+    db_save_questionnaire_answers, db_get_archived_questionnaire_schema, db_serialize_questionnaire_answers
 from globaleaks.models import serializers, \
     InternalFile, WhistleblowerFile, \
     ReceiverTip, WhistleblowerTip, Comment, Message
 from globaleaks.rest import errors, requests
 from globaleaks.settings import GLSettings
-from globaleaks.utils.utility import log, datetime_now, datetime_to_ISO8601
+from globaleaks.utils.utility import log, datetime_now, datetime_null, datetime_to_ISO8601, \
+    datetime_to_update_token
 
 
 def wb_serialize_ifile(f):
@@ -56,38 +58,80 @@ def db_access_wbtip(store, wbtip_id):
     return wbtip
 
 
-def db_get_rfile_list(store, itip_id):
+def db_get_rfile_list(store, itip_id, since=None):
     ifiles = store.find(InternalFile, InternalFile.internaltip_id == itip_id)
 
+    if since is not None:
+        ifiles = ifiles.find(InternalFile.creation_date > since)
+
     return [wb_serialize_ifile(ifile) for ifile in ifiles]
 
 
-def db_get_wbfile_list(store, itip_id):
+def db_get_wbfile_list(store, itip_id, since=None):
     wbfiles = store.find(WhistleblowerFile, WhistleblowerFile.receivertip_id == ReceiverTip.id,
                                            ReceiverTip.internaltip_id == itip_id)
 
+    if since is not None:
+        wbfiles = wbfiles.find(WhistleblowerFile.creation_date > since)
+
     return [wb_serialize_wbfile(wbfile) for wbfile in wbfiles]
 
 
-def db_get_wbtip(store, wbtip_id, language):
+def db_track_wbtip_access(store, wbtip_id):
     wbtip = db_access_wbtip(store, wbtip_id)
 
     wbtip.internaltip.wb_access_counter += 1
     wbtip.internaltip.wb_last_access = datetime_now()
 
+    # the accesses are part of the views of the tip
+    wbtip.internaltip.revision += 1
+
     log.debug("Tip %s access granted to whistleblower (%d)" %
               (wbtip.id, wbtip.internaltip.wb_access_counter))
 
-    return serialize_wbtip(store, wbtip, language)
+    return wbtip
+
+
+def db_get_wbtip(store, wbtip_id, language, since=None):
+    wbtip = db_track_wbtip_access(store, wbtip_id)
+
+    return serialize_wbtip(store, wbtip, language, since)
 
 
 @transact
-def get_wbtip(store, wbtip_id, language):
-    return db_get_wbtip(store, wbtip_id, language)
+def get_wbtip(store, wbtip_id, language, since=None):
+    return db_get_wbtip(store, wbtip_id, language, since)
+
 
+@transact_ro
+def get_wbtip_revision(store, wbtip_id):
+    """
+    @return: the revision identifying the version of the tip view
+    """
+    return db_access_wbtip(store, wbtip_id).internaltip.revision
+
+
+@transact
+def track_wbtip_access(store, wbtip_id):
+    """
+    @return: the revision identifying the version of the tip view
+    """
+    return db_track_wbtip_access(store, wbtip_id).internaltip.revision
 
-def serialize_wbtip(store, wbtip, language):
-    ret = serialize_usertip(store, wbtip, language)
+
+@transact_ro
+def read_wbtip(store, wbtip_id, language, since=None):
+    wbtip = db_access_wbtip(store, wbtip_id)
+
+    return serialize_wbtip(store, wbtip, language, since)
+
+
+def serialize_wbtip(store, wbtip, language, since=None):
+    """
+    @param since: the date returned by parse_update_token; when specified
+                  only the items created or changed after it are serialized
+    """
+    ret = serialize_usertip(store, wbtip, language, since is None or since == datetime_null())
 
     # filter submission progressive
     # to prevent a fake whistleblower to assess every day how many
@@ -95,9 +139,19 @@ def serialize_wbtip(store, wbtip, language):
     del ret['progressive']
 
     ret['id'] = wbtip.id
-    ret['comments'] = db_get_itip_comment_list(store, wbtip.internaltip)
-    ret['rfiles'] = db_get_rfile_list(store, wbtip.id)
-    ret['wbfiles'] = db_get_wbfile_list(store, wbtip.id)
+    ret['comments'] = db_get_itip_comment_list(store, wbtip.internaltip, since)
+    ret['rfiles'] = db_get_rfile_list(store, wbtip.id, since)
+    ret['wbfiles'] = db_get_wbfile_list(store, wbtip.id, since)
+
+    if since is not None:
+        if wbtip.internaltip.update_date > since:
+            ret['answers'] = db_serialize_questionnaire_answers(store, wbtip)
+
+        ret['deleted'] = {
+            'wbfiles': db_get_deleted_items(store, u'whistleblowerfile', wbtip.id, since)
+        }
+
+        ret['reset'] = since == datetime_null()
 
     return ret
 
@@ -113,6 +167,8 @@ def create_comment(store, wbtip_id, request):
     comment.type = u'whistleblower'
 
     wbtip.internaltip.comments.add(comment)
+    wbtip.internaltip.comment_counter += 1
+    wbtip.internaltip.revision += 1
 
     return serialize_comment(comment)
 
@@ -151,6 +207,9 @@ def create_message(store, wbtip_id, receiver_id, request):
     msg.type = u'whistleblower'
 
     store.add(msg)
+    rtip.message_counter += 1
+    wbtip.internaltip.revision += 1
+    rtip.revision += 1
 
     return serialize_message(msg)
 
@@ -172,6 +231,7 @@ def update_identity_information(store, tip_id, identity_field_id, identity_field
                     internaltip.update_date = now
                     internaltip.identity_provided = True
                     internaltip.identity_provided_date = now
+                    internaltip.revision += 1
                     return
 
 
@@ -189,13 +249,35 @@ class WBTipInstance(BaseHandler):
     @inlineCallbacks
     def get(self):
         """
-        Parameters: None
+        Parameters: since
         Response: actorsTipDesc
 
         Check the user id (in the whistleblower case, is authenticated and
         contain the internaltip)
+
+        The full views are answered with 304 Not Modified when the
+        If-None-Match header matches the revision of the tip; these
+        requests are not tracked as accesses given that an access
+        changes the view of the tip.
         """
-        answer = yield get_wbtip(self.current_user.user_id, self.request.language)
+        token = datetime_to_update_token(datetime_now())
+        since = parse_update_token(self.request.arguments)
+
+        self.set_header('X-Update-Token', token)
+
+        if since is None:
+            revision = yield get_wbtip_revision(self.current_user.user_id)
+            if self.check_etag(self.current_user.user_id, revision):
+                return
+
+        # the revision is read before the serialization so that a change
+        # committed in between makes the next request fetch the tip again
+        revision = yield track_wbtip_access(self.current_user.user_id)
+
+        if since is None:
+            self.set_header('Etag', self.get_etag(self.current_user.user_id, revision))
+
+        answer = yield read_wbtip(self.current_user.user_id, self.request.language, since)
 
         self.write(answer)
 
@@ -90,6 +90,6 @@ class Wizard(BaseHandler):
         yield wizard(request, self.request.language)
         # cache must be updated in order to set wizard_done = True
         yield serialize_node(self.request.language)
-        GLApiCache.invalidate()
+        GLApiCache.update('node', 'contexts', 'receivers', 'questionnaires')
 
         self.set_status(201)  # Created
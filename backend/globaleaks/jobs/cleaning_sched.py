@@ -34,6 +34,7 @@ def db_clean_expired_wbtips(store):
 
     for wbtip in wbtips:
         log.info("Disabling WB access to %s" % wbtip.id)
+        wbtip.internaltip.revision += 1
         store.remove(wbtip)
 
 
@@ -103,6 +104,9 @@ class CleaningSchedule(GLJob):
         # delete anomalies older than 1 months
         store.find(models.Anomalies, models.Anomalies.date < datetime_now() - timedelta(365/12)).remove()
 
+        # delete the tombstones no more used by the delta updates of the tips
+        store.find(models.Tombstone, models.Tombstone.creation_date < datetime_now() - timedelta(seconds=GLSettings.delta_update_window)).remove()
+
     @transact_sync
     def get_files_to_secure_delete(self, store):
         return [file_to_delete.filepath for file_to_delete in store.find(models.SecureFileDelete)]
@@ -11,12 +11,14 @@
 # kind of file has been submitted.
 
 import os
+import Queue
+import threading
 
 from globaleaks.handlers.admin.receiver import admin_serialize_receiver
 from globaleaks.jobs.base import GLJob
 from globaleaks.models import InternalFile, ReceiverFile
 from globaleaks.orm import transact_sync
-from globaleaks.security import GLBPGP, GLSecureFile, generateRandomKey
+from globaleaks.security import GLKeyring, GLSecureFile, generateRandomKey
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log
 
@@ -25,6 +27,9 @@ __all__ = ['DeliverySchedule']
 
 INTERNALFILES_HANDLE_RETRY_MAX = 3
 
+# number of chunks buffered for every PGP encryptor
+DELIVERY_STREAM_QUEUE_SIZE = 16
+
 
 @transact_sync
 def receiverfile_planning(store):
@@ -32,6 +37,8 @@ def receiverfile_planning(store):
     This function roll over the InternalFile uploaded, extract a path, id and
     receivers associated, one entry for each combination. representing the
     ReceiverFile that need to be created.
+
+    The ReceiverFiles created by a previous interrupted attempt are reused.
     """
     receiverfiles_maps = {}
 
@@ -54,26 +61,34 @@ def receiverfile_planning(store):
 
         ifile.processing_attempts += 1
 
+        receiverfiles = dict((rfile.receivertip_id, rfile) for rfile in
+                             store.find(ReceiverFile, ReceiverFile.internalfile_id == ifile.id))
+
         for rtip in ifile.internaltip.receivertips:
-            receiverfile = ReceiverFile()
-            receiverfile.internalfile_id = ifile.id
-            receiverfile.receivertip_id = rtip.id
+            receiverfile = receiverfiles.get(rtip.id)
+            if receiverfile is None:
+                receiverfile = ReceiverFile()
+                receiverfile.internalfile_id = ifile.id
+                receiverfile.receivertip_id = rtip.id
+
+                # https://github.com/globaleaks/GlobaLeaks/issues/444
+                # avoid to mark the receiverfile as new if it is part of a submission
+                # this way we avoid to send unuseful messages
+                receiverfile.new = False if ifile.submission else True
+
+                store.add(receiverfile)
+
             receiverfile.file_path = ifile.file_path
             receiverfile.size = ifile.size
             receiverfile.status = u'processing'
-
-            # https://github.com/globaleaks/GlobaLeaks/issues/444
-            # avoid to mark the receiverfile as new if it is part of a submission
-            # this way we avoid to send unuseful messages
-            receiverfile.new = False if ifile.submission else True
-
-            store.add(receiverfile)
+            rtip.revision += 1
 
             if ifile.id not in receiverfiles_maps:
                 receiverfiles_maps[ifile.id] = {
                   'plaintext_file_needed': False,
                   'ifile_id': ifile.id,
                   'ifile_path': ifile.file_path,
+                  'ifile_aes_path': ifile.file_path,
                   'ifile_size': ifile.size,
                   'rfiles': []
                 }
@@ -89,113 +104,313 @@ def receiverfile_planning(store):
     return receiverfiles_maps
 
 
-def fsops_pgp_encrypt(fpath, recipient_pgp):
+class DeliveryStream(object):
     """
-    return
-        path of encrypted file,
-        length of the encrypted file
+    File like object used to stream the plaintext of a file, decrypted once,
+    to a PGP encryptor running in a dedicated thread.
+    """
+    def __init__(self):
+        self.queue = Queue.Queue(DELIVERY_STREAM_QUEUE_SIZE)
+        self.chunk = ''
+        self.offset = 0
+        self.eof = False
+        self.closed = False
+        self.aborted = False
+
+    def feed(self, chunk):
+        """
+        Called by the producer; an empty chunk signals the end of the stream
+        and None its abort.
+
+        @return: False if the consumer terminated and the chunk has been discarded
+        """
+        while not self.closed:
+            try:
+                self.queue.put(chunk, True, 1)
+                return True
+            except Queue.Full:
+                pass
+
+        return False
+
+    def read(self, size=-1):
+        data = []
+
+        while size != 0:
+            if self.offset >= len(self.chunk):
+                if self.eof:
+                    break
+
+                self.chunk = self.queue.get()
+                self.offset = 0
+
+                # the abort is notified to the consumer as the end of the
+                # stream given that gnupg does not close its input when the
+                # read fails; the consumer checks the aborted flag
+                if self.chunk is None:
+                    self.chunk = ''
+
+                if not len(self.chunk):
+                    self.eof = True
+                    break
+
+            end = len(self.chunk) if size < 0 else self.offset + size
+            piece = self.chunk[self.offset:end]
+            self.offset += len(piece)
+            data.append(piece)
+
+            if size > 0:
+                size -= len(piece)
+
+        return ''.join(data)
+
+    def abort(self):
+        """
+        Called by the producer failing to read the file; the consumer has
+        to discard what it produced.
+        """
+        self.aborted = True
+        self.feed(None)
+
+    def close(self):
+        self.closed = True
+
+
+def pgp_encrypt_stream(stream, rfileinfos):
+    """
+    Encrypt the plaintext received via the stream for the receivers of the
+    rfiles; executed in a dedicated thread.
+
+    When multiple rfiles are specified the file is encrypted once for all
+    the receivers and the resulting file is shared among the rfiles.
+    """
+    names = ', '.join(rfileinfo['receiver']['name'] for rfileinfo in rfileinfos)
+
+    encrypted_file_path = os.path.join(os.path.abspath(GLSettings.submission_path), "pgp_encrypted-%s" % generateRandomKey(16))
+
+    try:
+        recipients = [(rfileinfo['receiver']['pgp_key_public'], rfileinfo['receiver']['pgp_key_fingerprint'])
+                      for rfileinfo in rfileinfos]
+
+        _, encrypted_file_size = GLKeyring.encrypt_file_for_recipients(recipients, stream, encrypted_file_path)
+
+        # gnupg encrypts what has been read until the abort
+        if stream.aborted:
+            raise IOError("The delivery stream has been aborted")
+
+        for rfileinfo in rfileinfos:
+            log.debug("Switch on Receiver File for %s path %s => %s size %d => %d" %
+                      (rfileinfo['receiver']['name'], rfileinfo['path'],
+                       encrypted_file_path, rfileinfo['size'], encrypted_file_size))
+
+            rfileinfo['path'] = encrypted_file_path
+            rfileinfo['size'] = encrypted_file_size
+            rfileinfo['status'] = u'encrypted'
+    except Exception as excep:
+        log.err("Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
+                names, rfileinfos[0]['path'], excep)
+        )
+
+        for rfileinfo in rfileinfos:
+            rfileinfo['status'] = u'unavailable'
 
-    this function is used to encrypt a file for a specific recipient.
-    commonly 'receiver_desc' is expected as second argument;
-    anyhow a simpler dict can be used.
+        try:
+            os.remove(encrypted_file_path)
+        except OSError:
+            pass
+    finally:
+        stream.close()
+
+
+def process_file(receiverfiles_map):
+    """
+    Decrypt the AES file once and stream its content in parallel to the
+    PGP encryptors of the receivers and, when needed, to the plaintext file.
 
-    required keys are checked on top
+    @param receiverfiles_map: the mapping of the ifile/rfiles to be created on filesystem
+    @return: return None
     """
-    gpoj = GLBPGP()
+    ifile_id = receiverfiles_map['ifile_id']
+    ifile_path = receiverfiles_map['ifile_path']
+    ifile_name = os.path.basename(ifile_path).split('.')[0]
+    plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
+
+    pgp_rfileinfos = []
+
+    receiverfiles_map['plaintext_file_needed'] = False
+    for rfileinfo in receiverfiles_map['rfiles']:
+        if len(rfileinfo['receiver']['pgp_key_public']):
+            pgp_rfileinfos.append(rfileinfo)
+        elif GLSettings.memory_copy.allow_unencrypted:
+            receiverfiles_map['plaintext_file_needed'] = True
+            rfileinfo['status'] = u'reference'
+            rfileinfo['path'] = plain_path
+        else:
+            rfileinfo['status'] = u'nokey'
+
+    # the keys are imported before starting the encryptors so that the
+    # receivers whose key cannot be imported are excluded from the streams
+    for rfileinfo in pgp_rfileinfos[:]:
+        try:
+            GLKeyring.load_key(rfileinfo['receiver']['pgp_key_public'], rfileinfo['receiver']['pgp_key_fingerprint'])
+        except Exception as excep:
+            log.err("Unable to import the PGP key of %s: %s. marking the file as unavailable." % (
+                    rfileinfo['receiver']['name'], excep)
+            )
+            rfileinfo['status'] = u'unavailable'
+            pgp_rfileinfos.remove(rfileinfo)
+
+    if GLSettings.delivery_multi_recipient_encryption and pgp_rfileinfos:
+        encryption_groups = [pgp_rfileinfos]
+    else:
+        encryption_groups = [[rfileinfo] for rfileinfo in pgp_rfileinfos]
+
+    encryptors = []
+    for rfileinfos in encryption_groups:
+        stream = DeliveryStream()
+        thread = threading.Thread(target=pgp_encrypt_stream, args=(stream, rfileinfos))
+        encryptors.append((stream, thread))
+
+    if receiverfiles_map['plaintext_file_needed']:
+        log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
+                  (ifile_path, plain_path))
+    else:
+        log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+
+    if not encryptors and not receiverfiles_map['plaintext_file_needed']:
+        return
+
+    for _, thread in encryptors:
+        thread.start()
+
+    plaintext_f = None
+    completed = False
 
     try:
-        gpoj.load_key(recipient_pgp['pgp_key_public'])
+        if receiverfiles_map['plaintext_file_needed']:
+            plaintext_f = open(plain_path, "wb")
 
-        filepath = os.path.join(GLSettings.submission_path, fpath)
+        with GLSecureFile(ifile_path) as encrypted_file:
+            written_size = 0
+            while True:
+                chunk = encrypted_file.read(GLSettings.file_chunk_size)
+                if len(chunk) == 0:
+                    if written_size != receiverfiles_map['ifile_size']:
+                        log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
+                                (ifile_id, receiverfiles_map['ifile_size'], written_size))
+                    break
 
-        with GLSecureFile(filepath) as f:
-            encrypted_file_path = os.path.join(os.path.abspath(GLSettings.submission_path), "pgp_encrypted-%s" % generateRandomKey(16))
-            _, encrypted_file_size = gpoj.encrypt_file(recipient_pgp['pgp_key_fingerprint'], f, encrypted_file_path)
+                written_size += len(chunk)
+
+                for stream, _ in encryptors:
+                    stream.feed(chunk)
+
+                if plaintext_f is not None:
+                    plaintext_f.write(chunk)
+
+        if plaintext_f is not None:
+            plaintext_f.close()
+            receiverfiles_map['ifile_path'] = plain_path
+
+        completed = True
+
+    except Exception as excep:
+        log.err("Unable to process file %s: %s" % (ifile_path, excep))
+
+        if plaintext_f is not None:
+            plaintext_f.close()
+
+            try:
+                os.remove(plain_path)
+            except OSError:
+                pass
 
-    except:
         raise
 
     finally:
-        # the finally statement is always called also if
-        # except contains a return or a raise
-        gpoj.destroy_environment()
+        # the encryptors of a file not completely read are aborted so that
+        # they do not produce a truncated ciphertext
+        for stream, thread in encryptors:
+            if completed:
+                stream.feed('')
+            else:
+                stream.abort()
 
-    return encrypted_file_path, encrypted_file_size
+            thread.join()
+
+
+def remove_processed_file(receiverfiles_map):
+    """
+    Remove the AES file and its key once the receiverfiles have been stored
+    """
+    ifile_path = receiverfiles_map['ifile_aes_path']
+    ifile_name = os.path.basename(ifile_path).split('.')[0]
+
+    # the original AES file should always be deleted
+    log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+
+    # Remove the AES file
+    try:
+        os.remove(ifile_path)
+    except OSError as ose:
+        log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
+
+    # Remove the AES file key
+    try:
+        os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
+    except OSError as ose:
+        log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
 
 
 def process_files(receiverfiles_maps):
     """
+    Process up to GLSettings.delivery_concurrency files in parallel.
+
+    The receiverfiles of every file are stored as soon as the file has been
+    processed so that an interrupted delivery resumes from the files not yet
+    completed.
+
     @param receiverfiles_maps: the mapping of ifile/rfiles to be created on filesystem
     @return: return None
     """
-    for ifile_id, receiverfiles_map in receiverfiles_maps.iteritems():
-        ifile_path = receiverfiles_map['ifile_path']
-        ifile_name = os.path.basename(ifile_path).split('.')[0]
-        plain_path = os.path.join(GLSettings.submission_path, "%s.plain" % ifile_name)
-
-        receiverfiles_map['plaintext_file_needed'] = False
-        for rcounter, rfileinfo in enumerate(receiverfiles_map['rfiles']):
-            if len(rfileinfo['receiver']['pgp_key_public']):
-                try:
-                    new_path, new_size = fsops_pgp_encrypt(rfileinfo['path'], rfileinfo['receiver'])
-
-                    log.debug("%d# Switch on Receiver File for %s path %s => %s size %d => %d" %
-                              (rcounter,  rfileinfo['receiver']['name'], rfileinfo['path'],
-                               new_path, rfileinfo['size'], new_size))
-
-                    rfileinfo['path'] = new_path
-                    rfileinfo['size'] = new_size
-                    rfileinfo['status'] = u'encrypted'
-                except Exception as excep:
-                    log.err("%d# Unable to complete PGP encrypt for %s on %s: %s. marking the file as unavailable." % (
-                            rcounter, rfileinfo['receiver']['name'], rfileinfo['path'], excep)
-                    )
-                    rfileinfo['status'] = u'unavailable'
-            elif GLSettings.memory_copy.allow_unencrypted:
-                receiverfiles_map['plaintext_file_needed'] = True
-                rfileinfo['status'] = u'reference'
-                rfileinfo['path'] = plain_path
-            else:
-                rfileinfo['status'] = u'nokey'
+    pending = Queue.Queue()
+    completed = Queue.Queue()
 
-        if receiverfiles_map['plaintext_file_needed']:
-            log.debug(":( NOT all receivers support PGP and the system allows plaintext version of files: %s saved as plaintext file %s" %
-                      (ifile_path, plain_path))
+    for receiverfiles_map in receiverfiles_maps.values():
+        pending.put(receiverfiles_map)
 
+    def worker():
+        while True:
             try:
-                with open(plain_path, "wb") as plaintext_f, GLSecureFile(ifile_path) as encrypted_file:
-                    chunk_size = 4096
-                    written_size = 0
-                    while True:
-                        chunk = encrypted_file.read(chunk_size)
-                        if len(chunk) == 0:
-                            if written_size != receiverfiles_map['ifile_size']:
-                                log.err("Integrity error on rfile write for ifile %s; ifile_size(%d), rfile_size(%d)" %
-                                        (ifile_id, receiverfiles_map['ifile_size'], written_size))
-                            break
-                        written_size += len(chunk)
-                        plaintext_f.write(chunk)
-
-                receiverfiles_map['ifile_path'] = plain_path
-            except Exception as excep:
-                log.err("Unable to create plaintext file %s: %s" % (plain_path, excep))
-        else:
-            log.debug("All Receivers support PGP or the system denies plaintext version of files: marking internalfile as removed")
+                receiverfiles_map = pending.get_nowait()
+            except Queue.Empty:
+                return
 
-        # the original AES file should always be deleted
-        log.debug("Deleting the submission AES encrypted file: %s" % ifile_path)
+            try:
+                process_file(receiverfiles_map)
+            except Exception:
+                # the file will be processed again on the next run
+                receiverfiles_map = None
+            finally:
+                completed.put(receiverfiles_map)
+
+    workers = [threading.Thread(target=worker)
+               for _ in range(min(GLSettings.delivery_concurrency, len(receiverfiles_maps)))]
+
+    for w in workers:
+        w.start()
+
+    for _ in range(len(receiverfiles_maps)):
+        receiverfiles_map = completed.get()
+        if receiverfiles_map is None:
+            continue
 
-        # Remove the AES file
-        try:
-            os.remove(ifile_path)
-        except OSError as ose:
-            log.err("Unable to remove %s: %s" % (ifile_path, ose.message))
+        update_internalfile_and_store_receiverfiles({receiverfiles_map['ifile_id']: receiverfiles_map})
 
-        # Remove the AES file key
-        try:
-            os.remove(os.path.join(GLSettings.ramdisk_path, ("%s%s" % (GLSettings.AES_keyfile_prefix, ifile_name))))
-        except OSError as ose:
-            log.err("Unable to remove keyfile associated with %s: %s" % (ifile_path, ose.message))
+        remove_processed_file(receiverfiles_map)
+
+    for w in workers:
+        w.join()
 
 
 @transact_sync
@@ -218,6 +433,7 @@ def update_internalfile_and_store_receiverfiles(store, receiverfiles_maps):
             rfile.status = rf['status']
             rfile.file_path = rf['path']
             rfile.size = rf['size']
+            rfile.receivertip.revision += 1
 
 
 class DeliverySchedule(GLJob):
@@ -233,4 +449,3 @@ class DeliverySchedule(GLJob):
 
         if len(receiverfiles_maps):
             process_files(receiverfiles_maps)
-            update_internalfile_and_store_receiverfiles(receiverfiles_maps)
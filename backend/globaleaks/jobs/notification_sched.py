@@ -3,9 +3,11 @@
 #   notification_sched
 #   ******************
 #
-import copy
+import time
 
 from twisted.internet import defer, reactor, threads
+from twisted.mail.smtp import SMTPDeliveryError
+from storm.expr import In
 
 from globaleaks import models
 from globaleaks.orm import transact, transact_sync
@@ -13,11 +15,12 @@ from globaleaks.handlers.admin.context import admin_serialize_context
 from globaleaks.handlers.admin.node import db_admin_serialize_node
 from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.receiver import admin_serialize_receiver
-from globaleaks.handlers.rtip import serialize_rtip, serialize_message, serialize_comment
+from globaleaks.handlers.rtip import serialize_message, serialize_comment
+from globaleaks.handlers.submission import db_serialize_questionnaire_answers, serialize_itip
 from globaleaks.jobs.base import GLJob
-from globaleaks.security import GLBPGP
+from globaleaks.security import GLKeyring
 from globaleaks.settings import GLSettings
-from globaleaks.utils.mailutils import sendmail
+from globaleaks.utils.mailutils import MailSpooler
 from globaleaks.utils.templating import Templating
 from globaleaks.utils.utility import log
 
@@ -38,9 +41,66 @@ trigger_model_map = {
 }
 
 
+def get_receivertip_joins():
+    return [models.ReceiverTip.internaltip_id == models.InternalTip.id,
+            models.InternalTip.context_id == models.Context.id,
+            models.ReceiverTip.receiver_id == models.Receiver.id,
+            models.Receiver.id == models.User.id]
+
+
+def db_load_new_elements(store, trigger):
+    """
+    Load with a single query the new elements of the trigger together with
+    the objects used by the notification (tips, contexts, receivers) that
+    are then resolved by storm from its cache while generating the mails.
+
+    @return: the list of the rows loaded; the first element of each row is
+             the element that triggered the notification
+    """
+    model = trigger_model_map[trigger]
+
+    if trigger == 'Comment':
+        models_list = (models.Comment, models.InternalTip, models.Context)
+        joins = [models.Comment.internaltip_id == models.InternalTip.id,
+                 models.InternalTip.context_id == models.Context.id]
+    else:
+        models_list = (models.ReceiverTip, models.InternalTip, models.Context, models.Receiver, models.User)
+        joins = get_receivertip_joins()
+
+        if trigger == 'Message':
+            models_list = (models.Message,) + models_list
+            joins.append(models.Message.receivertip_id == models.ReceiverTip.id)
+        elif trigger == 'ReceiverFile':
+            models_list = (models.ReceiverFile, models.InternalFile) + models_list
+            joins.extend([models.ReceiverFile.receivertip_id == models.ReceiverTip.id,
+                          models.ReceiverFile.internalfile_id == models.InternalFile.id])
+
+    return list(store.find(models_list, model.new == True, *joins))
+
+
+def db_load_receivertips(store, itip_ids):
+    """
+    Load the receivertips (and their receivers) of the specified internaltips
+
+    @return: a dictionary mapping every internaltip id to its receivertips
+    """
+    ret = {}
+
+    if not itip_ids:
+        return ret
+
+    for row in store.find((models.ReceiverTip, models.InternalTip, models.Context, models.Receiver, models.User),
+                          In(models.ReceiverTip.internaltip_id, itip_ids),
+                          *get_receivertip_joins()):
+        ret.setdefault(row[0].internaltip_id, []).append(row[0])
+
+    return ret
+
+
 class MailGenerator(object):
     def __init__(self):
         self.cache = {}
+        self.receivertips = {}
 
     def serialize_config(self, store, key, language):
         cache_key = key + '-' + language
@@ -61,8 +121,8 @@ class MailGenerator(object):
         cache_key = key + '-' + obj_id + '-' + language
 
         if cache_key not in self.cache:
-            if key == 'tip':
-                cache_obj = serialize_rtip(store, obj, language)
+            if key == 'itip':
+                cache_obj = serialize_itip(store, obj, language)
             elif key == 'context':
                 cache_obj = admin_serialize_context(store, obj, language)
             elif key == 'receiver':
@@ -78,10 +138,36 @@ class MailGenerator(object):
 
         return self.cache[cache_key]
 
+    def serialize_tip(self, store, rtip, language):
+        """
+        Serialize the tip data used by the notification templates; the
+        internaltip is serialized once per language and shared among the
+        receivertips together with the answers visible to the receivers.
+        """
+        cache_key = 'tip-' + rtip.id + '-' + language
+
+        if cache_key not in self.cache:
+            itip = rtip.internaltip
+
+            answers_key = 'answers-%s-%s' % (itip.id, rtip.can_access_whistleblower_identity)
+            if answers_key not in self.cache:
+                self.cache[answers_key] = db_serialize_questionnaire_answers(store, rtip)
+
+            tip = dict(self.serialize_obj(store, 'itip', itip, language))
+            tip['id'] = rtip.id
+            tip['receiver_id'] = rtip.receiver_id
+            tip['label'] = rtip.label
+            tip['answers'] = self.cache[answers_key]
+            tip['enable_notifications'] = bool(rtip.enable_notifications)
+
+            self.cache[cache_key] = tip
+
+        return self.cache[cache_key]
+
     def process_ReceiverTip(self, store, rtip, data):
         language = rtip.receiver.user.language
 
-        data['tip'] = self.serialize_obj(store, 'tip', rtip, language)
+        data['tip'] = self.serialize_tip(store, rtip, language)
         data['context'] = self.serialize_obj(store, 'context', rtip.internaltip.context, language)
         data['receiver'] = self.serialize_obj(store, 'receiver', rtip.receiver, language)
 
@@ -94,7 +180,7 @@ class MailGenerator(object):
 
         language = message.receivertip.receiver.user.language
 
-        data['tip'] = self.serialize_obj(store, 'tip', message.receivertip, language)
+        data['tip'] = self.serialize_tip(store, message.receivertip, language)
         data['context'] = self.serialize_obj(store, 'context', message.receivertip.internaltip.context, language)
         data['receiver'] = self.serialize_obj(store, 'receiver', message.receivertip.receiver, language)
         data['message'] = self.serialize_obj(store, 'message', message, language)
@@ -102,14 +188,14 @@ class MailGenerator(object):
         self.process_mail_creation(store, data)
 
     def process_Comment(self, store, comment, data):
-        for rtip in comment.internaltip.receivertips:
-            if comment.type == u'receiver' and comment.author == rtip.receiver.user.name:
+        for rtip in self.receivertips.get(comment.internaltip_id, []):
+            if comment.type == u'receiver' and comment.author_id == rtip.receiver_id:
                 continue
 
             language = rtip.receiver.user.language
 
-            dataX = copy.deepcopy(data)
-            dataX['tip'] = self.serialize_obj(store, 'tip', rtip, language)
+            dataX = dict(data)
+            dataX['tip'] = self.serialize_tip(store, rtip, language)
             dataX['context'] = self.serialize_obj(store, 'context', comment.internaltip.context, language)
             dataX['receiver'] = self.serialize_obj(store, 'receiver', rtip.receiver, language)
             dataX['comment'] = self.serialize_obj(store, 'comment', comment, language)
@@ -123,7 +209,7 @@ class MailGenerator(object):
 
         language = rfile.receivertip.receiver.user.language
 
-        data['tip'] = self.serialize_obj(store, 'tip', rfile.receivertip, language)
+        data['tip'] = self.serialize_tip(store, rfile.receivertip, language)
         data['context'] = self.serialize_obj(store, 'context', rfile.internalfile.internaltip.context, language)
         data['receiver'] = self.serialize_obj(store, 'receiver', rfile.receivertip.receiver, language)
         data['file'] = self.serialize_obj(store, 'file', rfile.internalfile, language)
@@ -168,20 +254,15 @@ class MailGenerator(object):
 
         # If the receiver has encryption enabled encrypt the mail body
         if len(data['receiver']['pgp_key_public']):
-            gpob = GLBPGP()
-
             try:
-                gpob.load_key(data['receiver']['pgp_key_public'])
-                body = gpob.encrypt_message(data['receiver']['pgp_key_fingerprint'], body)
+                body = GLKeyring.encrypt_message(data['receiver']['pgp_key_public'],
+                                                 data['receiver']['pgp_key_fingerprint'],
+                                                 body)
             except Exception as excep:
                 log.err("Error in PGP interface object (for %s: %s)! (notification+encryption)" %
                         (data['receiver']['username'], str(excep)))
 
                 return
-            finally:
-                # the finally statement is always called also if
-                # except contains a return or a raise
-                gpob.destroy_environment()
 
         mail = models.Mail({
             'address': data['receiver']['mail_address'],
@@ -196,36 +277,63 @@ class MailGenerator(object):
         for trigger in ['ReceiverTip', 'Comment', 'Message', 'ReceiverFile']:
             model = trigger_model_map[trigger]
 
-            elements = store.find(model, model.new == True)
-            for element in elements:
-                element.new = False
+            # the rows are kept referenced in order to keep the related
+            # objects in the storm cache while processing the elements
+            rows = db_load_new_elements(store, trigger)
+            if not rows:
+                continue
+
+            store.find(model, model.new == True).set(new=False)
+
+            log.debug("Notification: generating %d notifications of type %s" %
+                      (len(rows), trigger))
+
+            if GLSettings.memory_copy.notif.disable_receiver_notification_emails:
+                continue
 
-                if GLSettings.memory_copy.notif.disable_receiver_notification_emails:
-                    continue
+            if trigger == 'Comment':
+                self.receivertips = db_load_receivertips(store, list(set(row[0].internaltip_id for row in rows)))
 
+            for row in rows:
                 data = {
                     'type': trigger_template_map[trigger]
                 }
 
-                getattr(self, 'process_%s' % trigger)(store, element, data)
+                getattr(self, 'process_%s' % trigger)(store, row[0], data)
 
-            count = elements.count()
-            if count > 0:
-                log.debug("Notification: generated %d notifications of type %s" %
-                          (count, trigger))
 
+# time of the next attempt of the mails that failed to be sent
+mail_retry_time = {}
 
-@transact
-def delete_sent_mail(store, result, mail_id):
-    store.find(models.Mail, models.Mail.id == mail_id).remove()
+
+def get_mail_backoff(attempts):
+    return min(GLSettings.mail_backoff_min * 2 ** (attempts - 1), GLSettings.mail_backoff_max)
+
+
+def is_permanent_failure(error):
+    # only a 5xx reply rejecting the recipient (e.g. unknown recipient) would
+    # not change retrying the delivery; the rejections of the sender or of the
+    # data depend on the configuration and the state of the server and are
+    # retried with the backoff
+    if not isinstance(error, SMTPDeliveryError) or not error.addresses:
+        return False
+
+    return all(500 <= code < 600 for _, code, _ in error.addresses)
 
 
 @transact_sync
 def get_mails_from_the_pool(store):
     ret = []
 
+    now = time.time()
+
     for mail in store.find(models.Mail):
-        if mail.processing_attempts > 9:
+        if mail_retry_time.get(mail.id, 0) > now:
+            continue
+
+        if mail.processing_attempts >= GLSettings.mail_attempts_limit:
+            log.err("Discarding email to %s after %d failed attempts" % (mail.address, mail.processing_attempts))
+            mail_retry_time.pop(mail.id, None)
             store.remove(mail)
             continue
 
@@ -235,25 +343,45 @@ def get_mails_from_the_pool(store):
             'id': mail.id,
             'address': mail.address,
             'subject': mail.subject,
-            'body': mail.body
+            'body': mail.body,
+            'attempts': mail.processing_attempts
         })
 
     return ret
 
 
+@transact_sync
+def update_spooled_mails(store, mails, results):
+    now = time.time()
+
+    for mail in mails:
+        error = results.get(mail['id'], True)
+
+        if error is None or is_permanent_failure(error):
+            if error is not None:
+                log.err("Discarding email to %s due to a permanent failure" % mail['address'])
+
+            mail_retry_time.pop(mail['id'], None)
+            store.find(models.Mail, models.Mail.id == mail['id']).remove()
+        else:
+            mail_retry_time[mail['id']] = now + get_mail_backoff(mail['attempts'])
+
+
 class NotificationSchedule(GLJob):
     name = "Notification"
     monitor_interval = 15 * 60
 
-    def sendmail(self, mail):
-        d = sendmail(mail['address'], mail['subject'], mail['body'])
-        d.addCallback(delete_sent_mail, mail['id'])
-        return d
+    def sendmails(self, mails):
+        return MailSpooler(mails).spool()
 
     def spool_emails(self):
         mails = get_mails_from_the_pool()
-        for mail in mails:
-            threads.blockingCallFromThread(reactor, self.sendmail, mail)
+        if not mails:
+            return
+
+        results = threads.blockingCallFromThread(reactor, self.sendmails, mails)
+
+        update_spooled_mails(mails, results)
 
     def operation(self):
         MailGenerator().generate()
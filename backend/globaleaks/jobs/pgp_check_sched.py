@@ -20,6 +20,7 @@ from globaleaks.handlers.admin.notification import db_get_notification
 from globaleaks.handlers.admin.user import db_get_admin_users
 from globaleaks.handlers.user import user_serialize_user
 from globaleaks.jobs.base import GLJob
+from globaleaks.security import GLKeyring
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import datetime_now, datetime_null
 from globaleaks.utils.templating import Templating
@@ -68,12 +69,17 @@ class PGPCheckSchedule(GLJob):
 
     @transact_sync
     def perform_pgp_validation_checks(self, store):
+        """
+        @return: the fingerprints of the expired keys
+        """
         expired_or_expiring = []
+        expired_fingerprints = []
 
         for user in db_get_expired_or_expiring_pgp_users(store):
             expired_or_expiring.append(user_serialize_user(user, GLSettings.memory_copy.default_language))
 
             if user.pgp_key_expiration < datetime_now():
+                expired_fingerprints.append(user.pgp_key_fingerprint)
                 user.pgp_key_public = ''
                 user.pgp_key_fingerprint = ''
                 user.pgp_key_expiration = datetime_null()
@@ -85,5 +91,9 @@ class PGPCheckSchedule(GLJob):
             for user_desc in expired_or_expiring:
                 self.prepare_user_pgp_alerts(store, user_desc)
 
+        return expired_fingerprints
+
     def operation(self):
-        self.perform_pgp_validation_checks()
+        # the keyring is not accessed within the transaction
+        for fingerprint in self.perform_pgp_validation_checks():
+            GLKeyring.invalidate(fingerprint)
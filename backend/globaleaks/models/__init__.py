@@ -283,6 +283,12 @@ class InternalTip(ModelWithID):
     wb_last_access = DateTime(default_factory=datetime_now)
     wb_access_counter = Int(default=0)
 
+    file_counter = Int(default=0)
+    comment_counter = Int(default=0)
+
+    # incremented by every change of the data shown by the tip views
+    revision = Int(default=0)
+
     def wb_revoke_access_date(self):
         revoke_date = self.wb_last_access + timedelta(days=GLSettings.memory_copy.wbtip_timetolive)
         return revoke_date
@@ -302,6 +308,13 @@ class ReceiverTip(ModelWithID):
     last_access = DateTime(default_factory=datetime_null)
     access_counter = Int(default=0)
 
+    update_date = DateTime(default_factory=datetime_now)
+
+    message_counter = Int(default=0)
+
+    # incremented by every change of the data shown only to the receiver
+    revision = Int(default=0)
+
     label = Unicode(default=u'')
 
     can_access_whistleblower_identity = Bool(default=False)
@@ -637,6 +650,21 @@ class SecureFileDelete(ModelWithID):
     filepath = Unicode()
 
 
+class Tombstone(ModelWithID):
+    """
+    This model keeps track of the deleted items in order to notify the
+    deletions with the delta updates of the tips
+    """
+    creation_date = DateTime(default_factory=datetime_now)
+
+    type = Unicode()
+    item_id = Unicode()
+
+    # the receiver (for the receivertips) or the internaltip (for the
+    # whistleblowerfiles) the deletion is relevant to
+    owner_id = Unicode()
+
+
 class ApplicationData(ModelWithID):
     version = Int()
     default_questionnaire = JSON()
@@ -28,15 +28,23 @@ class SQLite(storm.databases.sqlite.Database):
         self._synchronous = uri.options.get("synchronous")
         self._journal_mode = uri.options.get("journal_mode")
         self._foreign_keys = uri.options.get("foreign_keys")
+        self._query_only = uri.options.get("query_only")
 
     def raw_connect(self):
+        # connections are used by a single thread at a time but can
+        # be closed by a different one (see StorePool.invalidate)
         raw_connection = sqlite.connect(self._filename, timeout=self._timeout,
-                                        isolation_level=None)
+                                        isolation_level=None,
+                                        check_same_thread=False)
 
         if self._synchronous is not None:
             raw_connection.execute("PRAGMA synchronous = %s" %
                                    (self._synchronous,))
 
+        # auto_vacuum must be set before the journal mode given that
+        # enabling WAL on a new database writes its header
+        raw_connection.execute("PRAGMA auto_vacuum = FULL")
+
         if self._journal_mode is not None:
             raw_connection.execute("PRAGMA journal_mode = %s" %
                                    (self._journal_mode,))
@@ -45,6 +53,10 @@ class SQLite(storm.databases.sqlite.Database):
             raw_connection.execute("PRAGMA foreign_keys = %s" %
                                    (self._foreign_keys,))
 
+        if self._query_only is not None:
+            raw_connection.execute("PRAGMA query_only = %s" %
+                                   (self._query_only,))
+
         raw_connection.execute("PRAGMA secure_delete = ON")
 
         return raw_connection
@@ -53,8 +65,129 @@ storm.databases.sqlite.SQLite = SQLite
 storm.databases.sqlite.create_from_uri = SQLite
 
 
-def get_store():
-    return Store(create_database(GLSettings.db_uri))
+def get_store(read_only=False):
+    db_uri = GLSettings.db_uri
+
+    if read_only:
+        db_uri += '&query_only=ON'
+
+    return Store(create_database(db_uri))
+
+
+class StorePool(object):
+    """
+    Per thread pool of long lived stores.
+
+    Every thread keeps its own stores (sqlite connections can't be used
+    concurrently by multiple threads) so that the connection setup and the
+    pragmas are executed only once per thread instead of once per transaction.
+    """
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stores = set()
+        self.generation = 0
+        self.opened = 0
+        self.reused = 0
+
+    def _count(self, attr):
+        with self.lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _get_local_stores(self):
+        stores = getattr(self.local, 'stores', None)
+
+        if stores is None or self.local.generation != self.generation:
+            if stores is not None:
+                self._close_stores(stores)
+
+            stores = self.local.stores = {}
+            self.local.generation = self.generation
+
+        return stores
+
+    def _close_store(self, store):
+        with self.lock:
+            self.stores.discard(store)
+
+        try:
+            store.close()
+        except:
+            pass
+
+    def _close_stores(self, stores):
+        for store in stores.values():
+            self._close_store(store)
+
+        stores.clear()
+
+    def get(self, read_only=False):
+        stores = self._get_local_stores()
+
+        key = (GLSettings.db_uri, read_only)
+
+        store = stores.get(key)
+        if store is None:
+            store = stores[key] = get_store(read_only)
+            with self.lock:
+                self.stores.add(store)
+            self._count('opened')
+        else:
+            self._count('reused')
+
+        return store
+
+    def release(self, store):
+        """
+        Reset the store making it ready for the next transaction;
+        stores that can't be safely reset are discarded.
+        """
+        try:
+            store.rollback()
+            store.reset()
+        except:
+            self.discard(store)
+
+    def discard(self, store):
+        """
+        Remove the store from the pool closing it; to be used when the
+        state of the store is not known (e.g. after an exception)
+        """
+        stores = self._get_local_stores()
+        for key, value in stores.items():
+            if value is store:
+                del stores[key]
+
+        self._close_store(store)
+
+    def invalidate(self):
+        """
+        Close all the pooled stores of all the threads; must be called
+        while no transaction is running (e.g. before the database files
+        get replaced).
+        """
+        with self.lock:
+            self.generation += 1
+            stores, self.stores = self.stores, set()
+
+        for store in stores:
+            try:
+                store.close()
+            except:
+                pass
+
+        local_stores = getattr(self.local, 'stores', None)
+        if local_stores is not None:
+            local_stores.clear()
+
+    def get_stats(self):
+        return {
+            'opened': self.opened,
+            'reused': self.reused
+        }
+
+
+store_pool = StorePool()
 
 
 transact_lock = threading.Lock()
@@ -80,9 +213,12 @@ class transact(object):
     def __call__(self, *args, **kwargs):
         return self.run(self._wrap, self.method, *args, **kwargs)
 
+    def get_threadpool(self):
+        return GLSettings.orm_tp
+
     def run(self, function, *args, **kwargs):
         return deferToThreadPool(reactor,
-                                 GLSettings.orm_tp,
+                                 self.get_threadpool(),
                                  function,
                                  *args,
                                  **kwargs)
@@ -93,7 +229,7 @@ class transact(object):
         passing the store to it.
         """
         with transact_lock:
-            store = Store(create_database(GLSettings.db_uri))
+            store = store_pool.get()
 
             try:
                 if self.instance:
@@ -108,8 +244,31 @@ class transact(object):
             else:
                 return result
             finally:
-                store.reset()
-                store.close()
+                store_pool.release(store)
+
+
+class transact_ro(transact):
+    """
+    Class decorator for managing read only transactions.
+
+    Read only transactions do not take the transact_lock and are executed
+    on the dedicated GLSettings.orm_ro_tp thread pool; with the database in
+    WAL mode every transaction reads from its own consistent snapshot
+    without blocking, or being blocked by, the writer.
+    """
+    def get_threadpool(self):
+        return GLSettings.orm_ro_tp
+
+    def _wrap(self, function, *args, **kwargs):
+        store = store_pool.get(read_only=True)
+
+        try:
+            if self.instance:
+                return function(self.instance, store, *args, **kwargs)
+            else:
+                return function(store, *args, **kwargs)
+        finally:
+            store_pool.release(store)
 
 
 class transact_sync(transact):
@@ -72,6 +72,7 @@ spec = [
     (r'/rtip/' + uuid_regexp, rtip.RTipInstance),
     (r'/rtip/' + uuid_regexp + r'/comments', rtip.RTipCommentCollection),
     (r'/rtip/' + uuid_regexp + r'/messages', rtip.ReceiverMsgCollection),
+    (r'/rtip/' + uuid_regexp + r'/rfiles', rtip.RTipReceiverFileCollection),
     (r'/rtip/' + uuid_regexp + r'/identityaccessrequests', rtip.IdentityAccessRequestsCollection),
     (r'/rtip/' + uuid_regexp + r'/export', export.ExportHandler),
     (r'/rtip/' + uuid_regexp + r'/wbfile', rtip.WhistleblowerFileHandler),
@@ -118,6 +119,7 @@ spec = [
     (r'/admin/stats/(\d+)', admin_statistics.StatsCollection),
     (r'/admin/activities/(summary|details)', admin_statistics.RecentEventsCollection),
     (r'/admin/anomalies', admin_statistics.AnomalyCollection),
+    (r'/admin/metrics', admin_statistics.MetricsCollection),
     (r'/admin/l10n/(' + '|'.join(LANGUAGES_SUPPORTED_CODES) + ')', admin_l10n.AdminL10NHandler),
     (r'/admin/files/(logo|favicon|css|homepage|script)', admin_files.FileInstance),
     (r'/admin/staticfiles', admin_staticfiles.StaticFileList),
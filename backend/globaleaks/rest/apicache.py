@@ -1,28 +1,104 @@
-from twisted.internet.defer import inlineCallbacks, returnValue
+import gzip
+import hashlib
+from StringIO import StringIO
+
+from cyclone.escape import json_encode
+from twisted.internet.defer import Deferred, DeferredList, inlineCallbacks, returnValue
+
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import log
+
+
+class GLApiCacheEntry(object):
+    """
+    Response encoded once and served as is to all the requests: the JSON
+    body, its gzip variant and the strong ETags identifying them.
+    """
+    def __init__(self, value):
+        self.body = json_encode(value)
+        if isinstance(self.body, unicode):
+            self.body = self.body.encode('utf-8')
+
+        gzip_body = StringIO()
+        with gzip.GzipFile(mode='wb', fileobj=gzip_body, mtime=0) as f:
+            f.write(self.body)
+
+        self.gzip_body = gzip_body.getvalue()
+
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
 
 
 class GLApiCache(object):
     memory_cache_dict = {}
 
+    # resource_name -> (function, dependencies) of the resources registered
+    # in order to be refreshed in background when a dependency changes
+    resources = {}
+
+    # resource_name -> counter incremented on each invalidation and used
+    # to discard the results of refreshes started before the last update
+    generations = {}
+
+    # counter incremented on each invalidation of all the resources
+    epoch = 0
+
+    # (resource_name, language) -> deferreds of the requests waiting for a
+    # refresh in progress
+    refreshing = {}
+
+    @classmethod
+    def register(cls, resource_name, function, dependencies):
+        """
+        Register a resource generated by function(language) declaring the
+        data it depends on, e.g.: node, contexts, receivers, l10n
+        """
+        cls.resources[resource_name] = (function, frozenset(dependencies))
+
+    @classmethod
+    def get_generation(cls, resource_name):
+        """
+        @return: the version of the data of the resource that changes on
+                 every invalidation
+        """
+        return cls.epoch, cls.generations.get(resource_name, 0)
+
     @classmethod
     @inlineCallbacks
     def get(cls, resource_name, language, function, *args, **kwargs):
+        """
+        @return: the GLApiCacheEntry of the resource in the specified language
+                 generating it with the function if not already cached
+        """
         if resource_name in cls.memory_cache_dict \
                 and language in cls.memory_cache_dict[resource_name]:
             returnValue(cls.memory_cache_dict[resource_name][language])
 
+        if (resource_name, language) in cls.refreshing:
+            entry = yield cls.wait_refresh(resource_name, language)
+            if entry is not None:
+                returnValue(entry)
+
+        generation = cls.get_generation(resource_name)
+
         value = yield function(*args, **kwargs)
-        if resource_name not in cls.memory_cache_dict:
-            cls.memory_cache_dict[resource_name] = {}
-        cls.memory_cache_dict[resource_name][language] = value
-        returnValue(value)
+
+        if generation != cls.get_generation(resource_name):
+            # the data changed while the resource was being generated
+            returnValue(GLApiCacheEntry(value))
+
+        returnValue(cls.set(resource_name, language, value))
 
     @classmethod
     def set(cls, resource_name, language, value):
         if resource_name not in GLApiCache.memory_cache_dict:
             cls.memory_cache_dict[resource_name] = {}
 
-        cls.memory_cache_dict[resource_name][language] = value
+        entry = GLApiCacheEntry(value)
+
+        cls.memory_cache_dict[resource_name][language] = entry
+
+        return entry
 
     @classmethod
     def invalidate(cls, resource_name=None):
@@ -31,6 +107,74 @@ class GLApiCache(object):
         invalidated, because the change is still effective
         """
         if resource_name is None:
+            cls.epoch += 1
             cls.memory_cache_dict = {}
         else:
+            cls.generations[resource_name] = cls.generations.get(resource_name, 0) + 1
             cls.memory_cache_dict.pop(resource_name, None)
+
+    @classmethod
+    def update(cls, *dependencies):
+        """
+        Invalidate only the resources depending on the data updated and
+        regenerate them in background for the enabled languages in use
+        """
+        dependencies = frozenset(dependencies)
+
+        for resource_name, (function, resource_dependencies) in cls.resources.iteritems():
+            if dependencies & resource_dependencies:
+                languages = cls.memory_cache_dict.get(resource_name, {}).keys()
+
+                cls.invalidate(resource_name)
+
+                for language in languages:
+                    if language in GLSettings.memory_copy.languages_enabled:
+                        cls.refresh(resource_name, language)
+
+    @classmethod
+    def wait_refresh(cls, resource_name, language):
+        """
+        @return: a deferred fired with the entry generated by the refresh in
+                 progress or with None if the refresh failed or got outdated
+        """
+        d = Deferred()
+        cls.refreshing[(resource_name, language)].append(d)
+        return d
+
+    @classmethod
+    def wait_refreshes(cls):
+        """
+        @return: a deferred fired when all the refreshes in progress complete
+        """
+        return DeferredList([cls.wait_refresh(*key) for key in cls.refreshing.keys()])
+
+    @classmethod
+    def refresh(cls, resource_name, language):
+        key = (resource_name, language)
+        if key in cls.refreshing:
+            # the data changed again while the refresh was running; the
+            # waiting requests will regenerate the resource on their own
+            return
+
+        cls.refreshing[key] = []
+
+        generation = cls.get_generation(resource_name)
+
+        def callback(value):
+            entry = None
+            if generation == cls.get_generation(resource_name):
+                entry = cls.set(resource_name, language, value)
+
+            for d in cls.refreshing.pop(key):
+                d.callback(entry)
+
+        def errback(failure):
+            log.err("Unable to refresh the cache of %s (%s): %s" % (resource_name, language, failure.getErrorMessage()))
+
+            for d in cls.refreshing.pop(key):
+                d.callback(None)
+
+        d = cls.resources[resource_name][0](language)
+        d.addCallbacks(callback, errback)
+
+        return d
@@ -0,0 +1,213 @@
+# -*- coding: UTF-8
+#   validators
+#   **********
+#
+# Validators of the requests compiled from the message templates of
+# rest/requests.py.
+#
+# Each template is translated once into nested closures with the regular
+# expressions precompiled and the keys indexed, so that the validation of a
+# message does not interpret the template again.
+#
+# The validators implement the semantics of the original interpreter:
+#  - the keys not present in the template are stripped from the message;
+#  - a key failing the validation raises InvalidInputFormat before the
+#    check of the missing keys, that are checked in the order of the template;
+#  - None is a valid value of every python type;
+#  - an empty list is a valid value of every list type.
+
+import collections
+import re
+
+from globaleaks.rest import errors, requests
+from globaleaks.utils.utility import log
+
+
+# id(template) -> (template, validator); the template is kept referenced in
+# order to avoid the reuse of its id by other objects
+validators = {}
+
+
+def compile_python_type(python_type):
+    """
+    @return: a function returning True if the value instantiates the python type
+    """
+    if python_type == requests.SkipSpecificValidation:
+        return lambda value: True
+
+    if python_type == int:
+        def check(value):
+            if value is None:
+                return True
+
+            try:
+                int(value)
+                return True
+            except Exception:
+                return False
+
+        return check
+
+    if python_type == bool:
+        return lambda value: value is None or value == u'true' or value == u'false' or isinstance(value, bool)
+
+    return lambda value: value is None or isinstance(value, python_type)
+
+
+def compile_regexp(regexp):
+    """
+    @return: a function returning True if the value matches the regexp
+    """
+    match = re.compile(regexp).match
+
+    def check(value):
+        try:
+            value = unicode(value)
+        except Exception:
+            return False
+
+        return match(value) is not None
+
+    return check
+
+
+def compile_type(type):
+    """
+    @return: a function returning True if the value is valid for the type
+             of the template or raising InvalidInputFormat for the invalid
+             nested messages
+    """
+    # if it's callable, than assumes is a primitive class
+    if callable(type):
+        check_python_type = compile_python_type(type)
+
+        def validate_python_type(value):
+            if check_python_type(value):
+                return True
+
+            log.err("-- Invalid python_type, in [%s] expected %s" % (value, type))
+            return False
+
+        return validate_python_type
+
+    # value as "{foo:bar}"
+    elif isinstance(type, collections.Mapping):
+        return get_validator(type)
+
+    # regexp
+    elif isinstance(type, str):
+        check_regexp = compile_regexp(type)
+
+        def validate_regexp(value):
+            if check_regexp(value):
+                return True
+
+            log.err("-- Failed Match in regexp [%s] against %s" % (value, type))
+            return False
+
+        return validate_regexp
+
+    # value as "[ type ]"
+    elif isinstance(type, collections.Iterable):
+        validate_item = compile_type(type[0])
+
+        def validate_list(value):
+            # empty list is ok
+            if len(value) == 0:
+                return True
+
+            if all(validate_item(x) for x in value):
+                return True
+
+            log.err("-- List validation failed [%s] of %s" % (value, type))
+            return False
+
+        return validate_list
+
+    else:
+        def validate_unknown(value):
+            raise AssertionError
+
+        return validate_unknown
+
+
+def compile_message(message_template):
+    """
+    @return: a function returning True if the message is valid for the
+             template or raising InvalidInputFormat
+    """
+    if isinstance(message_template, dict):
+        keys = message_template.keys()
+        key_validators = dict((key, compile_type(value)) for key, value in message_template.iteritems())
+
+        def validate_dict(jmessage):
+            keys_to_strip = []
+
+            for key, value in jmessage.iteritems():
+                validate = key_validators.get(key)
+                if validate is None:
+                    # strip whatever is not validated
+                    keys_to_strip.append(key)
+                    continue
+
+                if not validate(value):
+                    log.err("Received key %s: type validation fail " % key)
+                    raise errors.InvalidInputFormat("Key (%s) type validation failure" % key)
+
+            for key in keys_to_strip:
+                del jmessage[key]
+
+            for key in keys:
+                if key not in jmessage:
+                    log.debug("Key %s expected but missing!" % key)
+                    log.debug("Received schema %s - Expected %s" %
+                              (jmessage.keys(), keys))
+                    raise errors.InvalidInputFormat("Missing key %s" % key)
+
+            return True
+
+        return validate_dict
+
+    elif isinstance(message_template, list):
+        validate_item = compile_type(message_template[0])
+
+        def validate_list(jmessage):
+            if not all(validate_item(x) for x in jmessage):
+                raise errors.InvalidInputFormat("Not every element in %s is %s" %
+                                                (jmessage, message_template[0]))
+            return True
+
+        return validate_list
+
+    else:
+        def validate_unknown(jmessage):
+            raise errors.InvalidInputFormat("invalid json massage: expected dict or list")
+
+        return validate_unknown
+
+
+def get_validator(message_template):
+    """
+    @return: the validator of the template compiling it on the first use
+    """
+    entry = validators.get(id(message_template))
+    if entry is not None and entry[0] is message_template:
+        return entry[1]
+
+    validator = compile_message(message_template)
+
+    validators[id(message_template)] = (message_template, validator)
+
+    return validator
+
+
+def compile_requests():
+    """
+    Compile the validators of all the templates defined in rest/requests.py
+    """
+    for name, value in vars(requests).iteritems():
+        if not name.startswith('_') and isinstance(value, (dict, list)):
+            get_validator(value)
+
+
+compile_requests()
@@ -13,6 +13,7 @@ from globaleaks.jobs import jobs_list
 from globaleaks.jobs.base import GLJob, GLJobsMonitor
 
 from globaleaks.settings import GLSettings
+from globaleaks.utils.assetstore import load_asset_stores
 from globaleaks.utils.utility import log, datetime_now
 
 test_reactor = None
@@ -46,9 +47,20 @@ class GlobaLeaksRunner(UnixApplicationRunner):
             GLSettings.drop_privileges()
             GLSettings.check_directories()
 
+            # the workers are forked before starting the thread pools
+            GLSettings.crypto_pool.start(GLSettings.crypto_pool_size,
+                                         GLSettings.crypto_pool_task_timeout)
+            self._reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.crypto_pool.stop)
+
             GLSettings.orm_tp.start()
             self._reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.orm_tp.stop)
 
+            GLSettings.orm_ro_tp.start()
+            self._reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.orm_ro_tp.stop)
+
+            GLSettings.crypto_tp.start()
+            self._reactor.addSystemEventTrigger('after', 'shutdown', GLSettings.crypto_tp.stop)
+
             if GLSettings.initialize_db:
                 yield init_db()
 
@@ -56,6 +68,8 @@ class GlobaLeaksRunner(UnixApplicationRunner):
 
             yield refresh_memory_variables()
 
+            load_asset_stores()
+
             self.start_asynchronous_jobs()
 
         except Exception as excep:
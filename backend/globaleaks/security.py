@@ -12,6 +12,7 @@ import os
 import random
 import shutil
 import string
+import threading
 import time
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
@@ -20,6 +21,8 @@ from datetime import datetime
 from tempfile import _TemporaryFileWrapper
 
 import scrypt
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThreadPool
 from globaleaks.rest import errors
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log
@@ -213,6 +216,32 @@ class GLSecureTemporaryFile(_TemporaryFileWrapper):
             log.err("Unable to write() in GLSecureTemporaryFile: %s" % wer.message)
             raise wer
 
+    def write_at(self, offset, data):
+        """
+        Write the data at the offset of the plaintext; the counter of the
+        CTR mode is advanced to the block of the offset so that the parts
+        of the file can be written in any order.
+
+        The writes at an offset can't be mixed with the sequential ones.
+        """
+        if self.last_action == 'read':
+            raise Exception("Error: Write call performed after read")
+
+        self.last_action = 'write'
+        try:
+            block, skip = divmod(offset, 16)
+            counter = (int(binascii.hexlify(self.key_counter_nonce), 16) + block) % (1 << 128)
+            counter_nonce = binascii.unhexlify('%032x' % counter)
+
+            encryptor = Cipher(algorithms.AES(self.key), modes.CTR(counter_nonce), backend=crypto_backend).encryptor()
+            encryptor.update('\0' * skip)
+
+            self.file.seek(offset)
+            self.file.write(encryptor.update(data))
+        except Exception as wer:
+            log.err("Unable to write_at() in GLSecureTemporaryFile: %s" % wer.message)
+            raise wer
+
     def close(self):
         if not self.close_called:
             try:
@@ -310,6 +339,22 @@ def directory_traversal_check(trusted_absolute_prefix, untrusted_path):
         raise errors.DirectoryTraversalError
 
 
+def crypto_task(function, *args, **kwargs):
+    """
+    Execute a CPU intensive cryptographic function on the process pool
+    GLSettings.crypto_pool or, when this is disabled, on the dedicated
+    and bounded GLSettings.crypto_tp thread pool.
+
+    The function and its arguments need to be picklable.
+
+    @return: a deferred fired with the result of the function
+    """
+    if GLSettings.crypto_pool.is_running():
+        return GLSettings.crypto_pool.run(function, *args, **kwargs)
+
+    return deferToThreadPool(reactor, GLSettings.crypto_tp, function, *args, **kwargs)
+
+
 def hash_password(password, salt):
     """
     @param password: a password
@@ -351,14 +396,17 @@ class GLBPGP(object):
     I'm not quite confident on creating an object that operates on the filesystem knowing
     that would be run also on the Storm cycle.
     """
-    def __init__(self):
+    def __init__(self, gnupghome=None):
         """
-        every time is needed, a new keyring is created here.
+        every time is needed, a new keyring is created here
+        unless an existing gnupghome is specified.
         """
         try:
-            temp_pgproot = os.path.join(GLSettings.pgproot, "%s" % generateRandomKey(8))
-            os.makedirs(temp_pgproot, mode=0700)
-            self.gnupg = GPG(gnupghome=temp_pgproot, options=['--trust-model', 'always'])
+            if gnupghome is None:
+                gnupghome = os.path.join(GLSettings.pgproot, "%s" % generateRandomKey(8))
+                os.makedirs(gnupghome, mode=0700)
+
+            self.gnupg = GPG(gnupghome=gnupghome, options=['--trust-model', 'always'])
             self.gnupg.encoding = "UTF-8"
         except OSError as ose:
             log.err("Critical, OS error in operating with GnuPG home: %s" % ose)
@@ -404,9 +452,14 @@ class GLBPGP(object):
 
     def encrypt_file(self, key_fingerprint, input_file, output_path):
         """
-        Encrypt a file with the specified PGP key
+        Encrypt a file with the specified PGP key (or list of keys)
         """
-        encrypted_obj = self.gnupg.encrypt_file(input_file, str(key_fingerprint), output=output_path)
+        if isinstance(key_fingerprint, list):
+            recipients = [str(fingerprint) for fingerprint in key_fingerprint]
+        else:
+            recipients = str(key_fingerprint)
+
+        encrypted_obj = self.gnupg.encrypt_file(input_file, recipients, output=output_path)
 
         if not encrypted_obj.ok:
             raise errors.PGPKeyInvalid
@@ -431,6 +484,134 @@ class GLBPGP(object):
             log.err("Unable to clean temporary PGP environment: %s: %s" % (self.gnupg.gnupghome, excep))
 
 
+class GLBPGPKeyring(object):
+    """
+    Persistent keyring shared by delivery and notification.
+
+    Every key is imported only once and tracked by fingerprint together with
+    the sha256 of the public key used for the import; a different public key
+    for the same fingerprint (e.g. a renewed key) causes a new import.
+
+    GnuPG may remove a key while an encryption running in the meantime is
+    using it; the invalidated keys are thus only marked as stale and deleted
+    once no encryption is running. The keyring never waits for the running
+    encryptions.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale_lock = threading.Lock()
+        self.gpob = None
+        self.keys = {}
+        self.stale = set()
+        self.users = 0
+
+    def get_gnupghome(self):
+        return os.path.join(GLSettings.pgproot, 'keyring')
+
+    def _get_gpob(self):
+        gnupghome = self.get_gnupghome()
+
+        # the keyring gets initialized on first use and recreated if
+        # it has been removed (e.g. with the cleaning of the ramdisk)
+        if self.gpob is None or not os.path.isdir(gnupghome):
+            shutil.rmtree(gnupghome, True)
+            os.makedirs(gnupghome, mode=0700)
+            self.gpob = GLBPGP(gnupghome)
+            self.keys = {}
+
+        return self.gpob
+
+    def _delete_stale_keys(self):
+        """
+        Delete the stale keys; to be called while no encryption is running
+        """
+        with self.stale_lock:
+            stale, self.stale = self.stale, set()
+
+        for fingerprint in stale:
+            if self.keys.pop(fingerprint, None) is None:
+                continue
+
+            try:
+                self.gpob.gnupg.delete_keys(str(fingerprint))
+            except Exception as excep:
+                log.err("Unable to remove the PGP key %s from the keyring: %s" % (fingerprint, excep))
+
+    def _load_key(self, key, fingerprint):
+        key_hash = sha256(key.encode('utf-8'))
+
+        gpob = self._get_gpob()
+
+        if not self.users:
+            self._delete_stale_keys()
+
+        if self.keys.get(fingerprint) != key_hash:
+            gpob.load_key(key)
+            self.keys[fingerprint] = key_hash
+
+        return gpob
+
+    def load_key(self, key, fingerprint):
+        """
+        Import the key if not already present in the keyring
+
+        @return: the GLBPGP object operating on the keyring
+        """
+        with self.lock:
+            return self._load_key(key, fingerprint)
+
+    def invalidate(self, fingerprint):
+        """
+        Mark the key with the specified fingerprint as stale; the key is
+        removed from the keyring once no encryption is running.
+        """
+        with self.stale_lock:
+            self.stale.add(fingerprint)
+
+    def _acquire(self, recipients):
+        with self.lock:
+            for key, fingerprint in recipients:
+                gpob = self._load_key(key, fingerprint)
+
+            self.users += 1
+
+        return gpob
+
+    def _release(self):
+        with self.lock:
+            self.users -= 1
+
+            if not self.users:
+                self._delete_stale_keys()
+
+    def encrypt_file(self, key, fingerprint, input_file, output_path):
+        return self.encrypt_file_for_recipients([(key, fingerprint)], input_file, output_path)
+
+    def encrypt_file_for_recipients(self, recipients, input_file, output_path):
+        """
+        Encrypt a file in a single pass for all the recipients
+
+        @param recipients: a list of (key, fingerprint) tuples
+        """
+        gpob = self._acquire(recipients)
+
+        try:
+            return gpob.encrypt_file([fingerprint for _, fingerprint in recipients], input_file, output_path)
+        finally:
+            self._release()
+
+    def encrypt_message(self, key, fingerprint, plaintext):
+        gpob = self._acquire([(key, fingerprint)])
+
+        try:
+            return gpob.encrypt_message(fingerprint, plaintext)
+        finally:
+            self._release()
+
+
+GLKeyring = GLBPGPKeyring()
+
+
 def parse_pgp_key(key):
     """
     Used for parsing a PGP key
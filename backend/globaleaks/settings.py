@@ -7,6 +7,7 @@ import getpass
 import glob
 import grp
 import logging
+import multiprocessing
 import os
 import pwd
 import re
@@ -18,6 +19,7 @@ from twisted.python.threadpool import ThreadPool
 from cyclone.util import ObjectDict as OD
 
 from globaleaks import __version__, DATABASE_VERSION
+from globaleaks.utils.processpool import ProcessPool
 from globaleaks.utils.singleton import Singleton
 
 this_directory = os.path.dirname(__file__)
@@ -68,6 +70,23 @@ class GLSettingsClass(object):
         # thread pool size of 1
         self.orm_tp = ThreadPool(1, 1)
 
+        # thread pool used by read only transactions
+        self.orm_ro_tp_size = 4
+        self.orm_ro_tp = ThreadPool(1, self.orm_ro_tp_size)
+
+        # bounded thread pool used by CPU intensive cryptographic operations
+        self.crypto_tp_size = 2
+        self.crypto_tp = ThreadPool(1, self.crypto_tp_size)
+
+        # process pool used by CPU intensive cryptographic operations;
+        # when disabled (size 0) the crypto_tp thread pool is used instead
+        self.crypto_pool_size = multiprocessing.cpu_count()
+        self.crypto_pool = ProcessPool()
+
+        # seconds after which the tasks of the process pool not completed
+        # (e.g. due to the death of their worker) are failed
+        self.crypto_pool_task_timeout = 60
+
         self.bind_addresses = '127.0.0.1'
 
         # bind port
@@ -177,6 +196,29 @@ class GLSettingsClass(object):
         # size used while streaming files
         self.file_chunk_size = 65535 # 1MB
 
+        # number of chunks read ahead by a worker thread while streaming
+        self.file_readahead_chunks = 4
+
+        # time after which the chunked uploads not receiving any chunk are
+        # abandoned and their temporary files removed
+        self.upload_session_lifetime = 3600
+
+        # maximum number of chunks of an upload and of the uploads in progress
+        # of a user on the same resource
+        self.upload_chunks_limit = 1024
+        self.upload_sessions_limit = 10
+
+        # number of items above which the collections are encoded in JSON
+        # while being streamed instead of being encoded in memory at once
+        self.json_stream_threshold = 100
+
+        # number of internal files processed in parallel by the delivery
+        self.delivery_concurrency = 4
+
+        # when enabled the delivery encrypts every file once for all the
+        # receivers with a PGP key sharing the resulting file among them
+        self.delivery_multi_recipient_encryption = False
+
         self.AES_key_size = 32
         self.AES_key_id_regexp = u'[A-Za-z0-9]{16}'
         self.AES_counter_nonce = 128 / 8
@@ -197,7 +239,39 @@ class GLSettingsClass(object):
 
         self.mail_counters = {}
         self.mail_timeout = 15 # seconds
-        self.mail_attempts_limit = 3 # per mail limit
+        self.mail_attempts_limit = 10 # per mail limit
+
+        # the failed mails are retried with an exponential backoff
+        self.mail_backoff_min = 60 # seconds
+        self.mail_backoff_max = 3600 # seconds
+
+        # number of parallel SMTP sessions and mails sent per session
+        self.mail_sessions = 2
+        self.mail_session_limit = 50
+
+        # number of compiled notification/export templates kept in memory
+        self.template_cache_size = 256
+
+        # number of localized archived questionnaire schemas kept in memory
+        self.archived_schema_cache_size = 128
+
+        # maximum size of the static files kept in memory and max-age
+        # of the ones named after the hash of their content
+        self.asset_size_limit = 4 * 1024 * 1024 # 4MB
+        self.asset_max_age = 365 * 24 * 3600 # seconds
+
+        # maximum number of tips returned by a page of /receiver/tips
+        self.receiver_tips_page_size_limit = 500
+
+        # default and maximum number of items returned by a page of the
+        # comments, messages and files of a tip
+        self.tip_items_page_size_limit = 100
+
+        # time window in which the delta updates of the tips can be requested
+        # and margin subtracted from the update tokens in order to include the
+        # changes committed after the snapshot read by the previous update
+        self.delta_update_window = 7 * 24 * 3600 # seconds
+        self.delta_update_margin = 60 # seconds
 
     def get_mail_counter(self, receiver_id):
         return self.mail_counters.get(receiver_id, 0)
@@ -325,6 +399,9 @@ class GLSettingsClass(object):
 
         self.side_channels_guard = self.cmdline_options.side_channels_guard / 1000.0
 
+        if self.cmdline_options.crypto_processes is not None:
+            self.crypto_pool_size = self.cmdline_options.crypto_processes
+
         if self.cmdline_options.ramdisk:
             self.ramdisk_path = self.cmdline_options.ramdisk
 
@@ -528,7 +605,7 @@ class GLSettingsClass(object):
 
     @staticmethod
     def make_db_uri(db_file_path):
-        return 'sqlite:' + db_file_path + '?foreign_keys=ON'
+        return 'sqlite:' + db_file_path + '?foreign_keys=ON&journal_mode=WAL'
 
 # GLSettings is a singleton class exported once
 GLSettings = GLSettingsClass()
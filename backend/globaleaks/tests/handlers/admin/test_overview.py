@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 import json
 
+from twisted.internet import reactor, task
 from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.handlers.admin import overview
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.rest import requests
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -28,6 +30,28 @@ class TestTipsOverviewDesc(helpers.TestHandlerWithPopulatedDB):
         self.assertEqual(len(self.responses[0]), self.population_of_submissions)
         self._handler.validate_message(json.dumps(self.responses[0]), requests.TipsOverviewDesc)
 
+    @inlineCallbacks
+    def test_get_stream(self):
+        self.patch(GLSettings, 'json_stream_threshold', 0)
+
+        chunks = []
+
+        handler = self.request({}, role='admin')
+        handler.write = chunks.append
+        handler.flush = lambda: None
+        yield handler.get()
+
+        self.assertEqual(handler._headers['Content-Type'], 'application/json')
+
+        producer = handler.request.connection.transport.producer
+        while producer.handler is not None:
+            producer.resumeProducing()
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        tips = json.loads(''.join(chunks))
+        self.assertEqual(len(tips), self.population_of_submissions)
+        self._handler.validate_message(json.dumps(tips), requests.TipsOverviewDesc)
+
 
 class TestFilesOverviewDesc(helpers.TestHandlerWithPopulatedDB):
     _handler = overview.Files
@@ -123,3 +123,19 @@ class TestRecentEventsCollection(helpers.TestHandler):
 
         for k in anomaly.ANOMALY_MAP.keys():
             self.assertTrue(k in self.responses[1])
+
+
+class TestMetricsCollection(helpers.TestHandler):
+    _handler = statistics.MetricsCollection
+
+    @inlineCallbacks
+    def test_get(self):
+        handler = self.request({}, role='admin')
+
+        yield handler.get()
+
+        for k in ['size', 'queued', 'completed', 'failed', 'latency_avg', 'latency_max']:
+            self.assertTrue(k in self.responses[0]['crypto_pool'])
+
+        for k in ['opened', 'reused']:
+            self.assertTrue(k in self.responses[0]['store_pool'])
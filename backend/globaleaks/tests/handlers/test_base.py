@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 import json
+import os
+from twisted.internet import reactor, task
 from twisted.internet.defer import inlineCallbacks
 
 from cyclone.web import HTTPError, HTTPAuthenticationRequired
-from globaleaks.handlers.base import GLSession, GLSessions, BaseHandler, BaseStaticFileHandler, TimingStatsHandler
+from globaleaks.handlers.base import GLSession, GLSessions, BaseHandler, BaseStaticFileHandler, JSONStreamProducer, \
+    StaticFileProducer, TimingStatsHandler
+from globaleaks.rest import requests, validators
 from globaleaks.rest.errors import InvalidInputFormat
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
@@ -127,6 +131,33 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
         self.assertRaises(InvalidInputFormat,
                           BaseHandler.validate_jmessage, dummy_message, dummy_message_template)
 
+    def test_validate_jmessage_strip_unknown_keys(self):
+        dummy_message = {'spam': u'ham', 'nest': [{'spam': u'ham', 'eggs': 1}], 'eggs': 1}
+        dummy_message_template = {'spam': unicode, 'nest': [{'spam': unicode}]}
+
+        self.assertTrue(BaseHandler.validate_jmessage(dummy_message, dummy_message_template))
+        self.assertEqual(dummy_message, {'spam': u'ham', 'nest': [{'spam': u'ham'}]})
+
+    def test_validate_jmessage_errors(self):
+        dummy_message_template = {'id': requests.uuid_regexp, 'name': unicode}
+
+        # the invalid keys are reported before the missing ones
+        e = self.assertRaises(InvalidInputFormat,
+                              BaseHandler.validate_jmessage, {'id': u'x'}, dummy_message_template)
+        self.assertEqual(e.arguments, ['Key (id) type validation failure'])
+
+        e = self.assertRaises(InvalidInputFormat,
+                              BaseHandler.validate_jmessage, {'name': u'x'}, dummy_message_template)
+        self.assertEqual(e.arguments, ['Missing key id'])
+
+        e = self.assertRaises(InvalidInputFormat,
+                              BaseHandler.validate_jmessage, [1], [unicode])
+        self.assertTrue(e.arguments[0].startswith('Not every element'))
+
+    def test_validators_compiled_at_startup(self):
+        for template in [requests.SubmissionDesc, requests.AdminContextDesc, requests.TipsOverviewDesc]:
+            self.assertTrue(validators.validators[id(template)][0] is template)
+
     def test_validate_message_valid(self):
         dummy_json = json.dumps({'spam': 'ham'})
         dummy_message_template = {'spam': unicode}
@@ -174,6 +205,20 @@ class TestBaseHandler(helpers.TestHandlerWithPopulatedDB):
         self.assertFalse(BaseHandler.validate_host("invalid.onion"))
         self.assertFalse(BaseHandler.validate_host("invalid.onion:12345"))  # gabanbus i miss you!
 
+    def test_get_byte_range(self):
+        def get_byte_range(header, size):
+            return self.request(headers={'Range': header}).get_byte_range(size, '"etag"')
+
+        self.assertEqual(get_byte_range('bytes=10-', 100), (10, 99))
+        self.assertEqual(get_byte_range('bytes=10-200', 100), (10, 99))
+        self.assertEqual(get_byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(get_byte_range('bytes=100-', 100), False)
+        self.assertEqual(get_byte_range('bytes=-0', 100), False)
+
+        # no range of an empty content is satisfiable
+        self.assertEqual(get_byte_range('bytes=0-', 0), False)
+        self.assertEqual(get_byte_range('bytes=-10', 0), False)
+
 
 class TestBaseStaticFileHandler(helpers.TestHandler):
     _handler = BaseStaticFileHandler
@@ -188,6 +233,125 @@ class TestBaseStaticFileHandler(helpers.TestHandler):
         handler = self.request(kwargs={'path': GLSettings.client_path})
         self.assertRaises(HTTPError, handler.get, 'unexistent')
 
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request(kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        etag = handler._headers['Etag']
+        last_modified = handler._headers['Last-Modified']
+
+        handler = self.request(headers={'If-None-Match': etag}, kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        self.assertEqual(handler.get_status(), 304)
+
+        handler = self.request(headers={'If-Modified-Since': last_modified}, kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        self.assertEqual(handler.get_status(), 304)
+
+        handler = self.request(headers={'If-None-Match': '"outdated"'}, kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        self.assertEqual(handler.get_status(), 200)
+
+    @inlineCallbacks
+    def test_get_gzip(self):
+        handler = self.request(headers={'Accept-Encoding': 'gzip'}, kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+
+        # the gzip variant has its own ETag
+        etag = handler._headers['Etag']
+        self.assertTrue(etag.endswith('-gzip"'))
+
+        handler = self.request(headers={'If-None-Match': etag}, kwargs={'path': GLSettings.client_path})
+        yield handler.get('')
+        self.assertEqual(handler.get_status(), 200)
+
+
+class TestStaticFileProducer(helpers.TestHandler):
+    _handler = BaseHandlerMock
+
+    @inlineCallbacks
+    def test_stream(self):
+        data = os.urandom(GLSettings.file_chunk_size * 10 + 1)
+        path = os.path.join(GLSettings.tmp_upload_path, 'stream')
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        handler = self.request()
+        handler.flush = lambda: None
+        producer = StaticFileProducer(handler, open(path, 'rb'))
+        producer.start()
+
+        # the chunks are read ahead without waiting for the transport
+        while producer.reading:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        self.assertEqual(len(producer.buffer), GLSettings.file_readahead_chunks)
+
+        while producer.handler is not None:
+            producer.resumeProducing()
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        self.assertEqual(''.join(self.responses), data)
+        self.assertTrue(producer.fileObject.closed)
+
+    @inlineCallbacks
+    def test_stream_read_failure(self):
+        class FailingFile(object):
+            closed = False
+
+            def read(self, size):
+                raise IOError("read failure")
+
+            def close(self):
+                self.closed = True
+
+        handler = self.request()
+        producer = StaticFileProducer(handler, FailingFile())
+        producer.start()
+
+        while producer.reading:
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        # the truncated response is not finished but aborted
+        self.assertTrue(handler.request.connection.transport.disconnecting)
+        self.assertFalse(handler._finished)
+        self.assertIsNone(producer.handler)
+        self.assertTrue(producer.fileObject.closed)
+
+
+class TestJSONStreamProducer(helpers.TestHandler):
+    _handler = BaseHandlerMock
+
+    @inlineCallbacks
+    def stream(self, items):
+        self.responses = []
+
+        handler = self.request()
+        handler.flush = lambda: None
+        producer = JSONStreamProducer(handler, items)
+        producer.start()
+
+        while producer.handler is not None:
+            producer.resumeProducing()
+            yield task.deferLater(reactor, 0.01, lambda: None)
+
+        self.assertEqual(len(producer.items), 0)
+
+    @inlineCallbacks
+    def test_stream(self):
+        items = [{'id': i, 'text': u'\u00e8</script>' * 100} for i in range(1000)]
+
+        yield self.stream(list(items))
+
+        # the items are written in chunks of about GLSettings.file_chunk_size
+        self.assertTrue(len(self.responses) > 1)
+        self.assertEqual(json.loads(''.join(self.responses)), items)
+
+        yield self.stream([])
+        self.assertEqual(''.join(self.responses), '[]')
+
 
 class TestTimingStats(helpers.TestHandler):
     _handler = TimingStatsHandler
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import Deferred, inlineCallbacks
 
 from globaleaks.orm import transact
 from globaleaks.rest.apicache import GLApiCache
@@ -26,25 +26,72 @@ class TestGLApiCache(helpers.TestGL):
         self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
         self.assertTrue("it" in GLApiCache.memory_cache_dict['passante_di_professione'])
         self.assertTrue("en" in GLApiCache.memory_cache_dict['passante_di_professione'])
-        self.assertEqual(pdp_it, "come una catapulta!")
-        self.assertEqual(pdp_en, "like a catapult!")
+        self.assertEqual(pdp_it.body, '"come una catapulta!"')
+        self.assertEqual(pdp_en.body, '"like a catapult!"')
+        self.assertNotEqual(pdp_it.etag, pdp_en.etag)
 
     @inlineCallbacks
     def test_set(self):
         self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
         pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
         self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        self.assertTrue(pdp_it == "come una catapulta!")
+        self.assertEqual(pdp_it.body, '"come una catapulta!"')
         yield GLApiCache.set("passante_di_professione", "it", "ma io ho visto tutto!")
         self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
         pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "already", "cached")
-        self.assertEqual(pdp_it, "ma io ho visto tutto!")
+        self.assertEqual(pdp_it.body, '"ma io ho visto tutto!"')
 
     @inlineCallbacks
     def test_invalidate(self):
         self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
         pdp_it = yield GLApiCache.get("passante_di_professione", "it", self.mario, "come", "una", "catapulta!")
         self.assertTrue("passante_di_professione" in GLApiCache.memory_cache_dict)
-        self.assertEqual(pdp_it, "come una catapulta!")
+        self.assertEqual(pdp_it.body, '"come una catapulta!"')
         yield GLApiCache.invalidate("passante_di_professione")
         self.assertTrue("passante_di_professione" not in GLApiCache.memory_cache_dict)
+
+    @inlineCallbacks
+    def test_invalidate_all_during_get(self):
+        d = Deferred()
+
+        # a resource never invalidated before
+        entry_d = GLApiCache.get('passante_di_professione', 'it', lambda: d)
+
+        GLApiCache.invalidate()
+        d.callback(u'come una catapulta!')
+
+        entry = yield entry_d
+        self.assertEqual(entry.body, '"come una catapulta!"')
+
+        # the value generated before the invalidation is not cached
+        self.assertTrue('passante_di_professione' not in GLApiCache.memory_cache_dict)
+
+    @inlineCallbacks
+    def test_update(self):
+        values = {'it': u'come una catapulta!'}
+
+        @transact
+        def get_value(store, language):
+            return values.get(language, u'')
+
+        GLApiCache.register('passante_di_professione', get_value, ['node'])
+        self.addCleanup(GLApiCache.resources.pop, 'passante_di_professione')
+
+        pdp_it = yield GLApiCache.get('passante_di_professione', 'it', get_value, 'it')
+        self.assertEqual(pdp_it.body, '"come una catapulta!"')
+
+        values['it'] = u'ma io ho visto tutto!'
+
+        # the resources not depending on the data updated are preserved
+        GLApiCache.update('l10n')
+        self.assertTrue('passante_di_professione' in GLApiCache.memory_cache_dict)
+
+        # the resources depending on the data updated are regenerated in background
+        GLApiCache.update('node')
+        self.assertTrue('passante_di_professione' not in GLApiCache.memory_cache_dict)
+
+        pdp_it = yield GLApiCache.get('passante_di_professione', 'it', self.mario, 'already', 'cached')
+        self.assertEqual(pdp_it.body, '"ma io ho visto tutto!"')
+
+        yield GLApiCache.wait_refreshes()
+        self.assertEqual(GLApiCache.memory_cache_dict['passante_di_professione'].keys(), ['it'])
@@ -37,3 +37,26 @@ class TestExportHandler(helpers.TestHandlerWithPopulatedDB):
         handler.flush = flush_mock
 
         yield handler.get(rtips_desc[0]['id'])
+
+    @inlineCallbacks
+    def test_export_range(self):
+        rtips_desc = yield self.get_rtips()
+
+        handler = self.request({}, role='receiver')
+        handler.current_user.user_id = rtips_desc[0]['receiver_id']
+        handler.flush = lambda: None
+
+        yield handler.get(rtips_desc[0]['id'])
+        self.assertEqual(handler.get_status(), 200)
+        etag = handler._headers['Etag']
+        size = int(handler._headers['Content-Length'])
+
+        # the archive is the same until the tip changes
+        handler = self.request({}, role='receiver', headers={'Range': 'bytes=100-', 'If-Range': etag})
+        handler.current_user.user_id = rtips_desc[0]['receiver_id']
+        handler.flush = lambda: None
+
+        yield handler.get(rtips_desc[0]['id'])
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(handler._headers['Etag'], etag)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes 100-%d/%d' % (size - 1, size))
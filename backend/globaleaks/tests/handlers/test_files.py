@@ -6,6 +6,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.handlers import files
 from globaleaks.rest import errors
+from globaleaks.security import GLSecureFile
 from globaleaks.tests import helpers
 from globaleaks.utils import token
 
@@ -40,6 +41,59 @@ class TestFileInstance(helpers.TestHandlerWithPopulatedDB):
         for f in self.dummyToken.uploaded_files:
             yield self.assertFalse(os.path.exists(f['path']))
 
+    def chunk_request(self, data, number):
+        handler = self.request(attached_file={
+            'body': data[(number - 1) * 300:number * 300],
+            'filename': 'file.bin',
+            'content_type': 'application/octet-stream'
+        })
+
+        handler.request.arguments = {
+            'flowIdentifier': ['identifier'],
+            'flowChunkNumber': [str(number)],
+            'flowTotalChunks': ['4'],
+            'flowChunkSize': ['300'],
+            'flowTotalSize': [str(len(data))]
+        }
+
+        return handler
+
+    @inlineCallbacks
+    def test_post_chunks_out_of_order(self):
+        self.patch(files.FileInstance, 'get_file_upload', helpers.base_get_file_upload)
+
+        self.dummyToken = token.Token(token_kind='submission')
+        self.dummyToken.proof_of_work = False
+
+        data = os.urandom(1000)
+
+        for number in [2, 4, 4]:
+            yield self.chunk_request(data, number).post(self.dummyToken.id)
+
+        # the missing chunks are reported to the clients resuming the upload
+        handler = self.chunk_request(data, 2)
+        yield handler.get(self.dummyToken.id)
+        self.assertEqual(handler.get_status(), 200)
+
+        handler = self.chunk_request(data, 3)
+        yield handler.get(self.dummyToken.id)
+        self.assertEqual(handler.get_status(), 204)
+
+        handler = self.chunk_request(data, 1)
+        del handler.request.arguments['flowChunkNumber']
+        yield handler.get(self.dummyToken.id)
+        self.assertEqual(self.responses[0], {'total_chunks': 4, 'missing_chunks': [[1, 1], [3, 3]]})
+
+        for number in [3, 1]:
+            yield self.chunk_request(data, number).post(self.dummyToken.id)
+
+        self.assertEqual(len(self.dummyToken.uploaded_files), 1)
+        self.assertEqual(GLSecureFile(self.dummyToken.uploaded_files[0]['path']).read(), data)
+
+        handler = self.chunk_request(data, 1)
+        del handler.request.arguments['flowChunkNumber']
+        self.assertRaises(errors.FileIdNotFound, handler.get, self.dummyToken.id)
+
     @inlineCallbacks
     def test_post_file_finalized_submission(self):
         yield self.perform_full_submission_actions()
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
+import gzip
 import json
+from StringIO import StringIO
 
+from storm import tracer
 from twisted.internet.defer import inlineCallbacks
+from globaleaks import models
+from globaleaks.orm import transact
 from globaleaks.rest import requests
 from globaleaks.tests import helpers
 from globaleaks.handlers import admin, public
@@ -9,6 +14,14 @@ from globaleaks.models import config
 from globaleaks.settings import GLSettings
 
 
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def connection_raw_execute(self, connection, raw_cursor, statement, params):
+        self.count += 1
+
+
 class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
     _handler = public.PublicResource
 
@@ -19,3 +32,84 @@ class TestPublicResource(helpers.TestHandlerWithPopulatedDB):
 
         resp_desc = self.ss_serial_desc(config.NodeFactory.public_node, requests.PublicResourcesDesc)
         self._handler.validate_message(json.dumps(self.responses[0]), resp_desc)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        handler = self.request()
+        yield handler.get()
+
+        etag = handler._headers['Etag']
+
+        handler = self.request(headers={'If-None-Match': etag})
+        yield handler.get()
+
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(len(self.responses), 1)
+
+    @inlineCallbacks
+    def test_get_gzip(self):
+        handler = self.request()
+        yield handler.get()
+
+        handler = self.request(headers={'Accept-Encoding': 'gzip, deflate'})
+        yield handler.get()
+
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+
+        body = gzip.GzipFile(fileobj=StringIO(self.responses[1])).read()
+        self.assertEqual(json.loads(body), self.responses[0])
+
+    @inlineCallbacks
+    def test_get_gzip_etag(self):
+        handler = self.request()
+        yield handler.get()
+        etag = handler._headers['Etag']
+        self.assertEqual(handler._headers['Vary'], 'Accept-Encoding')
+
+        handler = self.request(headers={'Accept-Encoding': 'gzip'})
+        yield handler.get()
+        gzip_etag = handler._headers['Etag']
+        self.assertNotEqual(gzip_etag, etag)
+
+        # the ETag of a variant does not validate the other one
+        handler = self.request(headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        yield handler.get()
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual(handler._headers['Content-Encoding'], 'gzip')
+
+        handler = self.request(headers={'If-None-Match': gzip_etag})
+        yield handler.get()
+        self.assertEqual(handler.get_status(), 200)
+
+        handler = self.request(headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag})
+        yield handler.get()
+        self.assertEqual(handler.get_status(), 304)
+
+    @transact
+    def count_context_list_queries(self, store):
+        counter = QueryCounter()
+        tracer.install_tracer(counter)
+        try:
+            public.db_get_public_context_list(store, 'en')
+        finally:
+            tracer.remove_tracer_type(QueryCounter)
+
+        return counter.count
+
+    @transact
+    def get_step_id(self, store):
+        return store.find(models.Step).any().id
+
+    @inlineCallbacks
+    def test_get_context_list_queries(self):
+        count = yield self.count_context_list_queries()
+
+        step_id = yield self.get_step_id()
+        for _ in range(5):
+            field = helpers.get_dummy_field()
+            field['instance'] = 'instance'
+            field['step_id'] = step_id
+            yield admin.field.create_field(field, 'en')
+
+        # the questionnaires are loaded with a fixed number of queries
+        self.assertEqual((yield self.count_context_list_queries()), count)
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 from twisted.internet.defer import inlineCallbacks
 
-from globaleaks.handlers import receiver, admin
+from globaleaks import models
+from globaleaks.handlers import receiver, admin, rtip
+from globaleaks.orm import transact_ro
+from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
 
@@ -39,6 +43,121 @@ class TestTipsCollection(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
         yield handler.get()
 
+    @transact_ro
+    def get_counters(self, store, rtip_id):
+        rtip = store.find(models.ReceiverTip, models.ReceiverTip.id == rtip_id).one()
+
+        return {
+            'file_counter': rtip.internaltip.internalfiles.count(),
+            'comment_counter': rtip.internaltip.comments.count(),
+            'message_counter': rtip.messages.count()
+        }
+
+    @inlineCallbacks
+    def test_get_counters(self):
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        yield handler.get()
+
+        self.assertTrue(len(self.responses[0]))
+
+        for rtip in self.responses[0]:
+            counters = yield self.get_counters(rtip['id'])
+            self.assertTrue(counters['file_counter'] > 0)
+            self.assertTrue(counters['comment_counter'] > 0)
+            self.assertTrue(counters['message_counter'] > 0)
+
+            for key, value in counters.iteritems():
+                self.assertEqual(rtip[key], value)
+
+    def get_tips(self, **arguments):
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        handler.request.arguments = dict((k, v if isinstance(v, list) else [v]) for k, v in arguments.iteritems())
+
+        d = handler.get()
+        # the empty lists are not collected by the mocked write
+        d.addCallback(lambda _: (self.responses.pop() if self.responses else [],
+                                 handler._headers.get('X-Next-Cursor')))
+        return d
+
+    @inlineCallbacks
+    def test_get_pages(self):
+        tips, cursor = yield self.get_tips(sort='creation_date')
+        self.assertEqual(cursor, None)
+        self.assertTrue(len(tips) > 1)
+
+        ids = []
+        cursor = None
+        while True:
+            arguments = {'limit': '1', 'sort': 'creation_date'}
+            if cursor is not None:
+                arguments['cursor'] = cursor
+
+            page, cursor = yield self.get_tips(**arguments)
+            ids.extend(tip['id'] for tip in page)
+
+            if cursor is None:
+                break
+
+        self.assertEqual(ids, [tip['id'] for tip in tips])
+
+    @inlineCallbacks
+    def test_get_sorted(self):
+        tips, _ = yield self.get_tips(sort='-creation_date')
+        dates = [tip['creation_date'] for tip in tips]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+        tips, _ = yield self.get_tips(sort='score')
+        scores = [tip['total_score'] for tip in tips]
+        self.assertEqual(scores, sorted(scores))
+
+    @inlineCallbacks
+    def test_get_filtered(self):
+        tips, _ = yield self.get_tips()
+
+        filtered, _ = yield self.get_tips(context=self.dummyContext['id'], new='true')
+        self.assertEqual(len(filtered), len(tips))
+
+        filtered, _ = yield self.get_tips(context='unexistent')
+        self.assertEqual(filtered, [])
+
+        filtered, _ = yield self.get_tips(new='false')
+        self.assertEqual(filtered, [])
+
+        filtered, _ = yield self.get_tips(label='unexistent')
+        self.assertEqual(filtered, [])
+
+        filtered, _ = yield self.get_tips(**{'from': tips[-1]['creation_date'],
+                                             'to': '2100-01-01T00:00:00Z'})
+        self.assertTrue(0 < len(filtered) <= len(tips))
+
+    @inlineCallbacks
+    def test_get_delta(self):
+        self.patch(GLSettings, 'delta_update_margin', 0)
+
+        tips, _ = yield self.get_tips()
+        handler = self.request(user_id=self.dummyReceiver_1['id'], role='receiver')
+        yield handler.get()
+        token = handler._headers['X-Update-Token']
+
+        delta, _ = yield self.get_tips(since=token)
+        self.assertEqual(delta, {'tips': [], 'deleted': [], 'reset': False})
+
+        yield rtip.set_receivertip_variable(self.dummyReceiver_1['id'], tips[0]['id'], 'label', u'changed')
+        yield receiver.perform_tips_operation(self.dummyReceiver_1['id'], 'delete', [tips[1]['id']])
+
+        delta, _ = yield self.get_tips(since=token)
+        self.assertEqual([tip['id'] for tip in delta['tips']], [tips[0]['id']])
+        self.assertEqual(delta['tips'][0]['label'], u'changed')
+        self.assertEqual(delta['deleted'], [tips[1]['id']])
+
+    @inlineCallbacks
+    def test_get_invalid_query(self):
+        for arguments in [{'limit': '0'}, {'limit': 'x'}, {'sort': 'unexistent'},
+                          {'new': 'x'}, {'from': 'x'}, {'cursor': 'unexistent'},
+                          {'since': 'x'}]:
+            yield self.assertFailure(self.get_tips(**arguments), errors.InvalidInputFormat)
+
+
 
 class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
     _handler = receiver.TipsOperations
@@ -53,7 +172,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         for _ in xrange(3):
             yield self.perform_full_submission_actions()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
         rtips_ids = [rtip['id'] for rtip in rtips]
 
         postpone_map = {}
@@ -68,7 +187,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(data_request, user_id = self.dummyReceiver_1['id'], role='receiver')
         yield handler.put()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
 
         for rtip in rtips:
             self.assertNotEqual(postpone_map[rtip['id']], rtip['expiration_date'])
@@ -80,7 +199,7 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
 
         handler = self.request(user_id = self.dummyReceiver_1['id'], role='receiver')
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
         rtips_ids = [rtip['id'] for rtip in rtips]
 
         data_request = {
@@ -91,6 +210,6 @@ class TestTipsOperations(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(data_request, user_id = self.dummyReceiver_1['id'], role='receiver')
         yield handler.put()
 
-        rtips = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
+        rtips, _ = yield receiver.get_receivertip_list(self.dummyReceiver_1['id'], 'en')
 
         self.assertEqual(len(rtips), 0)
@@ -1,16 +1,41 @@
 # -*- coding: utf-8 -*-
 import json
+import os
 
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, returnValue
 
 from globaleaks import models
 from globaleaks.jobs.delivery_sched import DeliverySchedule
+from globaleaks.orm import transact
 from globaleaks.rest import errors
 from globaleaks.tests import helpers
 from globaleaks.handlers import rtip
+from globaleaks.handlers.admin import context
 from globaleaks.settings import GLSettings
 
 
+@inlineCallbacks
+def get_all_pages(test, rtip_desc, limit):
+    items, cursor = [], None
+
+    while True:
+        handler = test.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'limit': [str(limit)]}
+        if cursor is not None:
+            handler.request.arguments['cursor'] = [cursor]
+
+        yield handler.get(rtip_desc['id'])
+
+        # the empty pages are not collected by the mocked write
+        page = test.responses.pop() if test.responses else []
+        test.assertTrue(len(page) <= limit)
+        items.extend(page)
+
+        cursor = handler._headers.get('X-Next-Cursor')
+        if cursor is None:
+            returnValue(items)
+
+
 class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.RTipInstance
 
@@ -27,6 +52,131 @@ class TestRTipInstance(helpers.TestHandlerWithPopulatedDB):
 
             yield handler.get(rtip_desc['id'])
 
+    @inlineCallbacks
+    def test_get_delta(self):
+        self.patch(GLSettings, 'delta_update_margin', 0)
+
+        rtip_desc = (yield self.get_rtips())[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        yield handler.get(rtip_desc['id'])
+        token = handler._headers['X-Update-Token']
+        self.assertTrue('questionnaire' in self.responses[-1])
+
+        yield rtip.create_comment(rtip_desc['receiver_id'], rtip_desc['id'], {'content': u'delta'})
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'since': [token]}
+        yield handler.get(rtip_desc['id'])
+
+        delta = self.responses[-1]
+        self.assertEqual([c['content'] for c in delta['comments']], [u'delta'])
+        self.assertEqual(delta['messages'], [])
+        self.assertEqual(delta['deleted'], {'wbfiles': []})
+        self.assertFalse(delta['reset'])
+        self.assertFalse('questionnaire' in delta)
+        self.assertTrue(handler._headers['X-Update-Token'] > token)
+
+        # the tokens older than the delta update window require a full update
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'since': ['2000-01-01T00:00:00.000000Z']}
+        yield handler.get(rtip_desc['id'])
+        self.assertTrue(self.responses[-1]['reset'])
+        self.assertTrue('questionnaire' in self.responses[-1])
+        self.assertTrue(len(self.responses[-1]['comments']) > 1)
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'since': ['invalid']}
+        yield self.assertFailure(handler.get(rtip_desc['id']), errors.InvalidInputFormat)
+
+    @inlineCallbacks
+    def test_get_without_embedded_lists(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'embed': ['false']}
+        yield handler.get(rtip_desc['id'])
+
+        for key in ['comments', 'messages', 'rfiles']:
+            self.assertFalse(key in self.responses[-1])
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        handler.request.arguments = {'embed': ['x']}
+        yield self.assertFailure(handler.get(rtip_desc['id']), errors.InvalidInputFormat)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+        yield handler.get(rtip_desc['id'])
+        etag = handler._headers['Etag']
+
+        responses = len(self.responses)
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'If-None-Match': etag})
+        yield handler.get(rtip_desc['id'])
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(len(self.responses), responses)
+
+        yield rtip.set_receivertip_variable(rtip_desc['receiver_id'], rtip_desc['id'], 'label', u'changed')
+
+        handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                               headers={'If-None-Match': etag})
+        yield handler.get(rtip_desc['id'])
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual(self.responses[-1]['label'], u'changed')
+        self.assertNotEqual(handler._headers['Etag'], etag)
+
+    @inlineCallbacks
+    def test_get_not_modified_accesses_and_downloads(self):
+        yield DeliverySchedule().run()
+
+        rtips_desc = yield self.get_rtips()
+        rtip_desc = rtips_desc[0]
+        other_desc = [x for x in rtips_desc if x['internaltip_id'] == rtip_desc['internaltip_id'] and
+                                               x['id'] != rtip_desc['id']][0]
+
+        @inlineCallbacks
+        def get(etag):
+            handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'],
+                                   headers={'If-None-Match': etag})
+            yield handler.get(rtip_desc['id'])
+            returnValue(handler)
+
+        handler = yield get('')
+        etag = handler._headers['Etag']
+
+        # the revalidations are not tracked as accesses
+        handler = yield get(etag)
+        self.assertEqual(handler.get_status(), 304)
+
+        handler = yield get(etag)
+        self.assertEqual(handler.get_status(), 304)
+
+        # the accesses of the other receivers are part of the view
+        yield rtip.track_rtip_access(other_desc['receiver_id'], other_desc['id'])
+
+        handler = yield get(etag)
+        self.assertEqual(handler.get_status(), 200)
+        etag = handler._headers['Etag']
+
+        # as the downloads of the files
+        rfile_id = (yield self.get_rfiles(rtip_desc['id']))[0]['id']
+        self._handler = rtip.ReceiverFileDownload
+        yield self.request(role='receiver', user_id=rtip_desc['receiver_id']).download_rfile(rtip_desc['receiver_id'], rfile_id)
+        self._handler = rtip.RTipInstance
+
+        handler = yield get(etag)
+        self.assertEqual(handler.get_status(), 200)
+        etag = handler._headers['Etag']
+
+        # and the settings of the context
+        yield context.update_context(self.dummyContext['id'], self.dummyContext, 'en')
+
+        handler = yield get(etag)
+        self.assertEqual(handler.get_status(), 200)
+
     @inlineCallbacks
     def test_put_postpone(self):
         rtips_desc = yield self.get_rtips()
@@ -200,6 +350,31 @@ class TestRTipCommentCollection(helpers.TestHandlerWithPopulatedDB):
         yield helpers.TestHandlerWithPopulatedDB.setUp(self)
         yield self.perform_full_submission_actions()
 
+    @inlineCallbacks
+    def test_get(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        for i in range(5):
+            yield rtip.create_comment(rtip_desc['receiver_id'], rtip_desc['id'], {'content': u'%d' % i})
+
+        expected = (yield rtip.get_rtip(rtip_desc['receiver_id'], rtip_desc['id'], 'en'))['comments']
+
+        comments = yield get_all_pages(self, rtip_desc, 2)
+
+        self.assertEqual(sorted(c['id'] for c in comments), sorted(c['id'] for c in expected))
+
+        dates = [c['creation_date'] for c in comments]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    @inlineCallbacks
+    def test_get_invalid_query(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        for arguments in [{'limit': ['0']}, {'limit': ['x']}, {'cursor': ['unexistent']}]:
+            handler = self.request(role='receiver', user_id=rtip_desc['receiver_id'])
+            handler.request.arguments = arguments
+            yield self.assertFailure(handler.get(rtip_desc['id']), errors.InvalidInputFormat)
+
     @inlineCallbacks
     def test_post(self):
         body = {
@@ -221,6 +396,19 @@ class TestReceiverMsgCollection(helpers.TestHandlerWithPopulatedDB):
         yield helpers.TestHandlerWithPopulatedDB.setUp(self)
         yield self.perform_full_submission_actions()
 
+    @inlineCallbacks
+    def test_get(self):
+        rtip_desc = (yield self.get_rtips())[0]
+
+        for i in range(3):
+            yield rtip.create_message(rtip_desc['receiver_id'], rtip_desc['id'], {'content': u'%d' % i})
+
+        expected = (yield rtip.get_rtip(rtip_desc['receiver_id'], rtip_desc['id'], 'en'))['messages']
+
+        messages = yield get_all_pages(self, rtip_desc, 1)
+
+        self.assertEqual(sorted(m['id'] for m in messages), sorted(m['id'] for m in expected))
+
     @inlineCallbacks
     def test_post(self):
         body = {
@@ -234,6 +422,22 @@ class TestReceiverMsgCollection(helpers.TestHandlerWithPopulatedDB):
             yield handler.post(rtip_desc['id'])
 
 
+class TestRTipReceiverFileCollection(helpers.TestHandlerWithPopulatedDB):
+    _handler = rtip.RTipReceiverFileCollection
+
+    @inlineCallbacks
+    def test_get(self):
+        yield self.perform_full_submission_actions()
+        yield DeliverySchedule().run()
+
+        rtips_desc = yield self.get_rtips()
+        for rtip_desc in rtips_desc:
+            expected = yield self.get_rfiles(rtip_desc['id'])
+            rfiles = yield get_all_pages(self, rtip_desc, 1)
+
+            self.assertEqual(sorted(f['id'] for f in rfiles), sorted(f['id'] for f in expected))
+
+
 class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.ReceiverFileDownload
 
@@ -249,6 +453,51 @@ class TestReceiverFileDownload(helpers.TestHandlerWithPopulatedDB):
                 handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'])
                 yield handler.get(rfile_desc['id'])
 
+    @transact
+    def get_rfile(self, store, rfile_id):
+        rfile = store.find(models.ReceiverFile, models.ReceiverFile.id == rfile_id).one()
+        return rfile.downloads, os.path.getsize(os.path.join(GLSettings.submission_path, rfile.file_path))
+
+    @inlineCallbacks
+    def test_get_range(self):
+        yield self.perform_minimal_submission()
+        yield DeliverySchedule().run()
+
+        rtip_desc = (yield self.get_rtips())[0]
+        rfile_desc = (yield self.get_rfiles(rtip_desc['id']))[0]
+
+        handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'])
+        yield handler.get(rfile_desc['id'])
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual(handler._headers['Accept-Ranges'], 'bytes')
+        etag = handler._headers['Etag']
+
+        downloads, size = yield self.get_rfile(rfile_desc['id'])
+        self.assertEqual(downloads, 1)
+
+        handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'],
+                               headers={'Range': 'bytes=10-', 'If-Range': etag})
+        yield handler.get(rfile_desc['id'])
+        self.assertEqual(handler.get_status(), 206)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes 10-%d/%d' % (size - 1, size))
+        self.assertEqual(handler._headers['Content-Length'], str(size - 10))
+
+        # the requests resuming a download are not counted
+        downloads, _ = yield self.get_rfile(rfile_desc['id'])
+        self.assertEqual(downloads, 1)
+
+        # the download starts again when the file changed
+        handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'],
+                               headers={'Range': 'bytes=10-', 'If-Range': '"outdated"'})
+        yield handler.get(rfile_desc['id'])
+        self.assertEqual(handler.get_status(), 200)
+
+        handler = self.request(role='receiver', user_id = rtip_desc['receiver_id'],
+                               headers={'Range': 'bytes=%d-' % size})
+        yield handler.get(rfile_desc['id'])
+        self.assertEqual(handler.get_status(), 416)
+        self.assertEqual(handler._headers['Content-Range'], 'bytes */%d' % size)
+
 
 class TestIdentityAccessRequestsCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = rtip.IdentityAccessRequestsCollection
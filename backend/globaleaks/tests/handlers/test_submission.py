@@ -1,11 +1,14 @@
 # -*- encoding: utf-8 -*-
 from twisted.internet.defer import inlineCallbacks, returnValue
 
-from globaleaks.handlers import authentication, wbtip
+from globaleaks import models
+from globaleaks.handlers import authentication, submission, wbtip
 from globaleaks.handlers.submission import SubmissionInstance
 from globaleaks.jobs import delivery_sched
+from globaleaks.orm import transact
 from globaleaks.tests import helpers
 from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
 from globaleaks.utils.token import Token
 
 # and here, our protagonist character:
@@ -155,3 +158,45 @@ class TestSubmissionPlaintextScenario(TestSubmissionEncryptedScenario):
         'encrypted': 0,
         'reference': 6
     }
+
+
+class TestArchivedSchemaCache(helpers.TestGLWithPopulatedDB):
+    @transact
+    def get_schemas(self, store, language):
+        hash = store.find(models.InternalTip).any().questionnaire_hash
+
+        return (submission.db_get_archived_questionnaire_schema(store, hash, language),
+                submission.db_get_archived_preview_schema(store, hash, language))
+
+    @inlineCallbacks
+    def test_get_cached_schemas(self):
+        yield self.perform_minimal_submission()
+
+        submission.archived_schema_cache.invalidate()
+
+        questionnaire, preview = yield self.get_schemas('en')
+        self.assertEqual(len(submission.archived_schema_cache), 2)
+
+        # the localized schemas are shared by the following requests
+        cached_questionnaire, cached_preview = yield self.get_schemas('en')
+        self.assertIs(cached_questionnaire, questionnaire)
+        self.assertIs(cached_preview, preview)
+
+        questionnaire, _ = yield self.get_schemas('it')
+        self.assertIsNot(questionnaire, cached_questionnaire)
+        self.assertEqual(len(submission.archived_schema_cache), 4)
+
+    @inlineCallbacks
+    def test_get_cached_schemas_default_language_change(self):
+        yield self.perform_minimal_submission()
+
+        submission.archived_schema_cache.invalidate()
+
+        questionnaire, _ = yield self.get_schemas('it')
+
+        # the values missing in the requested language depend on the node default language
+        self.patch(GLSettings.memory_copy, 'default_language', 'it')
+
+        cached_questionnaire, _ = yield self.get_schemas('it')
+        self.assertIsNot(cached_questionnaire, questionnaire)
+        self.assertEqual(len(submission.archived_schema_cache), 4)
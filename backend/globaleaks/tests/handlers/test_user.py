@@ -41,6 +41,32 @@ class TestUserInstance(helpers.TestHandlerWithPopulatedDB):
         handler = self.request(self.responses[0], user_id = self.rcvr_id, role='receiver')
         yield handler.put()
 
+    @inlineCallbacks
+    def test_put_change_password(self):
+        handler = self.request(user_id = self.rcvr_id, role='receiver')
+
+        yield handler.get()
+
+        self.responses[0]['old_password'] = helpers.VALID_PASSWORD1
+        self.responses[0]['password'] = helpers.VALID_PASSWORD1 + u'_2'
+
+        handler = self.request(self.responses[0], user_id = self.rcvr_id, role='receiver')
+        yield handler.put()
+
+        self.assertTrue(self.responses[1]['password_change_date'] != self.responses[0]['password_change_date'])
+
+    @inlineCallbacks
+    def test_put_change_password_with_invalid_old_password(self):
+        handler = self.request(user_id = self.rcvr_id, role='receiver')
+
+        yield handler.get()
+
+        self.responses[0]['old_password'] = helpers.INVALID_PASSWORD
+        self.responses[0]['password'] = helpers.VALID_PASSWORD1 + u'_2'
+
+        handler = self.request(self.responses[0], user_id = self.rcvr_id, role='receiver')
+        yield self.assertFailure(handler.put(), errors.InvalidOldPassword)
+
     @inlineCallbacks
     def test_handler_update_key(self):
         handler = self.request(user_id = self.rcvr_id, role='receiver')
@@ -4,6 +4,7 @@ import json
 from twisted.internet.defer import inlineCallbacks
 from globaleaks.tests import helpers
 from globaleaks.handlers import wbtip, rtip
+from globaleaks.settings import GLSettings
 
 
 class TestWBTipInstance(helpers.TestHandlerWithPopulatedDB):
@@ -22,6 +23,58 @@ class TestWBTipInstance(helpers.TestHandlerWithPopulatedDB):
 
             yield handler.get()
 
+    @inlineCallbacks
+    def test_get_delta(self):
+        self.patch(GLSettings, 'delta_update_margin', 0)
+
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        yield handler.get()
+        token = handler._headers['X-Update-Token']
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        handler.request.arguments = {'since': [token]}
+        yield handler.get()
+
+        delta = self.responses[-1]
+        self.assertEqual(delta['comments'], [])
+        self.assertEqual(delta['rfiles'], [])
+        self.assertEqual(delta['wbfiles'], [])
+        self.assertEqual(delta['deleted'], {'wbfiles': []})
+        self.assertFalse('answers' in delta)
+
+        yield wbtip.create_comment(wbtip_desc['id'], {'content': u'delta'})
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        handler.request.arguments = {'since': [token]}
+        yield handler.get()
+
+        delta = self.responses[-1]
+        self.assertEqual([c['content'] for c in delta['comments']], [u'delta'])
+        self.assertTrue('answers' in delta)
+
+    @inlineCallbacks
+    def test_get_not_modified(self):
+        wbtip_desc = (yield self.get_wbtips())[0]
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'])
+        yield handler.get()
+        etag = handler._headers['Etag']
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'],
+                               headers={'If-None-Match': etag})
+        yield handler.get()
+        self.assertEqual(handler.get_status(), 304)
+
+        yield wbtip.create_comment(wbtip_desc['id'], {'content': u'new'})
+
+        handler = self.request(role='whistleblower', user_id=wbtip_desc['id'],
+                               headers={'If-None-Match': etag})
+        yield handler.get()
+        self.assertEqual(handler.get_status(), 200)
+        self.assertNotEqual(handler._headers['Etag'], etag)
+
 class TestWBTipCommentCollection(helpers.TestHandlerWithPopulatedDB):
     _handler = wbtip.WBTipCommentCollection
 
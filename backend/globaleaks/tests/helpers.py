@@ -21,7 +21,7 @@ from twisted.trial import unittest
 from twisted.test import proto_helpers
 from storm.twisted.testing import FakeThreadPool
 
-from globaleaks import db, models, security, event, runner, jobs
+from globaleaks import db, models, orm, security, event, runner, jobs
 from globaleaks.anomaly import Alarm
 from globaleaks.db.appdata import load_appdata
 from globaleaks.orm import transact
@@ -91,10 +91,16 @@ def init_glsettings_for_unit_tests():
     GLSettings.working_path = './working_path'
     GLSettings.ramdisk_path = os.path.join(GLSettings.working_path, 'ramdisk')
 
+    # close the pooled stores before the database files get replaced
+    orm.store_pool.invalidate()
+
     GLSettings.eval_paths()
     GLSettings.remove_directories()
     GLSettings.create_directories()
     GLSettings.orm_tp = FakeThreadPool()
+    GLSettings.orm_ro_tp = FakeThreadPool()
+    GLSettings.crypto_tp = FakeThreadPool()
+    GLSettings.crypto_pool_size = 0
 
     GLSessions.clear()
 
@@ -185,6 +191,9 @@ def get_dummy_file(filename=None, content_type=None, content=None):
 def get_file_upload(self):
     return get_dummy_file()
 
+# kept for the tests of the chunked uploads
+base_get_file_upload = BaseHandler.get_file_upload
+
 BaseHandler.get_file_upload = get_file_upload
 
 
@@ -246,6 +255,9 @@ class TestGL(unittest.TestCase):
     def tearDown(self):
         self.test_reactor.pump(self.call_spigot())
 
+        # wait the refreshes of the cache triggered by the test
+        return GLApiCache.wait_refreshes()
+
     def setUp_dummy(self):
         dummyStuff = MockDict()
 
@@ -719,6 +731,12 @@ class TestHandler(TestGLWithPopulatedDB):
 
         def mock_write(cls, response=None):
             if response:
+                # the responses pre-encoded by the GLApiCache are decoded
+                if isinstance(response, str) and \
+                   cls._headers.get('Content-Type') == 'application/json' and \
+                   cls._headers.get('Content-Encoding') is None:
+                    response = json.loads(response)
+
                 self.responses.append(response)
 
         self._handler.write = mock_write
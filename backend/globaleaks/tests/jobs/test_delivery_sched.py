@@ -0,0 +1,144 @@
+import os
+
+from twisted.internet.defer import inlineCallbacks
+
+from globaleaks import models
+from globaleaks.jobs.delivery_sched import DeliverySchedule, receiverfile_planning
+from globaleaks.orm import transact
+from globaleaks.security import GLBPGP, GLSecureFile
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+
+
+class TestDeliverySchedule(helpers.TestGLWithPopulatedDB):
+    encryption_scenario = 'MIXED'
+
+    @inlineCallbacks
+    def setUp(self):
+        yield helpers.TestGLWithPopulatedDB.setUp(self)
+        yield self.perform_minimal_submission()
+
+    @transact
+    def get_receiverfiles(self, store):
+        return [{
+            'status': rfile.status,
+            'file_path': rfile.file_path,
+            'pgp_key_public': rfile.receivertip.receiver.user.pgp_key_public
+        } for rfile in store.find(models.ReceiverFile)]
+
+    @transact
+    def get_internalfiles_count(self, store, new):
+        return store.find(models.InternalFile, models.InternalFile.new == new).count()
+
+    @inlineCallbacks
+    def test_delivery(self):
+        yield DeliverySchedule().run()
+
+        count = yield self.get_internalfiles_count(True)
+        self.assertEqual(count, 0)
+
+        rfiles = yield self.get_receiverfiles()
+        self.assertEqual(len(rfiles), self.population_of_attachments * 2)
+
+        gpob = GLBPGP()
+
+        try:
+            gpob.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'])
+            gpob.load_key(helpers.PGPKEYS['VALID_PGP_KEY2_PRV'])
+
+            for rfile in rfiles:
+                if rfile['pgp_key_public']:
+                    self.assertEqual(rfile['status'], u'encrypted')
+
+                    path = os.path.join(GLSettings.submission_path, rfile['file_path'])
+                    with open(path, 'rb') as f:
+                        self.assertTrue(gpob.gnupg.decrypt_file(f).ok)
+                else:
+                    self.assertEqual(rfile['status'], u'reference')
+                    self.assertTrue(os.path.exists(rfile['file_path']))
+        finally:
+            gpob.destroy_environment()
+
+    @inlineCallbacks
+    def test_delivery_resumes_interrupted_planning(self):
+        # emulate a delivery interrupted after the planning
+        receiverfile_planning()
+
+        yield DeliverySchedule().run()
+
+        rfiles = yield self.get_receiverfiles()
+        self.assertEqual(len(rfiles), self.population_of_attachments * 2)
+
+        for rfile in rfiles:
+            self.assertTrue(rfile['status'] in [u'encrypted', u'reference'])
+
+    @inlineCallbacks
+    def test_delivery_read_failure(self):
+        read = GLSecureFile.read
+
+        def failing_read(self, c=None):
+            # the first chunk is delivered before the failure
+            if getattr(self, 'failed_reads', 0):
+                raise IOError("Read failure")
+
+            self.failed_reads = 1
+            return read(self, c)
+
+        self.patch(GLSecureFile, 'read', failing_read)
+
+        yield DeliverySchedule().run()
+
+        count = yield self.get_internalfiles_count(True)
+        self.assertEqual(count, self.population_of_attachments)
+
+        rfiles = yield self.get_receiverfiles()
+        for rfile in rfiles:
+            self.assertEqual(rfile['status'], u'processing')
+
+        # neither truncated ciphertexts nor partial plaintexts are left
+        for name in os.listdir(GLSettings.submission_path):
+            self.assertFalse(name.startswith('pgp_encrypted-'))
+            self.assertFalse(name.endswith('.plain'))
+
+
+class TestDeliveryScheduleMultiRecipientEncryption(TestDeliverySchedule):
+    encryption_scenario = 'ENCRYPTED'
+
+    @inlineCallbacks
+    def setUp(self):
+        yield TestDeliverySchedule.setUp(self)
+        GLSettings.delivery_multi_recipient_encryption = True
+
+    def tearDown(self):
+        GLSettings.delivery_multi_recipient_encryption = False
+        return TestDeliverySchedule.tearDown(self)
+
+    @transact
+    def get_receiverfiles_paths(self, store):
+        paths = {}
+        for rfile in store.find(models.ReceiverFile):
+            paths.setdefault(rfile.internalfile_id, set()).add(rfile.file_path)
+
+        return paths
+
+    @inlineCallbacks
+    def test_delivery_shares_encrypted_file(self):
+        yield DeliverySchedule().run()
+
+        paths = yield self.get_receiverfiles_paths()
+
+        self.assertEqual(len(paths), self.population_of_attachments)
+        for ifile_paths in paths.values():
+            self.assertEqual(len(ifile_paths), 1)
+
+        for key in ['VALID_PGP_KEY1_PRV', 'VALID_PGP_KEY2_PRV']:
+            gpob = GLBPGP()
+
+            try:
+                gpob.load_key(helpers.PGPKEYS[key])
+
+                for ifile_paths in paths.values():
+                    with open(list(ifile_paths)[0], 'rb') as f:
+                        self.assertTrue(gpob.gnupg.decrypt_file(f).ok)
+            finally:
+                gpob.destroy_environment()
@@ -1,10 +1,12 @@
 from twisted.internet.defer import inlineCallbacks, fail, succeed
+from twisted.mail.smtp import SMTPDeliveryError
 
 from globaleaks import models
 from globaleaks.orm import transact
 
 from globaleaks.tests import helpers
 
+from globaleaks.jobs import notification_sched
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.jobs.notification_sched import NotificationSchedule, MailGenerator
 
@@ -19,6 +21,24 @@ class TestNotificationSchedule(helpers.TestGLWithPopulatedDB):
     def get_scheduled_email_count(self, store):
         return store.find(models.Mail).count()
 
+    @transact
+    def get_internaltips_count(self, store):
+        return store.find(models.InternalTip).count()
+
+    @inlineCallbacks
+    def test_mail_generator_serializes_each_itip_once(self):
+        yield DeliverySchedule().run()
+
+        generator = MailGenerator()
+        generator.generate()
+
+        # all the receivers of the test population use the same language
+        itips_count = yield self.get_internaltips_count()
+        self.assertEqual(len([key for key in generator.cache if key.startswith('itip-')]), itips_count)
+
+        count = yield self.get_scheduled_email_count()
+        self.assertEqual(count, 40)
+
     @inlineCallbacks
     def test_notification_schedule_success(self):
         count = yield self.get_scheduled_email_count()
@@ -43,18 +63,92 @@ class TestNotificationSchedule(helpers.TestGLWithPopulatedDB):
         notification_schedule = NotificationSchedule()
         notification_schedule.skip_sleep = True
 
-        def sendmail(x, y, z):
-            return fail(True)
+        def sendmails(mails):
+            return succeed({})
 
-        notification_schedule.sendmail = sendmail
+        notification_schedule.sendmails = sendmails
 
         for i in range(0, 10):
+            # emulate the expiration of the backoff
+            notification_sched.mail_retry_time.clear()
+
             yield notification_schedule.run()
 
             count = yield self.get_scheduled_email_count()
             self.assertEqual(count, 40)
 
+        notification_sched.mail_retry_time.clear()
+
         yield notification_schedule.run()
 
         count = yield self.get_scheduled_email_count()
         self.assertEqual(count, 0)
+
+    @transact
+    def get_processing_attempts(self, store):
+        return [mail.processing_attempts for mail in store.find(models.Mail)]
+
+    @inlineCallbacks
+    def test_notification_schedule_backoff(self):
+        yield DeliverySchedule().run()
+
+        notification_schedule = NotificationSchedule()
+        notification_schedule.skip_sleep = True
+
+        spooled = []
+
+        def sendmails(mails):
+            spooled.append(len(mails))
+            return succeed({})
+
+        notification_schedule.sendmails = sendmails
+
+        yield notification_schedule.run()
+        yield notification_schedule.run()
+
+        # the failed mails are not retried before the end of the backoff
+        self.assertEqual(spooled, [40])
+
+        attempts = yield self.get_processing_attempts()
+        self.assertEqual(attempts, [1] * 40)
+
+    @inlineCallbacks
+    def test_notification_schedule_permanent_failure(self):
+        yield DeliverySchedule().run()
+
+        notification_schedule = NotificationSchedule()
+        notification_schedule.skip_sleep = True
+
+        def sendmails(mails):
+            return succeed({mail['id']: SMTPDeliveryError(550, 'No such user', None,
+                                                          [(mail['address'], 550, 'No such user')])
+                            for mail in mails})
+
+        notification_schedule.sendmails = sendmails
+
+        yield notification_schedule.run()
+
+        count = yield self.get_scheduled_email_count()
+        self.assertEqual(count, 0)
+
+    @inlineCallbacks
+    def test_notification_schedule_sender_rejected(self):
+        yield DeliverySchedule().run()
+
+        notification_schedule = NotificationSchedule()
+        notification_schedule.skip_sleep = True
+
+        # the MAIL FROM rejected before any recipient is sent
+        def sendmails(mails):
+            return succeed({mail['id']: SMTPDeliveryError(550, 'Sender rejected', None, [])
+                            for mail in mails})
+
+        notification_schedule.sendmails = sendmails
+
+        yield notification_schedule.run()
+
+        count = yield self.get_scheduled_email_count()
+        self.assertEqual(count, 40)
+
+        attempts = yield self.get_processing_attempts()
+        self.assertEqual(attempts, [1] * 40)
@@ -8,6 +8,7 @@ for each version one an empty and a populated db must be stored in directories:
 
 import os
 import shutil
+import sqlite3
 
 import unittest as pyunit
 from twisted.trial import unittest
@@ -17,7 +18,7 @@ from storm.locals import create_database, Store
 from globaleaks import __version__, DATABASE_VERSION, FIRST_DATABASE_VERSION_SUPPORTED
 
 from globaleaks.db import migration, perform_system_update
-from globaleaks.models import config, config_desc, l10n, Field
+from globaleaks.models import config, config_desc, l10n, Field, User
 from globaleaks.models.l10n import EnabledLanguage, NotificationL10NFactory
 from globaleaks.models.config_desc import GLConfig
 from globaleaks.handlers.admin.field import db_create_field
@@ -243,3 +244,43 @@ class TestMigrationRegression(unittest.TestCase):
         store.close()
 
         shutil.rmtree(GLSettings.db_path)
+
+    def test_migration_with_wal(self):
+        # This test case asserts that the migration of a db left with a non
+        # empty write-ahead log (e.g. after an unclean shutdown) preserves the
+        # transactions kept by the log and removes it
+        self._initStartDB(DATABASE_VERSION - 1)
+        self.store.close()
+
+        snapshot_path = os.path.join(GLSettings.ramdisk_path, 'db_snapshot')
+        os.mkdir(snapshot_path)
+        snapshot_file = os.path.join(snapshot_path, os.path.basename(self.db_file))
+        shutil.copyfile(self.db_file, snapshot_file)
+
+        connection = sqlite3.connect(snapshot_file)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA wal_autocheckpoint=0')
+        connection.execute("UPDATE user SET name = 'WAL' WHERE name = 'Recipient1'")
+        connection.commit()
+
+        # the files are copied while the connection is open as after a crash
+        for suffix in ['', '-wal', '-shm']:
+            shutil.copyfile(snapshot_file + suffix, self.db_file + suffix)
+
+        connection.close()
+        shutil.rmtree(snapshot_path)
+
+        self.assertTrue(os.path.getsize(self.db_file + '-wal') > 0)
+
+        ret = perform_system_update()
+        self.assertNotEqual(ret, -1)
+
+        for suffix in ['', '-wal', '-shm']:
+            self.assertFalse(os.path.exists(self.db_file + suffix))
+
+        final_db_file = os.path.join(GLSettings.db_path, 'glbackend-%d.db' % DATABASE_VERSION)
+        store = Store(create_database(GLSettings.make_db_uri(final_db_file)))
+        self.assertEqual(store.find(User, User.name == u'WAL').count(), 1)
+        store.close()
+
+        shutil.rmtree(GLSettings.db_path)
@@ -2,7 +2,7 @@ from twisted.internet.defer import inlineCallbacks
 
 from globaleaks.tests import helpers
 
-from globaleaks.orm import transact, get_store
+from globaleaks.orm import transact, transact_ro, get_store, store_pool
 from globaleaks.models import *
 from globaleaks.utils.utility import datetime_null
 
@@ -54,6 +54,15 @@ class TestORM(helpers.TestGL):
         self.db_add_receiver(store)
         raise Exception("antani")
 
+    @transact_ro
+    def _transact_ro_count_receivers(self, store):
+        return store.find(Receiver).count()
+
+    @transact_ro
+    def _transact_ro_with_write(self, store):
+        self.db_add_receiver(store)
+        store.flush()
+
     def test_transaction_pragmas(self):
         return self._transaction_pragmas()
 
@@ -84,3 +93,45 @@ class TestORM(helpers.TestGL):
             self.assertTrue(getattr(store, 'find'))
 
         yield transaction()
+
+    @inlineCallbacks
+    def test_transact_ro(self):
+        yield self._transact_with_success()
+
+        count = yield self._transact_ro_count_receivers()
+        self.assertEqual(count, 1)
+
+    @inlineCallbacks
+    def test_transact_ro_with_write(self):
+        yield self.assertFailure(self._transact_ro_with_write(), Exception)
+
+        count = yield self._transact_ro_count_receivers()
+        self.assertEqual(count, 0)
+
+    @inlineCallbacks
+    def test_store_pool_reuse(self):
+        yield self._transact_with_success()
+
+        stats = store_pool.get_stats()
+
+        yield self._transact_with_success()
+        yield self.assertFailure(self._transact_with_exception(), Exception)
+
+        self.assertEqual(store_pool.get_stats()['opened'], stats['opened'])
+        self.assertEqual(store_pool.get_stats()['reused'], stats['reused'] + 2)
+
+        # the store released after the failure must not carry any change
+        count = yield self._transact_ro_count_receivers()
+        self.assertEqual(count, 2)
+
+    @inlineCallbacks
+    def test_store_pool_invalidate(self):
+        yield self._transact_with_success()
+
+        stats = store_pool.get_stats()
+
+        store_pool.invalidate()
+
+        yield self._transact_with_success()
+
+        self.assertEqual(store_pool.get_stats()['opened'], stats['opened'] + 1)
@@ -7,7 +7,7 @@ import scrypt
 from globaleaks.rest import errors
 from globaleaks.security import generateRandomSalt, hash_password, check_password, change_password, \
     directory_traversal_check, GLSecureTemporaryFile, GLSecureFile, \
-    GLBPGP
+    GLBPGP, GLBPGPKeyring
 from globaleaks.settings import GLSettings
 from globaleaks.tests import helpers
 
@@ -87,6 +87,21 @@ class TestGLSecureFiles(helpers.TestGL):
         a.close()
         self.assertFalse(os.path.exists(a.filepath))
 
+    def test_temporary_file_write_at(self):
+        for counter_nonce in [None, '\xff' * 16]:
+            a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+            if counter_nonce is not None:
+                # the counter of the last blocks wraps around
+                a.key_counter_nonce = counter_nonce
+                a.initialize_cipher()
+
+            antani = os.urandom(100000)
+            for offset in [59997, 0, 79996, 39998, 19999]:
+                a.write_at(offset, antani[offset:offset + 25000])
+
+            self.assertTrue(antani == a.read())
+            a.close()
+
     def test_temporary_file_write_after_read(self):
         a = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
         antani = "0123456789" * 10000
@@ -175,3 +190,48 @@ class TestPGP(helpers.TestGL):
                          datetime.utcfromtimestamp(1391012793))
 
         pgpobj.destroy_environment()
+
+    def test_keyring(self):
+        keyring = GLBPGPKeyring()
+
+        fingerprint = u'ECAF2235E78E71CD95365843C7B190543CAA7585'
+
+        # the private key is loaded in order to be able to decrypt
+        gpob = keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'], fingerprint)
+
+        # the key is imported once and then reused
+        gpob.load_key = None
+        encrypted_body = keyring.encrypt_message(helpers.PGPKEYS['VALID_PGP_KEY1_PRV'],
+                                                 fingerprint,
+                                                 self.secret_content)
+
+        self.assertEqual(str(gpob.gnupg.decrypt(encrypted_body)), self.secret_content)
+
+
+    def test_keyring_invalidate(self):
+        keyring = GLBPGPKeyring()
+
+        fingerprint = u'ECAF2235E78E71CD95365843C7B190543CAA7585'
+
+        gpob = keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], fingerprint)
+        self.assertEqual(len(gpob.gnupg.list_keys()), 1)
+
+        # the keys used by a running encryption are removed at its end
+        keyring._acquire([(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], fingerprint)])
+        keyring.invalidate(fingerprint)
+        self.assertEqual(len(gpob.gnupg.list_keys()), 1)
+
+        keyring._release()
+        self.assertFalse(fingerprint in keyring.keys)
+        self.assertEqual(len(gpob.gnupg.list_keys()), 0)
+
+        # the stale keys used again are imported again
+        keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], fingerprint)
+        keyring.invalidate(fingerprint)
+        keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY1_PUB'], fingerprint)
+        self.assertTrue(fingerprint in keyring.keys)
+        self.assertEqual(len(gpob.gnupg.list_keys()), 1)
+
+        keyring.invalidate(fingerprint)
+        keyring.load_key(helpers.PGPKEYS['VALID_PGP_KEY2_PUB'], u'CECDC5D2B721900E65639268846C82DB1F9B45E2')
+        self.assertFalse(fingerprint in keyring.keys)
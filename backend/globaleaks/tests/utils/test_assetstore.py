@@ -0,0 +1,66 @@
+import os
+
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils.assetstore import AssetStore
+
+
+class TestAssetStore(helpers.TestGL):
+    def write_file(self, filename, data):
+        path = os.path.join(GLSettings.static_path, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return path
+
+    def test_get(self):
+        css_path = self.write_file('custom.css', 'body { color: red; }\n' * 100)
+        js_path = self.write_file('scripts.0123456789abcdef.js', 'var x = 1;')
+        png_path = self.write_file('picture.png', os.urandom(1024))
+
+        store = AssetStore(GLSettings.static_path)
+
+        css = store.get(css_path)
+        self.assertEqual(css.mime_type, 'text/css')
+        self.assertTrue(len(css.gzip_body) < len(css.body))
+        self.assertFalse(css.immutable)
+
+        # the files uploaded by the admin are never immutable
+        self.assertFalse(store.get(js_path).immutable)
+
+        # binary files are not compressed
+        self.assertEqual(store.get(png_path).gzip_body, None)
+
+        self.assertEqual(store.get(os.path.join(GLSettings.static_path, 'unexistent')), None)
+
+    def test_hashed_names(self):
+        js_path = self.write_file('scripts.0123456789abcdef.js', 'var x = 1;')
+        css_path = self.write_file('custom.css', 'body { color: red; }')
+
+        store = AssetStore(GLSettings.static_path, True)
+
+        # the assets of the client named after the hash of their content are immutable
+        self.assertTrue(store.get(js_path).immutable)
+        self.assertFalse(store.get(css_path).immutable)
+
+    def test_update(self):
+        path = self.write_file('custom.css', 'body { color: red; }')
+
+        store = AssetStore(GLSettings.static_path)
+        etag = store.get(path).etag
+
+        self.write_file('custom.css', 'body { color: blue; }')
+        self.assertEqual(store.get(path).etag, etag)
+
+        store.update(path)
+        self.assertNotEqual(store.get(path).etag, etag)
+
+        os.remove(path)
+        store.update(path)
+        self.assertEqual(store.get(path), None)
+
+    def test_size_limit(self):
+        path = self.write_file('big.css', 'x' * (GLSettings.asset_size_limit + 1))
+
+        store = AssetStore(GLSettings.static_path)
+        self.assertEqual(store.get(path), None)
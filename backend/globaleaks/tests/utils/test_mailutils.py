@@ -0,0 +1,89 @@
+from twisted.internet import defer
+from twisted.internet.defer import inlineCallbacks
+from twisted.mail.smtp import SMTPConnectError, SMTPDeliveryError
+
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils.mailutils import MailSpooler
+
+
+class FakeMailSpooler(MailSpooler):
+    """
+    Spooler emulating the SMTP sessions: every session delivers its mails
+    until failing_address is found or fails immediately if unreachable
+    """
+    unreachable = False
+    failing_address = None
+
+    def connect(self, factory):
+        self.connections = getattr(self, 'connections', 0) + 1
+
+        if self.unreachable:
+            return defer.fail(SMTPConnectError(-1, "Unable to connect to server."))
+
+        while factory.next_mail():
+            if factory.current['address'] == self.failing_address:
+                factory.session_failed(SMTPConnectError(-1, "Connection lost"))
+                break
+
+            if factory.current['address'] == u'rejected@localhost':
+                factory.mail_done(SMTPDeliveryError(550, 'No such user'))
+            else:
+                factory.mail_done(None)
+
+        return defer.succeed(None)
+
+
+def get_mails(n):
+    return [{
+        'id': unicode(i),
+        'address': u'receiver%d@localhost' % i,
+        'subject': u'subject',
+        'body': u'body'
+    } for i in range(n)]
+
+
+class TestMailSpooler(helpers.TestGL):
+    @inlineCallbacks
+    def test_spool(self):
+        spooler = FakeMailSpooler(get_mails(120))
+        results = yield spooler.spool()
+
+        self.assertEqual(len(results), 120)
+        self.assertTrue(all(error is None for error in results.values()))
+
+        # the mails are delivered reusing every session for multiple mails
+        self.assertEqual(spooler.connections, 120 / GLSettings.mail_session_limit + 1)
+
+    @inlineCallbacks
+    def test_spool_delivery_failure(self):
+        mails = get_mails(3)
+        mails[1]['address'] = u'rejected@localhost'
+
+        results = yield FakeMailSpooler(mails).spool()
+
+        self.assertEqual(results[u'0'], None)
+        self.assertTrue(isinstance(results[u'1'], SMTPDeliveryError))
+        self.assertEqual(results[u'2'], None)
+
+    @inlineCallbacks
+    def test_spool_session_failure(self):
+        spooler = FakeMailSpooler(get_mails(10))
+        spooler.failing_address = u'receiver5@localhost'
+        results = yield spooler.spool()
+
+        # the mails following the failure are sent with a new session
+        self.assertTrue(isinstance(results[u'5'], SMTPConnectError))
+        for i in range(10):
+            if i != 5:
+                self.assertEqual(results[unicode(i)], None)
+
+    @inlineCallbacks
+    def test_spool_unreachable_server(self):
+        spooler = FakeMailSpooler(get_mails(10))
+        spooler.unreachable = True
+        results = yield spooler.spool()
+
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(isinstance(error, SMTPConnectError) for error in results.values()))
+        self.assertEqual(spooler.connections, GLSettings.mail_sessions)
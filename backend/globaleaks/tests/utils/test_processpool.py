@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+
+from twisted.internet.defer import inlineCallbacks, TimeoutError
+from twisted.trial import unittest
+
+from globaleaks import security
+from globaleaks.rest import errors
+from globaleaks.tests import helpers
+from globaleaks.utils.processpool import ProcessPool
+
+
+class TestProcessPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = ProcessPool()
+        self.pool.start(2, 2)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    @inlineCallbacks
+    def test_run(self):
+        hashed = yield self.pool.run(security.hash_password,
+                                     helpers.VALID_PASSWORD1,
+                                     helpers.VALID_SALT1)
+
+        self.assertEqual(hashed, helpers.VALID_HASH1)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 0)
+
+    @inlineCallbacks
+    def test_run_with_exception(self):
+        yield self.assertFailure(self.pool.run(security.change_password,
+                                               helpers.VALID_HASH1,
+                                               helpers.INVALID_PASSWORD,
+                                               helpers.VALID_PASSWORD1,
+                                               helpers.VALID_SALT1),
+                                 errors.InvalidOldPassword)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 1)
+
+    @inlineCallbacks
+    def test_run_with_unpicklable_arguments(self):
+        yield self.assertFailure(self.pool.run(security.hash_password,
+                                               lambda: helpers.VALID_PASSWORD1,
+                                               helpers.VALID_SALT1),
+                                 pickle.PicklingError)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['queued'], 0)
+
+    @inlineCallbacks
+    def test_run_with_worker_death(self):
+        yield self.assertFailure(self.pool.run(os._exit, 1), TimeoutError)
+
+        stats = self.pool.get_stats()
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['failed'], 1)
+
+        # the pool replaces the worker died
+        hashed = yield self.pool.run(security.hash_password,
+                                     helpers.VALID_PASSWORD1,
+                                     helpers.VALID_SALT1)
+
+        self.assertEqual(hashed, helpers.VALID_HASH1)
@@ -5,7 +5,7 @@ from twisted.internet.defer import inlineCallbacks
 from globaleaks.handlers import admin, rtip
 from globaleaks.jobs.delivery_sched import DeliverySchedule
 from globaleaks.tests import helpers
-from globaleaks.utils.templating import Templating, supported_template_types
+from globaleaks.utils.templating import Templating, supported_template_types, template_cache
 
 
 class notifTemplateTest(helpers.TestGLWithPopulatedDB):
@@ -38,3 +38,31 @@ class notifTemplateTest(helpers.TestGLWithPopulatedDB):
             data['type'] = key
             template = ''.join(supported_template_types[key].keyword_list)
             ret = Templating().format_template(template, data)
+
+        # the templates are compiled only once
+        template_cache.invalidate()
+        for i in range(3):
+            Templating().format_template(template, data)
+
+        self.assertEqual(len(template_cache), 1)
+
+
+class TestCompiledTemplate(helpers.TestGL):
+    data = {
+        'type': 'admin_pgp_alert',
+        'node': {
+            'name': u'%PublicSite%',
+            'public_site': u'https://example.org',
+            'hidden_service': u''
+        },
+        'notification': {},
+        'users': []
+    }
+
+    def test_nested_keywords(self):
+        ret = Templating().format_template(u'%NodeName% %NodeName% %Unknown%\n%Blank%\nend', self.data)
+        self.assertEqual(ret, u'https://example.org https://example.org %Unknown%\nend')
+
+    def test_template_without_keywords(self):
+        ret = Templating().format_template(u'text\n%Blank%\nend', self.data)
+        self.assertEqual(ret, u'text\nend')
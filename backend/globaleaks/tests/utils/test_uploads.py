@@ -0,0 +1,97 @@
+import os
+
+from globaleaks.rest import errors
+from globaleaks.settings import GLSettings
+from globaleaks.tests import helpers
+from globaleaks.utils.uploads import UploadSession, UploadSessionList
+
+
+class TestUploadSession(helpers.TestGL):
+    def setUp(self):
+        UploadSessionList.clear()
+        return helpers.TestGL.setUp(self)
+
+    def test_write_chunks_out_of_order(self):
+        data = os.urandom(1000)
+        chunks = [data[i:i + 300] for i in range(0, 1000, 300)]
+
+        session = UploadSession(len(data), len(chunks), 300)
+
+        for number in [3, 1, 4]:
+            session.write_chunk(number, chunks[number - 1])
+
+        self.assertFalse(session.is_complete())
+        self.assertEqual(session.get_missing_chunks(), [[2, 2]])
+
+        # the retransmissions of the chunks already received are ignored
+        session.write_chunk(3, chunks[2])
+        self.assertEqual(session.received_chunks, 3)
+
+        session.write_chunk(2, chunks[1])
+        self.assertTrue(session.is_complete())
+        self.assertEqual(session.get_missing_chunks(), [])
+        self.assertEqual(session.file.read(), data)
+
+        session.close()
+
+    def test_missing_chunks_ranges(self):
+        session = UploadSession(1000, 10, 100)
+
+        for number in [1, 4, 5, 10]:
+            session.write_chunk(number, 'x' * 100)
+
+        self.assertEqual(session.get_missing_chunks(), [[2, 3], [6, 9]])
+
+        session.close()
+
+    def test_invalid_chunks(self):
+        self.assertRaises(errors.InvalidInputFormat, UploadSession, 1000, 5, 300)
+        self.assertRaises(errors.InvalidInputFormat, UploadSession, 1000, 2, 0)
+
+        # the uploads split in too many chunks are refused
+        self.assertRaises(errors.InvalidInputFormat, UploadSession, 1025, 1025, 1)
+
+        session = UploadSession(1000, 3, 300)
+        self.assertRaises(errors.InvalidInputFormat, session.write_chunk, 0, 'x' * 300)
+        self.assertRaises(errors.InvalidInputFormat, session.write_chunk, 4, 'x' * 300)
+        self.assertRaises(errors.InvalidInputFormat, session.write_chunk, 1, 'x' * 299)
+
+        # the last chunk ends the file
+        self.assertRaises(errors.InvalidInputFormat, session.write_chunk, 3, 'x' * 300)
+        session.write_chunk(3, 'x' * 400)
+
+        session.close()
+
+    def test_sessions_limit(self):
+        for i in range(GLSettings.upload_sessions_limit):
+            UploadSessionList.set('owner:%d' % i, UploadSession(1000, 4, 300))
+
+        self.assertRaises(errors.InvalidInputFormat,
+                          UploadSessionList.set, 'owner:x', UploadSession(1000, 4, 300))
+
+        # the limit applies to every owner separately
+        UploadSessionList.set('other:0', UploadSession(1000, 4, 300))
+
+        UploadSessionList.delete('owner:0')
+        UploadSessionList.set('owner:x', UploadSession(1000, 4, 300))
+
+        self.test_reactor.advance(UploadSessionList.get_timeout())
+        self.assertEqual(UploadSessionList.owners, {})
+
+    def test_expiration(self):
+        session = UploadSession(1000, 4, 300)
+        session.write_chunk(1, 'x' * 300)
+        UploadSessionList.set('id', session)
+
+        self.test_reactor.advance(UploadSessionList.get_timeout() - 1)
+
+        # the sessions receiving chunks are kept alive
+        self.assertEqual(UploadSessionList.get('id'), session)
+
+        self.test_reactor.advance(UploadSessionList.get_timeout() - 1)
+        self.assertTrue(os.path.exists(session.file.filepath))
+
+        self.test_reactor.advance(1)
+        self.assertEqual(UploadSessionList.get('id'), None)
+        self.assertFalse(os.path.exists(session.file.filepath))
+        self.assertFalse(os.path.exists(session.file.keypath))
@@ -7,7 +7,7 @@ from twisted.internet.defer import inlineCallbacks
 from zipfile import ZipFile
 
 from globaleaks.tests import helpers
-from globaleaks.utils.zipstream import ZipStream
+from globaleaks.utils.zipstream import ZipStream, ZIP_STORED
 
 class TestZipStream(helpers.TestGL):
     @inlineCallbacks
@@ -35,6 +35,25 @@ class TestZipStream(helpers.TestGL):
             self.assertTrue(len(infolist), 2)
             for ff in infolist:
                 if ff.filename == self.unicode_seq:
-                    self.assertTrue(ff.file_size == len(self.unicode_seq))
+                    self.assertTrue(ff.file_size == len(self.unicode_seq.encode('utf-8')))
                 else:
                     self.assertTrue(ff.file_size == os.stat(os.path.abspath(__file__)).st_size)
+
+    def test_zipstream_deterministic(self):
+        for f in self.files:
+            if 'path' in f:
+                f['compression'] = ZIP_STORED
+
+        date_time = (2016, 6, 1, 10, 0, 0)
+
+        data = ''.join(ZipStream(self.files, date_time=date_time))
+
+        with ZipFile(StringIO.StringIO(data), 'r') as f:
+            self.assertIsNone(f.testzip())
+
+        zip_stream = ZipStream(self.files, date_time=date_time)
+        self.assertEqual(zip_stream.size(), len(data))
+
+        for start, end in [(0, len(data) - 1), (1, 100), (100, len(data) - 1), (len(data) - 1, len(data) - 1)]:
+            zip_stream = ZipStream(self.files, date_time=date_time)
+            self.assertEqual(''.join(zip_stream.iter_range(start, end)), data[start:end + 1])
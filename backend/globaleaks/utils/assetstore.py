@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+#   assetstore
+#   **********
+#
+# In memory copy of the static files served by the backend (the client
+# build and the files uploaded by the admin) kept together with their
+# gzip variant and the validators used to answer conditional requests.
+
+import datetime
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from StringIO import StringIO
+
+from globaleaks.settings import GLSettings
+from globaleaks.utils.utility import log
+
+# the files of the client build whose name includes the hash of their
+# content never change
+hashed_asset_regexp = re.compile(r'[.\-][0-9a-f]{8,}\.[a-zA-Z0-9]+$')
+
+compressible_mime_types = [
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml'
+]
+
+
+def is_compressible(mime_type):
+    return mime_type is not None and \
+           (mime_type.startswith('text/') or mime_type in compressible_mime_types)
+
+
+class Asset(object):
+    def __init__(self, path, hashed_names=False):
+        """
+        @param hashed_names: True if the files named after the hash of
+                             their content are never changed
+        """
+        self.path = path
+        self.mime_type, _ = mimetypes.guess_type(path)
+
+        with open(path, 'rb') as f:
+            self.body = f.read()
+
+        self.gzip_body = None
+        if is_compressible(self.mime_type):
+            gzip_body = StringIO()
+            with gzip.GzipFile(mode='wb', fileobj=gzip_body, mtime=0) as f:
+                f.write(self.body)
+
+            if gzip_body.tell() < len(self.body):
+                self.gzip_body = gzip_body.getvalue()
+
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()
+        self.gzip_etag = self.etag[:-1] + '-gzip"'
+
+        # the precision of the HTTP dates is limited to the second
+        self.last_modified = datetime.datetime.utcfromtimestamp(int(os.path.getmtime(path)))
+
+        self.immutable = hashed_names and hashed_asset_regexp.search(os.path.basename(path)) is not None
+
+
+class AssetStore(object):
+    """
+    Assets of a directory indexed by their absolute path; the files bigger
+    than GLSettings.asset_size_limit are not kept in memory.
+
+    Only the client build may name its files after the hash of their
+    content; the names of the files uploaded by the admin are arbitrary
+    and these files are thus never immutable.
+    """
+    def __init__(self, root, hashed_names=False):
+        self.root = os.path.abspath(root)
+        self.hashed_names = hashed_names
+        self.lock = threading.Lock()
+        self.assets = None
+
+    def load(self):
+        assets = {}
+
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getsize(path) <= GLSettings.asset_size_limit:
+                        assets[path] = Asset(path, self.hashed_names)
+                except (IOError, OSError) as excep:
+                    log.err("Unable to load the asset %s: %s" % (path, excep))
+
+        with self.lock:
+            self.assets = assets
+
+    def update(self, path):
+        """
+        Reload the asset at the specified path after a change of the file
+        """
+        path = os.path.abspath(path)
+
+        asset = None
+        if os.path.isfile(path) and os.path.getsize(path) <= GLSettings.asset_size_limit:
+            asset = Asset(path, self.hashed_names)
+
+        with self.lock:
+            if self.assets is None:
+                return
+
+            if asset is not None:
+                self.assets[path] = asset
+            else:
+                self.assets.pop(path, None)
+
+    def get(self, path):
+        if self.assets is None:
+            self.load()
+
+        with self.lock:
+            return self.assets.get(path)
+
+
+asset_stores = {}
+
+
+def get_asset_store(root):
+    root = os.path.abspath(root)
+
+    if root not in asset_stores:
+        asset_stores[root] = AssetStore(root, root == os.path.abspath(GLSettings.client_path))
+
+    return asset_stores[root]
+
+
+def load_asset_stores():
+    for root in [GLSettings.client_path, GLSettings.static_path]:
+        get_asset_store(root).load()
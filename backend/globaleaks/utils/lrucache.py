@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+#   lrucache
+#   ********
+#
+# Bounded thread safe cache evicting the least recently used entries.
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            # reinserting the key marks it as the most recently used
+            self.data[key] = value
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Remove the specified key or, if not specified, all the keys
+        """
+        with self.lock:
+            if key is None:
+                self.data.clear()
+            else:
+                self.data.pop(key, None)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data
+
+    def __len__(self):
+        with self.lock:
+            return len(self.data)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'entries': len(self.data),
+                'hits': self.hits,
+                'misses': self.misses
+            }
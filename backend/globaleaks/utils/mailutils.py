@@ -6,6 +6,7 @@
 # GlobaLeaks Utility used to handle Mail, format, exception, etc
 
 import StringIO
+import collections
 import re
 import sys
 import traceback
@@ -20,13 +21,14 @@ from email.mime.text import MIMEText
 from twisted.internet import reactor, defer
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet.ssl import ClientContextFactory
-from twisted.mail.smtp import ESMTPSenderFactory, SMTPError
+from twisted.mail.smtp import ESMTPSender, ESMTPSenderFactory, SMTPClient, \
+    SMTPConnectError, SMTPDeliveryError, SMTPError, SUCCESS
 from twisted.protocols import tls
 from twisted.python.failure import Failure
 from txsocksx.client import SOCKS5ClientEndpoint
 
 from globaleaks import __version__
-from globaleaks.security import GLBPGP, sha256
+from globaleaks.security import GLKeyring, sha256
 from globaleaks.settings import GLSettings
 from globaleaks.utils.utility import log
 
@@ -127,20 +129,11 @@ def sendmail(to_address, subject, body):
             retries=0,
             timeout=GLSettings.mail_timeout)
 
-        if security == "SSL":
-            factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
-
         if GLSettings.testing:
             #  Hooking the test down to here is a trick to be able to test all the above code :)
             return defer.succeed(None)
 
-        if not GLSettings.disable_mail_torification:
-            socksProxy = TCP4ClientEndpoint(reactor, GLSettings.socks_host, GLSettings.socks_port, timeout=GLSettings.mail_timeout)
-            endpoint = SOCKS5ClientEndpoint(smtp_host.encode('utf-8'), smtp_port, socksProxy)
-        else:
-            endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=GLSettings.mail_timeout)
-
-        d = endpoint.connect(factory)
+        d = smtp_connect(factory, context_factory)
         d.addErrback(errback)
 
         return result_deferred
@@ -151,6 +144,240 @@ def sendmail(to_address, subject, body):
         return defer.fail()
 
 
+def smtp_connect(factory, context_factory):
+    """
+    Connect the factory to the configured SMTP server (SMTPS or SMTP+TLS)
+    torifying the connection if not disabled
+
+    @return: the deferred of the connection
+    """
+    smtp_host = GLSettings.memory_copy.notif.server
+    smtp_port = GLSettings.memory_copy.notif.port
+
+    if GLSettings.memory_copy.notif.security == "SSL":
+        factory = tls.TLSMemoryBIOFactory(context_factory, True, factory)
+
+    if not GLSettings.disable_mail_torification:
+        socksProxy = TCP4ClientEndpoint(reactor, GLSettings.socks_host, GLSettings.socks_port, timeout=GLSettings.mail_timeout)
+        endpoint = SOCKS5ClientEndpoint(smtp_host.encode('utf-8'), smtp_port, socksProxy)
+    else:
+        endpoint = TCP4ClientEndpoint(reactor, smtp_host.encode('utf-8'), smtp_port, timeout=GLSettings.mail_timeout)
+
+    return endpoint.connect(factory)
+
+
+class MailSessionSender(ESMTPSender):
+    """
+    ESMTP client sending over the same authenticated connection all the
+    mails provided by its factory; after every mail the SMTP transaction
+    is reset and the next mail is requested.
+    """
+    def getMailFrom(self):
+        if not self.factory.next_mail():
+            return None
+
+        return str(self.factory.fromEmail)
+
+    def getMailTo(self):
+        return [self.factory.current['address']]
+
+    def getMailData(self):
+        return self.factory.current_message
+
+    def sentMail(self, code, resp, numOk, addresses, log):
+        if code in SUCCESS:
+            self.factory.mail_done(None)
+        else:
+            self.factory.mail_done(SMTPDeliveryError(code, resp, log.str(), addresses))
+
+    def sendError(self, exc):
+        SMTPClient.sendError(self, exc)
+        self.factory.session_failed(exc)
+
+    def connectionLost(self, reason):
+        ESMTPSender.connectionLost(self, reason)
+        self.factory.session_failed(SMTPConnectError(-1, "Connection lost: %s" % reason.value))
+
+
+class MailSessionFactory(ESMTPSenderFactory):
+    """
+    Factory of a SMTP session sending the mails of a MailSpooler.
+
+    The deferred is fired with the number of mails sent when the session
+    gets closed or with the error that caused the session to fail.
+    """
+    protocol = MailSessionSender
+
+    def __init__(self, spooler, deferred, context_factory):
+        self.spooler = spooler
+        self.current = None
+        self.current_message = None
+        self.sent = 0
+
+        ESMTPSenderFactory.__init__(self,
+                                    GLSettings.memory_copy.notif.username.encode('utf-8'),
+                                    GLSettings.memory_copy.private.smtp_password.encode('utf-8'),
+                                    GLSettings.memory_copy.notif.source_email,
+                                    [],
+                                    None,
+                                    deferred,
+                                    contextFactory=context_factory,
+                                    requireAuthentication=True,
+                                    requireTransportSecurity=(GLSettings.memory_copy.notif.security != 'SSL'),
+                                    retries=0,
+                                    timeout=GLSettings.mail_timeout)
+
+    def next_mail(self):
+        """
+        Pick the next mail to be sent in the session
+
+        @return: True if a mail is available, False if the session can be closed
+        """
+        self.current = None
+
+        if self.sent < GLSettings.mail_session_limit:
+            self.current = self.spooler.pop_mail()
+
+        if self.current is None:
+            self.sendFinished = True
+            self.result.callback(self.sent)
+            return False
+
+        self.current_message = MIME_mail_build(GLSettings.memory_copy.notif.source_name,
+                                               GLSettings.memory_copy.notif.source_email,
+                                               self.current['address'],
+                                               self.current['address'],
+                                               self.current['subject'],
+                                               self.current['body'])
+
+        log.debug('Sending email to %s using SMTP server [%s:%d] [%s]' %
+                  (self.current['address'],
+                   GLSettings.memory_copy.notif.server,
+                   GLSettings.memory_copy.notif.port,
+                   GLSettings.memory_copy.notif.security))
+
+        return True
+
+    def mail_done(self, error):
+        mail, self.current = self.current, None
+
+        if error is None:
+            self.sent += 1
+
+        self.spooler.mail_done(mail, error)
+
+    def session_failed(self, error):
+        if self.current is not None:
+            self.mail_done(error)
+
+        if not self.sendFinished:
+            self.sendFinished = True
+            self.result.errback(error)
+
+    def clientConnectionFailed(self, connector, err):
+        self.session_failed(err.value)
+
+    def clientConnectionLost(self, connector, err):
+        self.session_failed(err.value)
+
+
+class MailSpooler(object):
+    """
+    Send a batch of mails using up to GLSettings.mail_sessions parallel SMTP
+    sessions, each one reusing its authenticated connection for up to
+    GLSettings.mail_session_limit mails.
+
+    The deferred returned by spool() is fired with a dictionary mapping the
+    id of every mail to None, if the mail has been sent, or to the error
+    that caused its failure.
+    """
+    def __init__(self, mails):
+        self.queue = collections.deque(mails)
+        self.results = {}
+        self.sessions = 0
+        self.error = SMTPConnectError(-1, "Unable to connect to server.")
+        self.context_factory = GLClientContextFactory()
+        self.deferred = defer.Deferred()
+
+    def pop_mail(self):
+        while self.queue:
+            mail = self.queue.popleft()
+            if mail['address'] != "":
+                return mail
+
+            self.results[mail['id']] = None
+
+    def mail_done(self, mail, error):
+        if error is not None:
+            log.err("Unable to send email to %s (Exception: %s)" % (mail['address'], error))
+
+        self.results[mail['id']] = error
+
+    def connect(self, factory):
+        if GLSettings.testing:
+            # emulate a successful SMTP session
+            while factory.next_mail():
+                factory.mail_done(None)
+
+            return defer.succeed(None)
+
+        return smtp_connect(factory, self.context_factory)
+
+    def open_session(self):
+        self.sessions += 1
+
+        d = defer.Deferred()
+        factory = MailSessionFactory(self, d, self.context_factory)
+        d.addBoth(self.session_closed, factory)
+
+        self.connect(factory).addErrback(lambda failure: factory.session_failed(failure.value))
+
+    def session_closed(self, result, factory):
+        self.sessions -= 1
+
+        if isinstance(result, Failure):
+            log.err("SMTP session failed after %d emails (Exception: %s)" % (factory.sent, result.value))
+            self.error = result.value
+
+        if self.queue and factory.sent:
+            # the session reached the limit of mails or failed after some
+            # successful delivery; the remaining mails get a new session
+            self.open_session()
+
+        self.check_completion()
+
+    def check_completion(self):
+        if self.sessions or self.deferred.called:
+            return
+
+        # the mails remaining after the failure of all the sessions
+        # (e.g. the server is unreachable) are marked as failed
+        while self.queue:
+            self.mail_done(self.queue.popleft(), self.error)
+
+        self.deferred.callback(self.results)
+
+    def spool(self):
+        if GLSettings.disable_mail_notification:
+            return defer.succeed({mail['id']: None for mail in self.queue})
+
+        # the sessions may complete synchronously; the counter is kept
+        # above zero until all the sessions have been opened
+        self.sessions += 1
+
+        for _ in range(GLSettings.mail_sessions):
+            if not self.queue:
+                break
+
+            self.open_session()
+
+        self.sessions -= 1
+
+        self.check_completion()
+
+        return self.deferred
+
+
 def MIME_mail_build(src_name, src_mail, dest_name, dest_mail, title, mail_body):
     # Override python's weird assumption that utf-8 text should be encoded with
     # base64, and instead use quoted-printable (for both subject and body).  I
@@ -260,10 +487,10 @@ def send_exception_email(mail_body):
 
         # If the receiver has encryption enabled (for notification), encrypt the mail body
         if len(GLSettings.memory_copy.notif.exception_email_pgp_key_public):
-            gpob = GLBPGP()
             try:
-                gpob.load_key(GLSettings.memory_copy.notif.exception_email_pgp_key_public)
-                mail_body = gpob.encrypt_message(GLSettings.memory_copy.notif.exception_email_pgp_key_fingerprint, mail_body)
+                mail_body = GLKeyring.encrypt_message(GLSettings.memory_copy.notif.exception_email_pgp_key_public,
+                                                      GLSettings.memory_copy.notif.exception_email_pgp_key_fingerprint,
+                                                      mail_body)
             except Exception as excep:
                 # If exception emails are configured to be subject to encryption an the key
                 # expires the only thing to do is to disable the email.
@@ -271,10 +498,6 @@ def send_exception_email(mail_body):
                 #       this could be done simply here replacing the email subject and body.
                 log.err("Error while encrypting exception email: %s" % str(excep))
                 return None
-            finally:
-                # the finally statement is always called also if
-                # except contains a return or a raise
-                gpob.destroy_environment()
 
         # avoid to wait for the notification to happen  but rely on  background completion
         sendmail(GLSettings.memory_copy.notif.exception_email_address, mail_subject,  mail_body)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+#   processpool
+#   ***********
+#
+# Bounded pool of worker processes used to execute CPU intensive functions
+# (e.g. scrypt) on multiple cores without being limited by the GIL.
+#
+# The functions submitted to the pool and their arguments need to be
+# picklable (i.e. module level functions and plain values).
+#
+# The pool of python 2.7 never completes the tasks of a worker that died;
+# the tasks are thus failed after a timeout.
+
+import multiprocessing
+import pickle
+import signal
+import threading
+import time
+
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
+
+
+def _worker_init():
+    # the workers are managed (and terminated) by the parent process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _worker_execute(function, args, kwargs):
+    """
+    Executed inside the worker process.
+
+    Exceptions are returned instead of raised given that the
+    apply_async of python 2.7 does not support an error callback.
+    """
+    try:
+        return True, function(*args, **kwargs)
+    except Exception as excep:
+        try:
+            pickle.dumps(excep)
+        except Exception:
+            excep = Exception(repr(excep))
+
+        return False, excep
+
+
+class ProcessPool(object):
+    def __init__(self):
+        self.pool = None
+        self.size = 0
+        self.task_timeout = None
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def start(self, size, task_timeout=None):
+        """
+        @param size: the number of worker processes
+        @param task_timeout: the seconds after which a task not completed
+                             is failed with a defer.TimeoutError
+        """
+        if self.pool is None and size > 0:
+            self.size = size
+            self.task_timeout = task_timeout
+            self.pool = multiprocessing.Pool(size, _worker_init)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def is_running(self):
+        return self.pool is not None
+
+    def _task_done(self, start_time, success):
+        latency = time.time() - start_time
+
+        with self.lock:
+            self.queued -= 1
+            self.completed += 1
+            if not success:
+                self.failed += 1
+
+            self.latency_total += latency
+            if latency > self.latency_max:
+                self.latency_max = latency
+
+    def run(self, function, *args, **kwargs):
+        """
+        Submit the function to the pool; to be called in the reactor thread.
+
+        @return: a deferred fired in the reactor thread with the result
+                 of the function or with the exception it raised
+        """
+        # the pool pickles the tasks in its own thread, where an error
+        # would be lost and the deferred never fired
+        try:
+            pickle.dumps((function, args, kwargs), pickle.HIGHEST_PROTOCOL)
+        except Exception as excep:
+            return defer.fail(excep)
+
+        d = defer.Deferred()
+        start_time = time.time()
+        timeout_call = []
+
+        def done(success, result):
+            # executed in the reactor thread by the first between
+            # the completion of the task and its timeout
+            if d.called:
+                return
+
+            if timeout_call and timeout_call[0].active():
+                timeout_call[0].cancel()
+
+            self._task_done(start_time, success)
+
+            if success:
+                d.callback(result)
+            else:
+                d.errback(result)
+
+        def callback(ret):
+            # executed by the result handler thread of the pool
+            reactor.callFromThread(done, *ret)
+
+        def timeout():
+            done(False, Failure(defer.TimeoutError("Task not completed within %d seconds" % self.task_timeout)))
+
+        with self.lock:
+            self.queued += 1
+
+        self.pool.apply_async(_worker_execute, (function, args, kwargs), callback=callback)
+
+        if self.task_timeout is not None:
+            timeout_call.append(reactor.callLater(self.task_timeout, timeout))
+
+        return d
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'queued': self.queued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'latency_avg': self.latency_total / self.completed if self.completed else 0.0,
+                'latency_max': self.latency_max
+            }
@@ -8,13 +8,13 @@
 # supporter KeyWords are here documented:
 # https://github.com/globaleaks/GlobaLeaks/wiki/Customization-guide#customize-notification
 
-import copy
-
 import collections
+import re
 
 from globaleaks import models
 from globaleaks.rest import errors
 from globaleaks.settings import GLSettings
+from globaleaks.utils.lrucache import LRUCache
 from globaleaks.utils.utility import ISO8601_to_pretty_str, ISO8601_to_day_str, \
     ISO8601_to_datetime, datetime_now, bytes_to_pretty_str
 
@@ -179,9 +179,10 @@ class TipKeyword(NodeKeyword):
     def dump_messages(self, messages):
         ret = ''
         for message in messages:
-            data = copy.deepcopy(self.data)
+            # the templating does not modify the data; a shallow copy is enough
+            data = dict(self.data)
             data['type'] = 'export_message'
-            data['message'] = copy.deepcopy(message)
+            data['message'] = message
             template = 'export_message_whistleblower' if (message['type'] == 'whistleblower') else 'export_message_recipient'
             ret += indent_text('-' * 40) + '\n'
             ret += indent_text(Templating().format_template(self.data['notification'][template], data).encode('utf-8')) + '\n\n'
@@ -389,33 +390,97 @@ supported_template_types = {
 }
 
 
+class CompiledTemplate(object):
+    """
+    Template parsed once in the list of its literal parts alternated
+    to the keywords (the parts at the odd positions)
+    """
+    keyword_regexps = {}
+
+    def __init__(self, raw_template, keyword_list):
+        if keyword_list:
+            self.parts = self.get_keyword_regexp(keyword_list).split(raw_template)
+        else:
+            self.parts = [raw_template]
+
+    @classmethod
+    def get_keyword_regexp(cls, keyword_list):
+        key = tuple(keyword_list)
+
+        if key not in cls.keyword_regexps:
+            cls.keyword_regexps[key] = re.compile('(%s)' % '|'.join(re.escape(kw) for kw in keyword_list))
+
+        return cls.keyword_regexps[key]
+
+    def has_keywords(self):
+        return len(self.parts) > 1
+
+    def render(self, keyword_converter):
+        """
+        Evaluate the keywords present in the template, each one only once
+
+        @return: a tuple (rendered template, True if the values of the
+                 keywords may contain other keywords)
+        """
+        values = {}
+        parts = self.parts[:]
+
+        for i in range(1, len(parts), 2):
+            kw = parts[i]
+            if kw not in values:
+                # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
+                values[kw] = getattr(keyword_converter, kw[1:-1])()
+
+            parts[i] = values[kw]
+
+        return ''.join(parts), any('%' in value for value in values.values())
+
+
+template_cache = LRUCache(GLSettings.template_cache_size)
+
+
+def compile_template(raw_template, template_type):
+    """
+    Return the compiled version of the template, parsing it only on cache miss
+    """
+    key = (raw_template, template_type)
+
+    compiled = template_cache.get(key)
+    if compiled is None:
+        compiled = CompiledTemplate(raw_template, supported_template_types[template_type].keyword_list)
+        template_cache.set(key, compiled)
+
+    return compiled
+
+
+def remove_blank_lines(template):
+    # remobe lines with only %Blank%
+    template = template.replace('\n%Blank%\n', '\n')
+
+    # remove remaining $Blank% tokens
+    return template.replace('\n%Blank%\n', '')
+
+
 class Templating(object):
     def format_template(self, raw_template, data):
         keyword_converter = supported_template_types[data['type']](data)
-        iterations = 3
-        stop = False
-        while stop is False and iterations > 0:
-            iterations -= 1
-            count = 0
 
-            for kw in keyword_converter.keyword_list:
-                if raw_template.count(kw):
-                    # if %SomeKeyword% matches, call keyword_converter.SomeKeyword function
-                    variable_content = getattr(keyword_converter, kw[1:-1])()
-                    raw_template = raw_template.replace(kw, variable_content)
+        compiled = compile_template(raw_template, data['type'])
 
-                    count += 1
+        iterations = 3
+        while iterations > 0:
+            iterations -= 1
 
-            # remobe lines with only %Blank%
-            raw_template = raw_template.replace('\n%Blank%\n', '\n')
+            if compiled is None or not compiled.has_keywords():
+                # finally!
+                return remove_blank_lines(raw_template)
 
-            # remove remaining $Blank% tokens
-            raw_template = raw_template.replace('\n%Blank%\n', '')
+            raw_template, nested = compiled.render(keyword_converter)
+            raw_template = remove_blank_lines(raw_template)
 
-            if count == 0:
-                # finally!
-                stop = True
-                break
+            # the values of the keywords may contain other keywords; their
+            # expansion depends on the data and is thus not cached
+            compiled = CompiledTemplate(raw_template, keyword_converter.keyword_list) if nested else None
 
         return raw_template
 
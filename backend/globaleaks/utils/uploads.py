@@ -0,0 +1,165 @@
+# -*- coding: UTF-8
+#
+# uploads
+#   *******
+#
+#   Implements the sessions of the chunked file uploads performed by flow.js
+#
+#   The chunks are written at their offset in the encrypted temporary file
+#   so that they can be received out of order, in parallel and retransmitted;
+#   the chunks received are tracked in a bitmap in order to report the
+#   missing ones to the clients resuming an upload.
+#
+#   The sessions are identified by the resource and the user performing the
+#   upload followed by the flow.js identifier of the file ("owner:identifier").
+
+from globaleaks.rest import errors
+from globaleaks.security import GLSecureTemporaryFile
+from globaleaks.settings import GLSettings
+from globaleaks.utils.tempdict import TempDict
+
+
+def get_session_owner(key):
+    return key.rsplit(':', 1)[0]
+
+
+class UploadSessionListClass(TempDict):
+    def __init__(self):
+        TempDict.__init__(self)
+
+        # number of the sessions in progress of every owner
+        self.owners = {}
+
+    def get_timeout(self):
+        return GLSettings.upload_session_lifetime
+
+    def expireCallback(self, item):
+        # the temporary file is deleted on close
+        item.close()
+
+    def _release_owner(self, key):
+        owner = get_session_owner(key)
+
+        self.owners[owner] -= 1
+        if not self.owners[owner]:
+            del self.owners[owner]
+
+    def set(self, key, item):
+        owner = get_session_owner(key)
+
+        if self.owners.get(owner, 0) >= GLSettings.upload_sessions_limit:
+            raise errors.InvalidInputFormat("Too many uploads in progress")
+
+        TempDict.set(self, key, item)
+        self.owners[owner] = self.owners.get(owner, 0) + 1
+
+    def _expire(self, key):
+        if key in self:
+            self._release_owner(key)
+
+        TempDict._expire(self, key)
+
+    def delete(self, key):
+        """
+        Remove a completed upload session leaving its file to the caller
+        """
+        if key in self:
+            item = self.pop(key)
+            item.expireCall.cancel() # pylint: disable=no-member
+            self._release_owner(key)
+
+    def clear(self):
+        TempDict.clear(self)
+        self.owners = {}
+
+
+UploadSessionList = UploadSessionListClass()
+
+
+class UploadSession(object):
+    expireCall = None # attached to object by tempDict
+
+    def __init__(self, total_size, total_chunks, chunk_size):
+        """
+        @param total_size: the size of the file
+        @param total_chunks: the number of chunks of the file
+        @param chunk_size: the size of every chunk with the exception of
+                           the last one that ends the file
+        """
+        if total_chunks < 1 or total_size < 0 or (total_chunks > 1 and chunk_size < 1) or \
+           (total_chunks - 1) * chunk_size > total_size:
+            raise errors.InvalidInputFormat("Invalid chunked upload parameters")
+
+        # the small chunks would only be a burden for the node
+        if total_chunks > GLSettings.upload_chunks_limit:
+            raise errors.InvalidInputFormat("Too many chunks")
+
+        self.total_size = total_size
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+
+        self.received = bytearray((total_chunks + 7) // 8)
+        self.received_chunks = 0
+
+        self.file = GLSecureTemporaryFile(GLSettings.tmp_upload_path)
+
+    def has_chunk(self, number):
+        """
+        @param number: the number of the chunk starting from 1
+        @return: True if the chunk has been received
+        """
+        if not 1 <= number <= self.total_chunks:
+            return False
+
+        index = number - 1
+        return bool(self.received[index // 8] & (1 << (index % 8)))
+
+    def write_chunk(self, number, data):
+        """
+        Write a chunk at its offset; the chunks already received are ignored
+        so that the retransmissions performed by the clients are idempotent.
+        """
+        if not 1 <= number <= self.total_chunks:
+            raise errors.InvalidInputFormat("Invalid chunk number")
+
+        offset = (number - 1) * self.chunk_size
+
+        if number < self.total_chunks:
+            valid = len(data) == self.chunk_size
+        else:
+            valid = offset + len(data) == self.total_size
+
+        if not valid:
+            raise errors.InvalidInputFormat("Invalid chunk size")
+
+        if self.has_chunk(number):
+            return
+
+        self.file.write_at(offset, data)
+
+        index = number - 1
+        self.received[index // 8] |= 1 << (index % 8)
+        self.received_chunks += 1
+
+    def get_missing_chunks(self):
+        """
+        @return: the ranges [first, last] of the chunks not yet received
+        """
+        ranges = []
+
+        for number in range(1, self.total_chunks + 1):
+            if self.has_chunk(number):
+                continue
+
+            if ranges and ranges[-1][1] == number - 1:
+                ranges[-1][1] = number
+            else:
+                ranges.append([number, number])
+
+        return ranges
+
+    def is_complete(self):
+        return self.received_chunks == self.total_chunks
+
+    def close(self):
+        self.file.close()
@@ -333,6 +333,21 @@ def ISO8601_to_datetime(isodate):
     return ret
 
 
+def datetime_to_update_token(date):
+    """
+    convert a datetime into the token identifying the state of the data at
+    that time; differently from ISO8601 dates the microseconds are kept
+    """
+    return date.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def update_token_to_datetime(token):
+    """
+    convert an update token into a datetime
+    """
+    return datetime.strptime(token, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
 def datetime_to_pretty_str(date):
     """
     print a datetime in pretty formatted str format
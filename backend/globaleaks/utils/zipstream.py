@@ -200,14 +200,22 @@ class ZipInfo(object):
         return header + filename + extra
 
 class ZipStream(object):
-    def __init__(self, files, compression=ZIP_DEFLATED):
-        if compression == ZIP_STORED:
-            pass
-        elif compression == ZIP_DEFLATED:
-            if not zlib:
-                raise RuntimeError("Compression requires the (missing) zlib module")
-        else:
-            raise RuntimeError("That compression method is not supported")
+    """
+    The files are described by dicts with a 'name' and either a 'path' or a
+    'buf' and may override the compression of the archive with 'compression'.
+
+    Given a date_time the archive is deterministic and may be generated
+    again starting from any offset with iter_range().
+    """
+    def __init__(self, files, compression=ZIP_DEFLATED, date_time=None):
+        for c in [compression] + [f['compression'] for f in files if 'compression' in f]:
+            if c == ZIP_STORED:
+                pass
+            elif c == ZIP_DEFLATED:
+                if not zlib:
+                    raise RuntimeError("Compression requires the (missing) zlib module")
+            else:
+                raise RuntimeError("That compression method is not supported")
 
         self.files = files
         self.compression = compression
@@ -215,25 +223,88 @@ class ZipStream(object):
         self.filelist = []              # List of ZipInfo instances for archive
         self.data_ptr = 0               # Keep track of location inside archive
 
-        self.time = time.gmtime()[0:6]  # Security: Forced Time
+        if date_time is None:
+            date_time = time.gmtime()[0:6]
+
+        self.time = date_time           # Security: Forced Time
 
 
     def __iter__(self):
         for f in self.files:
+            compression = f.get('compression', self.compression)
+
             if 'path' in f:
                 try:
-                    for data in self.zip_file(f['path'], f['name']):
+                    for data in self.zip_file(f['path'], f['name'], compression):
                         yield data
                 except (OSError, IOError):
                     pass
 
             elif 'buf' in f:
-                for data in self.zip_buf(f['buf'], f['name']):
+                for data in self.zip_buf(f['buf'], f['name'], compression):
                     yield data
 
         yield self.archive_footer()
 
 
+    def iter_range(self, start, end):
+        """
+        Generates the bytes of the archive from start to end (included)
+        """
+        offset = 0
+
+        for data in self:
+            next_offset = offset + len(data)
+
+            if next_offset > start:
+                yield data[max(start - offset, 0):end + 1 - offset]
+
+            if next_offset > end:
+                break
+
+            offset = next_offset
+
+
+    def size(self):
+        """
+        Returns the size of the archive computed without generating it or
+        None if it depends on the compression of some file on disk
+        """
+        layout = ZipStream([], self.compression, self.time)
+
+        for f in self.files:
+            compression = f.get('compression', self.compression)
+
+            zinfo = ZipInfo(f['name'], self.time, compression)
+
+            if 'path' in f:
+                if compression != ZIP_STORED:
+                    return None
+
+                try:
+                    zinfo.file_size = zinfo.compress_size = os.path.getsize(f['path'])
+                except (OSError, IOError):
+                    continue
+
+            elif 'buf' in f:
+                buf = f['buf'].encode('utf-8') if isinstance(f['buf'], unicode) else f['buf']
+                zinfo.file_size = zinfo.compress_size = len(buf)
+                if compression == ZIP_DEFLATED:
+                    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+                    zinfo.compress_size = len(cmpr.compress(buf)) + len(cmpr.flush())
+
+            else:
+                continue
+
+            zinfo.header_offset = layout.data_ptr
+            layout.data_ptr += len(zinfo.FileHeader()) + zinfo.compress_size + len(zinfo.DataDescriptor())
+            layout.filelist.append(zinfo)
+
+        layout.archive_footer()
+
+        return layout.data_ptr
+
+
     def update_data_ptr(self, data):
         """
         As data is added to the archive, update a pointer so we can determine
@@ -247,7 +318,7 @@ class ZipStream(object):
         return data
 
 
-    def zip_file(self, filename, arcname):
+    def zip_file(self, filename, arcname, compression):
         """
         Generates data to add the file 'filename' with name 'archname'
 
@@ -260,7 +331,11 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
+        # the file is opened before generating any data so that
+        # missing files are skipped without corrupting the archive
+        fp = open(filename, "rb")
+
+        zinfo = ZipInfo(arcname, self.time, compression)
         zinfo.header_offset = self.data_ptr
         yield self.update_data_ptr(zinfo.FileHeader())
 
@@ -269,7 +344,7 @@ class ZipStream(object):
         else:
             cmpr = None
 
-        with open(filename, "rb") as fp:
+        with fp:
             while 1:
                 buf = fp.read(1024 * 8)
                 if not buf:
@@ -293,7 +368,7 @@ class ZipStream(object):
         self.filelist.append(zinfo)
 
 
-    def zip_buf(self, filebuf, arcname):
+    def zip_buf(self, filebuf, arcname, compression):
         """
         Generates data to add the filebuf 'filebuf' as file with name 'arcname'
 
@@ -306,7 +381,7 @@ class ZipStream(object):
         as described in section V. of the PKZIP Application Note:
         http://www.pkware.com/business_and_developers/developer/appnote/
         """
-        zinfo = ZipInfo(arcname, self.time, self.compression)
+        zinfo = ZipInfo(arcname, self.time, compression)
         zinfo.header_offset = self.data_ptr
 
         yield self.update_data_ptr(zinfo.FileHeader())
@@ -316,14 +391,14 @@ class ZipStream(object):
         else:
             cmpr = None
 
-        zinfo.file_size = len(filebuf)
-        zinfo.CRC = binascii.crc32(filebuf, zinfo.CRC)
-
         if isinstance(filebuf, unicode):
             buf = filebuf.encode('utf-8')
         else:
             buf = filebuf
 
+        zinfo.file_size = len(buf)
+        zinfo.CRC = binascii.crc32(buf, zinfo.CRC)
+
         if cmpr:
             buf = cmpr.compress(buf)
             zinfo.compress_size += len(buf)
@@ -380,7 +380,9 @@ var GLClient = angular.module('GLClient', [
         chunkSize: 1024 * 1024,
         forceChunkSize: true,
         testChunks: false,
-        simultaneousUploads: 1,
+        simultaneousUploads: 3,
+        maxChunkRetries: 5,
+        chunkRetryInterval: 3000,
         generateUniqueIdentifier: function () {
           return Math.random() * 1000000 + 1000000;
         }